@@ -2,27 +2,53 @@
 Flask API for Middleman AI - Chat Recommendation System
 """
 
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, session, redirect, url_for, stream_with_context
 from flask_cors import CORS
 from functools import wraps
-from supabase import create_client,Client
+from supabase import Client
 from typing import Dict, List, Any
+import io
 import os
+import json
+import uuid
 from datetime import datetime
 from dotenv import load_dotenv
-from utils.creator import get_creator_by_id
-from utils.fan import get_fan_by_id
-from utils.system_prompt import get_system_prompt_by_id
-from utils.chats import generate_chat_recommendations
+from postgrest.exceptions import APIError
+from utils.creator import get_creator_by_id, cache_creator, invalidate_creator, creator_cache, list_creators
+from utils.fan import FAN_NAME_COLUMN, get_fan_by_id, cache_fan, invalidate_fan, fan_cache, list_fans
+from utils.system_prompt import get_system_prompt_by_id, cache_system_prompt, invalidate_system_prompt, system_prompt_cache, list_system_prompts
+from utils.chats import generate_chat_recommendations, stream_chat_recommendations, parse_generation_options, recommendation_flight, model_router
+from utils.recommendation_cache import invalidate_conversation, recommendation_cache_stats
+from utils.prompt_template import template_cache
+from utils.context_builder import prefix_stats
+from utils.chat_history import CHAT_HISTORY_MAX_PAGE_SIZE, CHAT_HISTORY_PAGE_SIZE, get_chat_history_page, history_page_fingerprint
+from utils.http_cache import HTTP_CACHE_CONTROL, HTTP_VARY, conditional_body, etag_matches, json_body, response_body_cache, rows_basis
+from utils.listing import LIST_MAX_PAGE_SIZE, LIST_PAGE_SIZE, parse_fields, parse_list_cursor, parse_page_limit
+from utils.speculative import schedule_speculative_recommendations, speculative_executor
+from utils.summaries import schedule_summary_update, summary_cache, summary_executor
+from utils.batch import BATCH_MAX_ITEMS, generate_batch_recommendations
+from utils.ingest import INGEST_BATCH_SIZE, INGEST_FORMATS, ingest_chat_messages
+from utils.write_behind import WRITE_BEHIND, reply_journal
+from utils.openapi import openapi_document
+from utils.compression import COMPRESSION, COMPRESSION_MIN_BYTES, add_vary, compress, compress_stream, is_compressible, negotiate_encoding, weaken_etag
+from utils.static_assets import STATIC_IMMUTABLE_CACHE_CONTROL, StaticAssets
+from utils.http_clients import create_supabase_client, pool_stats, start_warm_up
+from utils.call_policy import REQUEST_DEADLINE_HEADER, parse_deadline, recommendation_policy, summary_policy
 # Load environment variables
 load_dotenv()
 print('Environment:', os.getenv('FLASK_ENV'))
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+supabase: Client = create_supabase_client(supabase_url, supabase_key)
+# Open the Supabase and Mistral connections before the first request needs them
+start_warm_up()
+if WRITE_BEHIND:
+    # Replays replies journaled but not yet inserted before the last shutdown
+    reply_journal.start(supabase)
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 CORS(app)  # Enable CORS for all routes
+static_assets = StaticAssets(app.static_folder)
 
 # Environment variables for authentication
 LOGIN_USERNAME = os.getenv('LOGIN_USERNAME')
@@ -30,6 +56,112 @@ LOGIN_PASSWORD = os.getenv('LOGIN_PASSWORD')
 API_KEY = os.getenv('API_KEY')
 
 
+def conditional_json(payload: Any, basis: str = None) -> Response:
+    """
+    JSON response with a strong ETag, answered with 304 when If-None-Match matches.
+    
+    The payload is serialized once (its hash is the ETag and the same bytes
+    are the body). With a basis, see utils.http_cache.conditional_body.
+    """
+    etag, body = conditional_body(
+        request.headers.get("If-None-Match"),
+        lambda: json_body(payload),
+        basis
+    )
+    if body is not None:
+        response = Response(body, status=200, mimetype="application/json")
+    else:
+        response = Response(status=304)
+        # compress_response weakens the 200's ETag whenever an encoding is
+        # negotiated; the 304 must carry the same tag
+        if COMPRESSION and negotiate_encoding(request.headers.get("Accept-Encoding")):
+            etag = weaken_etag(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HTTP_CACHE_CONTROL
+    response.headers["Vary"] = add_vary(HTTP_VARY, "Accept-Encoding")
+    return response
+
+
+@app.template_global()
+def static_url(filename: str) -> str:
+    """URL of a static file with its content fingerprint, so it can be cached for good"""
+    fingerprint = static_assets.fingerprint(filename)
+    if fingerprint is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=fingerprint)
+
+
+def finalize_static_response(response: Response) -> Response:
+    """
+    Long-lived caching and pre-compressed bodies for fingerprinted static URLs.
+
+    Only a URL whose v= matches the file's current fingerprint is marked
+    immutable; a stale or missing v keeps Flask's revalidation headers.
+    """
+    filename = (request.view_args or {}).get('filename')
+    fingerprint = static_assets.fingerprint(filename) if filename else None
+    if fingerprint is None or request.args.get('v') != fingerprint or response.status_code not in (200, 304):
+        return response
+    response.headers['Cache-Control'] = STATIC_IMMUTABLE_CACHE_CONTROL
+    if not COMPRESSION or response.status_code != 200 or not is_compressible(response.mimetype):
+        return response
+    response.headers['Vary'] = add_vary(response.headers.get('Vary'), 'Accept-Encoding')
+    coding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if coding is None or (response.content_length or 0) < COMPRESSION_MIN_BYTES:
+        return response
+    body = static_assets.compressed(filename, fingerprint, coding)
+    # Replaces the file wrapper send_from_directory returned
+    if hasattr(response.response, 'close'):
+        response.response.close()
+    response.direct_passthrough = False
+    response.set_data(body)
+    response.headers['Content-Encoding'] = coding
+    if response.headers.get('ETag'):
+        response.headers['ETag'] = weaken_etag(response.headers['ETag'])
+    return response
+
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    """
+    Negotiated gzip/brotli compression of text and JSON responses.
+
+    Bodies under COMPRESSION_MIN_BYTES are sent as is. Streamed responses
+    (SSE) are compressed chunk by chunk and flushed after each, so events
+    still arrive as they are produced. Responses that already carry a
+    Content-Encoding (the OpenAPI document) are left alone.
+    """
+    if request.endpoint == 'static':
+        return finalize_static_response(response)
+    if (
+        not COMPRESSION
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or 'Content-Encoding' in response.headers
+        or response.direct_passthrough
+        or not is_compressible(response.mimetype)
+    ):
+        return response
+    response.headers['Vary'] = add_vary(response.headers.get('Vary'), 'Accept-Encoding')
+    coding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if coding is None:
+        return response
+    if response.headers.get('ETag'):
+        # Weakened even when the body ends up too small to compress: a 304
+        # can't tell, and has to send the tag the 200 would have
+        response.headers['ETag'] = weaken_etag(response.headers['ETag'])
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), coding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESSION_MIN_BYTES:
+            return response
+        response.set_data(compress(body, coding))
+    response.headers['Content-Encoding'] = coding
+    return response
+
+
 # Authentication decorators
 def login_required(f):
     """Decorator to require login for routes"""
@@ -90,7 +222,8 @@ def logout():
 @login_required
 def index():
     """Serve the main frontend page"""
-    return render_template('index.html')
+    # The fan search box needs a name column to match (see FAN_NAME_COLUMN)
+    return render_template('index.html', fan_search=bool(FAN_NAME_COLUMN))
 
 
 
@@ -105,9 +238,21 @@ def recommended_chats():
         "fan_id": "string",
         "creator_id": "string",
         "system_prompt_id": "string",
-        "chat_type": "text" | "image" | "video"  # optional
+        "chat_type": "text" | "image" | "video",  # optional
+        "force_refresh": boolean,  # optional, bypass the recommendation cache
+        "num_candidates": int,  # optional, number of replies (default 3)
+        "generation_mode": "single" | "parallel" | "multi_candidate"  # optional
     }
     
+    generation_mode "single" asks for every reply in one completion;
+    "parallel" runs one short completion per reply concurrently;
+    "multi_candidate" asks for num_candidates choices of one short completion.
+    The default is RECOMMENDATION_GENERATION_MODE.
+    
+    Optional header X-Request-Deadline-Ms: milliseconds the client will wait
+    (default REQUEST_DEADLINE_MS). Mistral calls are not retried past it and
+    a request that runs out of time gets 504.
+    
     Returns:
     {
         "recommendations": [
@@ -117,9 +262,18 @@ def recommended_chats():
                 "confidence": float
             },
             ...
-        ]
+        ],
+        "metadata": {
+            "prompt_tokens": int,  # token counts of the context sent to Mistral
+            ...
+        }
     }
     """
+    try:
+        deadline = parse_deadline(request.headers.get(REQUEST_DEADLINE_HEADER))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     try:
         data = request.get_json()
         
@@ -130,6 +284,7 @@ def recommended_chats():
         fan_id = data.get("fan_id")
         creator_id = data.get("creator_id")
         chat_type = data.get("chat_type", "text")  # text, image, or video
+        force_refresh = bool(data.get("force_refresh", False))
         
         if not fan_id or not creator_id:
             return jsonify({"error": "fan_id and creator_id are required"}), 400
@@ -140,34 +295,212 @@ def recommended_chats():
         if not system_prompt_id:
             return jsonify({"error": "system_prompt_id is required"}), 400
         
-        # Fetch recent chat events for context
-        chat_history_response = supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id).order("created_at", desc=True).limit(10).execute()
-        
-        # Handle case when fan_id and creator_id haven't started conversing yet (null/empty chat history)
-        chat_history = chat_history_response.data if chat_history_response.data else []
+        try:
+            num_candidates, generation_mode = parse_generation_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        recommendations = generate_chat_recommendations(
+        # Recent chat history is fetched concurrently with the creator, fan
+        # and system prompt lookups inside generate_chat_recommendations
+        recommendation_set = generate_chat_recommendations(
             supabase=supabase,
             creator_id=creator_id,
             fan_id=fan_id,
             system_prompt_id=system_prompt_id,
-            chat_history=chat_history,
-            chat_type=chat_type
+            chat_type=chat_type,
+            force_refresh=force_refresh,
+            deadline=deadline,
+            num_candidates=num_candidates,
+            generation_mode=generation_mode
         )
         
         return jsonify({
-            "recommendations": recommendations,
+            "recommendations": recommendation_set.recommendations,
             "fan_id": fan_id,
             "creator_id": creator_id,
-            "chat_type": chat_type
+            "chat_type": chat_type,
+            "metadata": recommendation_set.metadata
         }), 200
         
+    except TimeoutError as e:
+        # The deadline passed, or an identical request was in flight and did
+        # not finish in time
+        return jsonify({"error": str(e)}), 504
     except ValueError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
+@app.route('/recommended_chats/batch', methods=['POST'])
+@api_key_required
+def recommended_chats_batch():
+    """
+    Recommend chat replies for many conversations at once.
+    
+    Expected request body:
+    {
+        "items": [
+            {
+                "fan_id": "string",
+                "creator_id": "string",
+                "system_prompt_id": "string",
+                "chat_type": "text" | "image" | "video",  # optional
+                "num_candidates": int,  # optional, as in /recommended_chats
+                "generation_mode": "single" | "parallel" | "multi_candidate"  # optional
+            },
+            ...
+        ],
+        "force_refresh": boolean  # optional, bypass the recommendation cache
+    }
+    
+    Optional header X-Request-Deadline-Ms applies to the whole batch; items
+    not generated in time fail with a deadline error. Without it each item
+    gets REQUEST_DEADLINE_MS from when its generation starts.
+    
+    Returns (200 even when some items fail):
+    {
+        "results": [
+            {
+                "index": int,
+                "fan_id": "string",
+                "creator_id": "string",
+                "system_prompt_id": "string",
+                "chat_type": "string",
+                "recommendations": [...],  # on success
+                "metadata": {...},         # on success
+                "error": "string"          # on failure
+            },
+            ...
+        ],
+        "succeeded": int,
+        "failed": int
+    }
+    """
+    deadline_header = request.headers.get(REQUEST_DEADLINE_HEADER)
+    try:
+        deadline = parse_deadline(deadline_header) if deadline_header else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data:
+            return jsonify({"error": "Request body is required"}), 400
+        
+        items = data.get("items")
+        force_refresh = bool(data.get("force_refresh", False))
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "items must be a non-empty list"}), 400
+        
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({"error": f"A batch can contain at most {BATCH_MAX_ITEMS} items"}), 400
+        
+        return jsonify(generate_batch_recommendations(supabase, items, force_refresh, deadline)), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Format a Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/recommended_chats/stream', methods=['POST'])
+@api_key_required
+def recommended_chats_stream():
+    """
+    Stream chat reply recommendations as Server-Sent Events.
+    
+    Accepts the same request body as /recommended_chats. Each reply is sent
+    as a "recommendation" event as soon as Mistral has finished generating
+    it (in the parallel generation mode, as soon as its own completion has
+    finished). The final "done" event carries the same payload /recommended_chats
+    returns. Failures after the stream has started are sent as an "error"
+    event.
+    
+    Events:
+        event: recommendation
+        data: {"reply_id": "string", "content": "string", "confidence": float, "chat_type": "string"}
+        
+        event: done
+        data: {"recommendations": [...], "fan_id": "string", "creator_id": "string", "chat_type": "string", "metadata": {...}}
+    """
+    try:
+        deadline = parse_deadline(request.headers.get(REQUEST_DEADLINE_HEADER))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data:
+            return jsonify({"error": "Request body is required"}), 400
+        
+        fan_id = data.get("fan_id")
+        creator_id = data.get("creator_id")
+        chat_type = data.get("chat_type", "text")  # text, image, or video
+        force_refresh = bool(data.get("force_refresh", False))
+        
+        if not fan_id or not creator_id:
+            return jsonify({"error": "fan_id and creator_id are required"}), 400
+        
+        system_prompt_id = data.get("system_prompt_id")
+        
+        if not system_prompt_id:
+            return jsonify({"error": "system_prompt_id is required"}), 400
+        
+        try:
+            num_candidates, generation_mode = parse_generation_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Lookups happen before the stream starts so missing entities are
+        # reported with a normal JSON error response
+        recommendation_events = stream_chat_recommendations(
+            supabase=supabase,
+            creator_id=creator_id,
+            fan_id=fan_id,
+            system_prompt_id=system_prompt_id,
+            chat_type=chat_type,
+            force_refresh=force_refresh,
+            deadline=deadline,
+            num_candidates=num_candidates,
+            generation_mode=generation_mode
+        )
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    
+    def generate():
+        try:
+            for event, payload in recommendation_events:
+                if event == "done":
+                    payload = {
+                        "recommendations": payload.recommendations,
+                        "fan_id": fan_id,
+                        "creator_id": creator_id,
+                        "chat_type": chat_type,
+                        "metadata": payload.metadata
+                    }
+                yield format_sse(event, payload)
+        except Exception as e:
+            yield format_sse("error", {"error": f"Internal server error: {str(e)}"})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/chatter_selected_chat_reply', methods=['POST'])
 @api_key_required
 def chatter_selected_chat_reply():
@@ -190,6 +523,10 @@ def chatter_selected_chat_reply():
         "message_id": "string",
         "message": "Chat reply stored successfully"
     }
+    
+    With WRITE_BEHIND enabled the reply is written to the local journal and
+    acknowledged with 202 and "queued": true; it is inserted in the
+    background under the returned message_id.
     """
     try:
         data = request.get_json()
@@ -207,6 +544,19 @@ def chatter_selected_chat_reply():
         if not fan_id or not creator_id or not reply_content:
             return jsonify({"error": "fan_id, creator_id, and reply_content are required"}), 400
         
+        if reply_journal.started:
+            # A journaled row is acknowledged before it is inserted, so reject
+            # malformed ids now; rows whose creator or fan does not exist are
+            # dead-lettered by the flush
+            try:
+                fan_id = str(uuid.UUID(str(fan_id)))
+            except ValueError:
+                return jsonify({"error": "fan_id must be a UUID"}), 400
+            try:
+                creator_id = str(uuid.UUID(str(creator_id)))
+            except ValueError:
+                return jsonify({"error": "creator_id must be a UUID"}), 400
+        
         # Prepare metadata with optional fields
         message_metadata = metadata.copy() if metadata else {}
         if reply_id:
@@ -223,9 +573,26 @@ def chatter_selected_chat_reply():
             "metadata": message_metadata
         }
         
+        if reply_journal.started:
+            journaled = reply_journal.append(message_data)
+            invalidate_conversation(creator_id, fan_id)
+            schedule_summary_update(supabase, creator_id, fan_id)
+            return jsonify({
+                "success": True,
+                "message_id": journaled["id"],
+                "queued": True,
+                "message": "Chat reply accepted"
+            }), 202
+        
         response = supabase.table("of_chat_message").insert(message_data).execute()
         
+        # Cached recommendations for this conversation are now stale
+        invalidate_conversation(creator_id, fan_id)
+        
         if response.data and len(response.data) > 0:
+            # Fold older messages into the rolling summary in the background
+            # (no-op unless CONVERSATION_SUMMARIES is enabled)
+            schedule_summary_update(supabase, creator_id, fan_id)
             return jsonify({
                 "success": True,
                 "message_id": response.data[0].get("id"),
@@ -247,10 +614,10 @@ def creator_details():
     """
     Get creator details from Supabase by creator_id.
     
-    Expected request body:
-    {
-        "creator_id": "string"
-    }
+    Query parameter (or JSON body field):
+    - id: string (required)
+    
+    Supports If-None-Match (ETag) for conditional requests.
     
     Returns:
     {
@@ -266,13 +633,9 @@ def creator_details():
     }
     """
     try:
-        data = request.get_json()
-        
-        # Validate required fields
-        if not data:
-            return jsonify({"error": "Request body is required"}), 400
-        
-        creator_id = data.get("id")
+        # id as a query parameter (cacheable) or, as before, in a JSON body
+        data = request.get_json(silent=True) or {}
+        creator_id = request.args.get("id") or data.get("id")
         
         if not creator_id:
             return jsonify({"error": "creator_id is required"}), 400
@@ -283,10 +646,10 @@ def creator_details():
         except ValueError:
             return jsonify({"error": "Creator not found"}), 404
         
-        return jsonify({
+        return conditional_json({
             "creator": creator,
             "creator_id": creator_id
-        }), 200
+        }, rows_basis([creator], "creator", creator_id))
         
     except ValueError as e:
         return jsonify({"error": str(e)}), 500
@@ -300,10 +663,10 @@ def fan_details():
     """
     Get fan details from Supabase by fan_id.
     
-    Expected request body:
-    {
-        "id": "string"
-    }
+    Query parameter (or JSON body field):
+    - id: string (required)
+    
+    Supports If-None-Match (ETag) for conditional requests.
     
     Returns:
     {
@@ -316,13 +679,9 @@ def fan_details():
     }
     """
     try:
-        data = request.get_json()
-        
-        # Validate required fields
-        if not data:
-            return jsonify({"error": "Request body is required"}), 400
-        
-        fan_id = data.get("id")
+        # id as a query parameter (cacheable) or, as before, in a JSON body
+        data = request.get_json(silent=True) or {}
+        fan_id = request.args.get("id") or data.get("id")
         
         if not fan_id:
             return jsonify({"error": "fan_id is required"}), 400
@@ -333,10 +692,10 @@ def fan_details():
         except ValueError:
             return jsonify({"error": "Fan not found"}), 404
         
-        return jsonify({
+        return conditional_json({
             "fan": fan,
             "fan_id": fan_id
-        }), 200
+        }, rows_basis([fan], "fan", fan_id))
         
     except ValueError as e:
         return jsonify({"error": str(e)}), 500
@@ -394,51 +753,119 @@ def get_system_prompt_details():
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
-@app.route('/get_creators', methods=['GET'])
-@api_key_required
-def get_creators():
-    """Get all creators"""
+def list_response(key: str, lister, **filters):
+    """
+    Serve one page of a list endpoint.
+    
+    Reads the limit, cursor and fields query parameters shared by the list
+    endpoints and returns {key: [...], "has_more": bool, "next_cursor": ...}.
+    Invalid parameters, filters or unknown fields are answered with 400.
+    """
     try:
-        creators_response = supabase.table("creator").select("*").execute()
-        creators = creators_response.data if creators_response.data else []
-        return jsonify({"creators": creators}), 200
+        try:
+            page = lister(
+                supabase,
+                limit=parse_page_limit(request.args.get("limit"), LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE),
+                cursor=parse_list_cursor(request.args.get("cursor")),
+                fields=parse_fields(request.args.get("fields")),
+                **filters
+            )
+        except (ValueError, APIError) as e:
+            return jsonify({"error": getattr(e, "message", None) or str(e)}), 400
+        basis = rows_basis(page.rows, key, request.args.get("fields", ""), page.has_more, page.next_cursor)
+        return conditional_json({key: page.rows, "has_more": page.has_more, "next_cursor": page.next_cursor}, basis)
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
+@app.route('/get_creators', methods=['GET'])
+@api_key_required
+def get_creators():
+    """
+    Get creators, one page at a time.
+    
+    Query parameters:
+    - limit: int (optional, default LIST_PAGE_SIZE)
+    - cursor: string (optional, next_cursor of the previous page)
+    - fields: comma-separated columns (optional, id is always included)
+    - name_prefix: string (optional, case-insensitive)
+    
+    Returns:
+    {
+        "creators": [...],
+        "has_more": boolean,
+        "next_cursor": "string" | null
+    }
+    """
+    return list_response("creators", list_creators, name_prefix=request.args.get("name_prefix"))
+
+
 @app.route('/get_fans', methods=['GET'])
 @api_key_required
 def get_fans():
-    """Get all fans"""
+    """
+    Get fans, one page at a time.
+    
+    Query parameters:
+    - limit: int (optional, default LIST_PAGE_SIZE)
+    - cursor: string (optional, next_cursor of the previous page)
+    - fields: comma-separated columns (optional, id is always included)
+    - name_prefix: string (optional, case-insensitive)
+    - creator_id: string (optional, only fans who have chatted with the creator)
+    
+    Returns:
+    {
+        "fans": [...],
+        "has_more": boolean,
+        "next_cursor": "string" | null
+    }
+    """
     try:
-        fans_response = supabase.table("fan").select("*").execute()
-        fans = fans_response.data if fans_response.data else []
-        return jsonify({"fans": fans}), 200
-    except Exception as e:
-        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+        creator_id = parse_list_cursor(request.args.get("creator_id"))
+    except ValueError:
+        return jsonify({"error": "creator_id must be a UUID"}), 400
+    return list_response("fans", list_fans, name_prefix=request.args.get("name_prefix"), creator_id=creator_id)
 
 
 @app.route('/get_system_prompts', methods=['GET'])
 @api_key_required
 def get_system_prompts():
-    """Get all system prompts"""
-    try:
-        prompts_response = supabase.table("system_prompt").select("*").execute()
-        prompts = prompts_response.data if prompts_response.data else []
-        return jsonify({"system_prompts": prompts}), 200
-    except Exception as e:
-        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    """
+    Get system prompts, one page at a time.
+    
+    Query parameters:
+    - limit: int (optional, default LIST_PAGE_SIZE)
+    - cursor: string (optional, next_cursor of the previous page)
+    - fields: comma-separated columns (optional, id is always included;
+      leave out system_prompt to skip the prompt bodies)
+    
+    Returns:
+    {
+        "system_prompts": [...],
+        "has_more": boolean,
+        "next_cursor": "string" | null
+    }
+    """
+    return list_response("system_prompts", list_system_prompts)
 
 
 @app.route('/get_chat_history', methods=['GET'])
 @api_key_required
 def get_chat_history():
     """
-    Get chat history between a creator and fan.
+    Get chat history between a creator and fan, one page at a time.
+    
+    Pages are keyed on (created_at, id). Without a cursor the newest
+    messages are returned; pass next_before as "before" to page back in time,
+    and next_after as "after" to fetch only messages that arrived since.
     
     Query parameters:
     - creator_id: string (required)
     - fan_id: string (required)
+    - limit: int (optional, default CHAT_HISTORY_PAGE_SIZE)
+    - before: cursor (optional, messages older than it)
+    - after: cursor (optional, messages newer than it)
+    - since: ISO 8601 timestamp (optional, messages created after it)
     
     Returns:
     {
@@ -450,7 +877,10 @@ def get_chat_history():
                 "created_at": "string"
             },
             ...
-        ]
+        ],  # oldest first
+        "has_more": boolean,  # more messages in the direction being paged
+        "next_before": "string" | null,
+        "next_after": "string" | null
     }
     """
     try:
@@ -460,14 +890,24 @@ def get_chat_history():
         if not creator_id or not fan_id:
             return jsonify({"error": "creator_id and fan_id are required"}), 400
         
-        # Fetch chat history from of_chat_message table
-        chat_history_response = supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id).order("created_at", desc=False).execute()
-        
-        messages = chat_history_response.data if chat_history_response.data else []
-        
-        return jsonify({
-            "messages": messages
-        }), 200
+        try:
+            limit = parse_page_limit(request.args.get("limit"), CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_MAX_PAGE_SIZE)
+            page = get_chat_history_page(
+                supabase,
+                creator_id,
+                fan_id,
+                limit=limit,
+                before=request.args.get("before"),
+                after=request.args.get("after"),
+                since=request.args.get("since")
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Messages are never updated, so the page's fingerprint identifies
+        # the body without serializing it
+        basis = history_page_fingerprint(page)
+        return conditional_json(page._asdict(), basis)
         
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
@@ -517,7 +957,14 @@ def send_fan_message():
         
         response = supabase.table("of_chat_message").insert(message_data).execute()
         
+        # Cached recommendations for this conversation are now stale
+        invalidate_conversation(creator_id, fan_id)
+        
         if response.data:
+            # Start on the next suggestions while the chatter reads the message
+            # (no-op unless SPECULATIVE_GENERATION is enabled)
+            schedule_speculative_recommendations(supabase, creator_id, fan_id)
+            schedule_summary_update(supabase, creator_id, fan_id)
             return jsonify({
                 "success": True,
                 "message_id": response.data[0].get("id"),
@@ -530,6 +977,56 @@ def send_fan_message():
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 
+@app.route('/ingest/chat_messages', methods=['POST'])
+@api_key_required
+def ingest_chat_messages_endpoint():
+    """
+    Import historical chat messages in bulk.
+    
+    The request body is streamed, not loaded into memory: NDJSON (one
+    of_chat_message object per line) or CSV with a header row. The format is
+    taken from the "format" query parameter, else from the Content-Type
+    (text/csv means CSV).
+    
+    Query parameters:
+        format: "ndjson" | "csv"  # optional
+        batch_size: int  # optional, rows per insert (default INGEST_BATCH_SIZE)
+    
+    Returns:
+    {
+        "rows_read": int,
+        "inserted": int,
+        "rejected": int,
+        "failed": int,
+        "batches": int,
+        "failed_batches": int,
+        "retries": int,
+        "seconds": float,
+        "rows_per_second": float,
+        "errors": [{"line": int, "error": "string"}, ...]
+    }
+    """
+    try:
+        input_format = request.args.get("format") or ("csv" if request.mimetype == "text/csv" else "ndjson")
+        if input_format not in INGEST_FORMATS:
+            return jsonify({"error": f"format must be one of: {', '.join(INGEST_FORMATS)}"}), 400
+        
+        try:
+            batch_size = int(request.args.get("batch_size", INGEST_BATCH_SIZE))
+        except ValueError:
+            return jsonify({"error": "batch_size must be an integer"}), 400
+        if batch_size < 1:
+            return jsonify({"error": "batch_size must be positive"}), 400
+        
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+        report = ingest_chat_messages(supabase, stream, input_format, batch_size)
+        
+        return jsonify(report), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+
 @app.route('/update_creator', methods=['PUT', 'PATCH'])
 @api_key_required
 def update_creator():
@@ -570,10 +1067,13 @@ def update_creator():
         if not update_data:
             return jsonify({"error": "No fields to update"}), 400
         
-        # Update creator in Supabase
+        # Update creator in Supabase, dropping the cached row first so a
+        # failed update can't leave it stale
+        invalidate_creator(creator_id)
         response = supabase.table("creator").update(update_data).eq("id", creator_id).execute()
         
         if response.data and len(response.data) > 0:
+            cache_creator(response.data[0])
             return jsonify({
                 "success": True,
                 "creator": response.data[0],
@@ -623,10 +1123,13 @@ def update_fan():
         if not update_data:
             return jsonify({"error": "No fields to update"}), 400
         
-        # Update fan in Supabase
+        # Update fan in Supabase, dropping the cached row first so a
+        # failed update can't leave it stale
+        invalidate_fan(fan_id)
         response = supabase.table("fan").update(update_data).eq("id", fan_id).execute()
         
         if response.data and len(response.data) > 0:
+            cache_fan(response.data[0])
             return jsonify({
                 "success": True,
                 "fan": response.data[0],
@@ -672,6 +1175,7 @@ def create_creator():
         response = supabase.table("creator").insert(data).execute()
         
         if response.data and len(response.data) > 0:
+            cache_creator(response.data[0])
             return jsonify({
                 "success": True,
                 "creator": response.data[0],
@@ -714,6 +1218,7 @@ def create_fan():
         response = supabase.table("fan").insert(data).execute()
         
         if response.data and len(response.data) > 0:
+            cache_fan(response.data[0])
             return jsonify({
                 "success": True,
                 "fan": response.data[0],
@@ -755,6 +1260,7 @@ def create_system_prompt():
         response = supabase.table("system_prompt").insert(data).execute()
         
         if response.data and len(response.data) > 0:
+            cache_system_prompt(response.data[0])
             return jsonify({
                 "success": True,
                 "system_prompt": response.data[0],
@@ -803,10 +1309,13 @@ def update_system_prompt():
         if not update_data:
             return jsonify({"error": "No fields to update"}), 400
         
-        # Update system prompt in Supabase
+        # Update system prompt in Supabase, dropping the cached row first so a
+        # failed update can't leave it stale
+        invalidate_system_prompt(prompt_id)
         response = supabase.table("system_prompt").update(update_data).eq("id", prompt_id).execute()
         
         if response.data and len(response.data) > 0:
+            cache_system_prompt(response.data[0])
             return jsonify({
                 "success": True,
                 "system_prompt": response.data[0],
@@ -822,474 +1331,53 @@ def update_system_prompt():
 @app.route('/api-docs/openapi.json', methods=['GET'])
 @login_required
 def openapi_spec():
-    """OpenAPI specification for the API"""
-    spec = {
-        "openapi": "3.0.0",
-        "info": {
-            "title": "Middleman AI API",
-            "version": "1.0.0",
-            "description": "API for Middleman AI Chat Recommendation System"
+    """OpenAPI specification for the API, built once from the registered routes"""
+    coding, body, etag = openapi_document.negotiate(request.accept_encodings, app.url_map, app.view_functions)
+    if coding != "identity":
+        # Same weak tag on the 200 and the 304 of an encoded variant
+        etag = weaken_etag(etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+        if coding != "identity":
+            response.headers["Content-Encoding"] = coding
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HTTP_CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+@api_key_required
+def metrics():
+    """In-process cache and performance counters"""
+    return jsonify({
+        "caches": {
+            "creator": creator_cache.stats(),
+            "fan": fan_cache.stats(),
+            "system_prompt": system_prompt_cache.stats(),
+            "prompt_template": template_cache.stats(),
+            "recommendation": recommendation_cache_stats(),
+            "conversation_summary": summary_cache.stats(),
+            "prompt_prefix": prefix_stats(),
+            "response_body": response_body_cache.stats()
         },
-        "servers": [
-            {
-                "url": f"{request.scheme}://{request.host}",
-                "description": "Current server"
-            }
-        ],
-        "components": {
-            "securitySchemes": {
-                "ApiKeyAuth": {
-                    "type": "apiKey",
-                    "in": "header",
-                    "name": "X-API-Key"
-                }
-            }
+        "coalescing": {
+            "recommendation": recommendation_flight.stats()
         },
-        "security": [{"ApiKeyAuth": []}],
-        "paths": {
-            "/recommended_chats": {
-                "post": {
-                    "tags": ["Chat"],
-                    "summary": "Generate chat recommendations",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "required": ["fan_id", "creator_id", "system_prompt_id"],
-                                    "properties": {
-                                        "fan_id": {"type": "string"},
-                                        "creator_id": {"type": "string"},
-                                        "system_prompt_id": {"type": "string"},
-                                        "chat_type": {"type": "string", "enum": ["text", "image", "video"], "default": "text"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "recommendations": {
-                                                "type": "array",
-                                                "items": {
-                                                    "type": "object",
-                                                    "properties": {
-                                                        "reply_id": {"type": "string"},
-                                                        "content": {"type": "string"},
-                                                        "confidence": {"type": "number"}
-                                                    }
-                                                }
-                                            }
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/chatter_selected_chat_reply": {
-                "post": {
-                    "tags": ["Chat"],
-                    "summary": "Store selected chat reply",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "required": ["fan_id", "creator_id", "reply_content"],
-                                    "properties": {
-                                        "fan_id": {"type": "string"},
-                                        "creator_id": {"type": "string"},
-                                        "reply_content": {"type": "string"},
-                                        "reply_id": {"type": "string"},
-                                        "chat_type": {"type": "string"},
-                                        "metadata": {"type": "object"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "201": {
-                            "description": "Created",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "message_id": {"type": "string"},
-                                            "message": {"type": "string"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/get_creators": {
-                "get": {
-                    "tags": ["Data"],
-                    "summary": "Get all creators",
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "creators": {"type": "array"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/get_fans": {
-                "get": {
-                    "tags": ["Data"],
-                    "summary": "Get all fans",
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "fans": {"type": "array"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/get_system_prompts": {
-                "get": {
-                    "tags": ["Data"],
-                    "summary": "Get all system prompts",
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "system_prompts": {"type": "array"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/get_chat_history": {
-                "get": {
-                    "tags": ["Chat"],
-                    "summary": "Get chat history",
-                    "parameters": [
-                        {"name": "creator_id", "in": "query", "required": True, "schema": {"type": "string"}},
-                        {"name": "fan_id", "in": "query", "required": True, "schema": {"type": "string"}}
-                    ],
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "messages": {"type": "array"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/send_fan_message": {
-                "post": {
-                    "tags": ["Chat"],
-                    "summary": "Send fan message",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "required": ["fan_id", "creator_id", "content"],
-                                    "properties": {
-                                        "fan_id": {"type": "string"},
-                                        "creator_id": {"type": "string"},
-                                        "content": {"type": "string"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "201": {
-                            "description": "Created",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "message_id": {"type": "string"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/create_creator": {
-                "post": {
-                    "tags": ["Data"],
-                    "summary": "Create new creator",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "properties": {
-                                        "creator_name": {"type": "string"},
-                                        "niches": {"type": "array"},
-                                        "persona": {"type": "array"},
-                                        "nsfw": {"type": "boolean"},
-                                        "emojis_enabled": {"type": "boolean"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "201": {
-                            "description": "Created",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "creator": {"type": "object"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/create_fan": {
-                "post": {
-                    "tags": ["Data"],
-                    "summary": "Create new fan",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "properties": {
-                                        "fan_name": {"type": "string"},
-                                        "lifetime_spend": {"type": "number"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "201": {
-                            "description": "Created",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "fan": {"type": "object"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/create_system_prompt": {
-                "post": {
-                    "tags": ["Data"],
-                    "summary": "Create new system prompt",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "properties": {
-                                        "system_prompt": {"type": "string"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "201": {
-                            "description": "Created",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "system_prompt": {"type": "object"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/update_creator": {
-                "put": {
-                    "tags": ["Data"],
-                    "summary": "Update creator",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "required": ["id"],
-                                    "properties": {
-                                        "id": {"type": "string"},
-                                        "creator_name": {"type": "string"},
-                                        "niches": {"type": "array"},
-                                        "persona": {"type": "array"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "creator": {"type": "object"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/update_fan": {
-                "put": {
-                    "tags": ["Data"],
-                    "summary": "Update fan",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "required": ["id"],
-                                    "properties": {
-                                        "id": {"type": "string"},
-                                        "fan_name": {"type": "string"},
-                                        "lifetime_spend": {"type": "number"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "fan": {"type": "object"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            },
-            "/update_system_prompt": {
-                "put": {
-                    "tags": ["Data"],
-                    "summary": "Update system prompt",
-                    "requestBody": {
-                        "required": True,
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "type": "object",
-                                    "required": ["id"],
-                                    "properties": {
-                                        "id": {"type": "string"},
-                                        "system_prompt": {"type": "string"}
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "responses": {
-                        "200": {
-                            "description": "Success",
-                            "content": {
-                                "application/json": {
-                                    "schema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "success": {"type": "boolean"},
-                                            "system_prompt": {"type": "object"}
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            }
+        "mistral_calls": {
+            "recommendation": recommendation_policy.stats(),
+            "summary": summary_policy.stats()
+        },
+        "model_routing": model_router.stats(),
+        "http_pools": pool_stats(),
+        "background": {
+            "speculative": speculative_executor.stats(),
+            "summary": summary_executor.stats(),
+            "write_behind": reply_journal.stats()
         }
-    }
-    return jsonify(spec)
+    }), 200
 
 
 @app.route('/health', methods=['GET'])
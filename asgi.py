@@ -0,0 +1,191 @@
+"""
+ASGI entry point for Middleman AI.
+
+The LLM-bound endpoints (/recommended_chats and /get_chat_history) are served
+natively async with the async Supabase client and Mistral's complete_async,
+so one process can keep hundreds of Mistral calls in flight instead of
+holding a sync worker per request. Every other route is delegated to the
+Flask app unchanged.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+"""
+
+from a2wsgi import WSGIMiddleware
+from contextlib import asynccontextmanager
+from functools import wraps
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route, request_response
+from supabase import AsyncClient
+from app import app as flask_app, API_KEY, supabase_url, supabase_key
+from utils.chat_history import CHAT_HISTORY_MAX_PAGE_SIZE, CHAT_HISTORY_PAGE_SIZE, aget_chat_history_page, history_page_fingerprint
+from utils.listing import parse_page_limit
+from utils.http_cache import HTTP_CACHE_CONTROL, HTTP_VARY, conditional_body, json_body
+from utils.compression import COMPRESSION, COMPRESSION_MIN_BYTES, add_vary, compress, negotiate_encoding, weaken_etag
+from utils.http_clients import HTTP_WARMUP, acreate_supabase_client, awarm_up_connections
+from utils.call_policy import REQUEST_DEADLINE_HEADER, parse_deadline
+from utils.chats import agenerate_chat_recommendations, parse_generation_options
+import os
+
+async_supabase: AsyncClient = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Create the async Supabase client once per worker process and warm its connections"""
+    global async_supabase
+    async_supabase = await acreate_supabase_client(supabase_url, supabase_key)
+    if HTTP_WARMUP:
+        await awarm_up_connections()
+    yield
+
+
+def api_key_required(f):
+    """Decorator to require API key for API endpoints (async routes)"""
+    @wraps(f)
+    async def decorated_function(request: Request):
+        api_key = request.headers.get('X-API-Key')
+        if not api_key or api_key != API_KEY:
+            return JSONResponse({"error": "Invalid or missing API key"}, status_code=401)
+        return await f(request)
+    return decorated_function
+
+
+def with_cors(endpoint, methods):
+    """Wrap an async route with the same permissive CORS policy Flask-CORS applies"""
+    return CORSMiddleware(
+        request_response(endpoint),
+        allow_origins=['*'],
+        allow_methods=methods,
+        allow_headers=['*']
+    )
+
+
+async def read_json(request: Request):
+    """Return the JSON request body, or None when it is missing or invalid"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@api_key_required
+async def recommended_chats(request: Request):
+    """Async version of app.recommended_chats (same request and response shapes)"""
+    try:
+        deadline = parse_deadline(request.headers.get(REQUEST_DEADLINE_HEADER))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        data = await read_json(request)
+
+        # Validate required fields
+        if not data:
+            return JSONResponse({"error": "Request body is required"}, status_code=400)
+
+        fan_id = data.get("fan_id")
+        creator_id = data.get("creator_id")
+        chat_type = data.get("chat_type", "text")  # text, image, or video
+        force_refresh = bool(data.get("force_refresh", False))
+
+        if not fan_id or not creator_id:
+            return JSONResponse({"error": "fan_id and creator_id are required"}, status_code=400)
+
+        system_prompt_id = data.get("system_prompt_id")
+
+        if not system_prompt_id:
+            return JSONResponse({"error": "system_prompt_id is required"}, status_code=400)
+
+        try:
+            num_candidates, generation_mode = parse_generation_options(data)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        recommendation_set = await agenerate_chat_recommendations(
+            supabase=async_supabase,
+            creator_id=creator_id,
+            fan_id=fan_id,
+            system_prompt_id=system_prompt_id,
+            chat_type=chat_type,
+            force_refresh=force_refresh,
+            deadline=deadline,
+            num_candidates=num_candidates,
+            generation_mode=generation_mode
+        )
+
+        return JSONResponse({
+            "recommendations": recommendation_set.recommendations,
+            "fan_id": fan_id,
+            "creator_id": creator_id,
+            "chat_type": chat_type,
+            "metadata": recommendation_set.metadata
+        }, status_code=200)
+
+    except TimeoutError as e:
+        # The deadline passed, or an identical request was in flight and did
+        # not finish in time
+        return JSONResponse({"error": str(e)}, status_code=504)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    except Exception as e:
+        return JSONResponse({"error": f"Internal server error: {str(e)}"}, status_code=500)
+
+
+@api_key_required
+async def get_chat_history(request: Request):
+    """Async version of app.get_chat_history (same request and response shapes)"""
+    try:
+        creator_id = request.query_params.get("creator_id")
+        fan_id = request.query_params.get("fan_id")
+
+        if not creator_id or not fan_id:
+            return JSONResponse({"error": "creator_id and fan_id are required"}, status_code=400)
+
+        try:
+            limit = parse_page_limit(request.query_params.get("limit"), CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_MAX_PAGE_SIZE)
+            page = await aget_chat_history_page(
+                async_supabase,
+                creator_id,
+                fan_id,
+                limit=limit,
+                before=request.query_params.get("before"),
+                after=request.query_params.get("after"),
+                since=request.query_params.get("since")
+            )
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        # Same ETag as the Flask route (see app.get_chat_history)
+        basis = history_page_fingerprint(page)
+        etag, body = conditional_body(request.headers.get("If-None-Match"), lambda: json_body(page._asdict()), basis)
+        headers = {"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL, "Vary": add_vary(HTTP_VARY, "Accept-Encoding")}
+        # Compressed like the Flask routes (see app.compress_response): the
+        # ETag is weakened whenever an encoding is negotiated, so the 304 and
+        # the 200 carry the same tag whatever the body's size
+        coding = negotiate_encoding(request.headers.get("Accept-Encoding")) if COMPRESSION else None
+        if coding:
+            headers["ETag"] = weaken_etag(etag)
+        if body is None:
+            return Response(status_code=304, headers=headers)
+        if coding and len(body) >= COMPRESSION_MIN_BYTES:
+            body = compress(body, coding)
+            headers["Content-Encoding"] = coding
+        return Response(body, status_code=200, media_type="application/json", headers=headers)
+
+    except Exception as e:
+        return JSONResponse({"error": f"Internal server error: {str(e)}"}, status_code=500)
+
+
+app = Starlette(
+    routes=[
+        Route('/recommended_chats', with_cors(recommended_chats, ['POST']), methods=['POST', 'OPTIONS']),
+        Route('/get_chat_history', with_cors(get_chat_history, ['GET']), methods=['GET', 'OPTIONS']),
+        # Everything else (UI, auth, CRUD, streaming) is served by Flask
+        Mount('/', app=WSGIMiddleware(flask_app, workers=int(os.getenv('ASGI_WSGI_THREADS', '10'))))
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,97 @@
+"""
+End-to-end benchmark of the recommendation generation modes against Mistral.
+
+Runs the same synthetic conversation through each generation mode (single,
+parallel, multi_candidate) the way /recommended_chats/stream does and
+reports, per mode, the p50/p95 time until the first reply is available,
+until the whole set is, and the tokens it cost. Needs MISTRAL_API_KEY; every
+iteration makes real API calls (num_candidates of them in the parallel mode).
+
+Usage:
+    python benchmarks/bench_generation_modes.py [--iterations 20] [--num-candidates 3] [--modes single,parallel]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MODEL_ROUTING_LOG", "false")
+
+from utils.chats import GENERATION_MODES, RECOMMENDATION_MAX_CANDIDATES, route_recommendation, _stream_completed_replies, _stream_recommendations  # noqa: E402
+from utils.cache import MISSING  # noqa: E402
+from utils.recommendation_cache import recommendation_cache  # noqa: E402
+
+CREATOR = {"id": "bench-creator", "name": "Mia", "personality": "bubbly, flirty, loves travel and fitness"}
+FAN = {"id": "bench-fan", "name": "Chris", "lifetime_spend": 120, "notes": "likes hiking, asked about a custom video"}
+SYSTEM_PROMPT = {
+    "system_prompt": "You are {{creator name}}, chatting with your fan {{fan name}}. Stay in character and keep replies short.\n\n{{chat logs}}"
+}
+CHAT_HISTORY = [
+    {"role": "fan", "content": "hey how was your weekend?"},
+    {"role": "creator", "content": "so good!! went hiking and got soo sunburnt 😅 what about u?"},
+    {"role": "fan", "content": "Just work honestly. Did you get my tip? Wondering when the custom will be ready"},
+]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_once(mode, num_candidates):
+    """Generate one set; returns (seconds to first reply, seconds to all replies, tokens)."""
+    # The prompt assembly logs the whole context; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        decision, messages, context = route_recommendation(
+            CREATOR, FAN, SYSTEM_PROMPT, CHAT_HISTORY, "bench", "text",
+            num_candidates=num_candidates, generation_mode=mode
+        )
+    cache_key = f"bench-{uuid.uuid4()}"
+    started = time.perf_counter()
+    if mode == "single":
+        events = _stream_recommendations(messages, context, "text", cache_key, CREATOR["id"], FAN["id"], decision, None, num_candidates)
+    else:
+        events = _stream_completed_replies(messages, context, "text", cache_key, CREATOR["id"], FAN["id"], decision, None, num_candidates, mode)
+    first = None
+    for event, _ in events:
+        if event == "recommendation" and first is None:
+            first = time.perf_counter() - started
+    total = time.perf_counter() - started
+    # The finished set is cached with the tokens it cost
+    entry = recommendation_cache.get(cache_key)
+    return first, total, 0 if entry is MISSING else entry["tokens"]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--iterations", type=int, default=20)
+    arg_parser.add_argument("--num-candidates", type=int, default=3, choices=range(1, RECOMMENDATION_MAX_CANDIDATES + 1))
+    arg_parser.add_argument("--modes", default=",".join(GENERATION_MODES), help="Comma-separated generation modes")
+    args = arg_parser.parse_args()
+
+    if not os.getenv("MISTRAL_API_KEY"):
+        sys.exit("MISTRAL_API_KEY is not set")
+
+    print(f"{args.iterations} iterations, {args.num_candidates} replies\n")
+    print(f"{'mode':<16} {'first p50':>9} {'first p95':>9} {'all p50':>8} {'all p95':>8} {'tokens':>7}")
+    for mode in args.modes.split(","):
+        firsts, totals, tokens = [], [], []
+        for _ in range(args.iterations):
+            first, total, used = run_once(mode, args.num_candidates)
+            firsts.append(first)
+            totals.append(total)
+            tokens.append(used)
+        print(
+            f"{mode:<16} {percentile(firsts, 0.5):8.2f}s {percentile(firsts, 0.95):8.2f}s "
+            f"{percentile(totals, 0.5):7.2f}s {percentile(totals, 0.95):7.2f}s {statistics.mean(tokens):7.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for the reply parser used by /recommended_chats.
+
+Compares the incremental ReplyParser (whole text and streamed in small
+chunks) against the regex fallback cascade it replaced, over the completions
+in fixtures/mistral_reply_outputs.json.
+
+Usage:
+    python benchmarks/bench_reply_parser.py [--iterations 2000] [--chunk-size 8]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.reply_parser import ReplyParser, parse_replies  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "mistral_reply_outputs.json")
+
+
+def legacy_parse(generated_content):
+    """The regex fallback cascade previously used by generate_chat_recommendations."""
+    reply_patterns = [
+        r'Reply\s*1[:\-]\s*(.+?)(?=Reply\s*2|Reply\s*3|$)',
+        r'Reply\s*2[:\-]\s*(.+?)(?=Reply\s*3|$)',
+        r'Reply\s*3[:\-]\s*(.+?)$',
+        r'1[\.\)]\s*(.+?)(?=2[\.\)]|$)',
+        r'2[\.\)]\s*(.+?)(?=3[\.\)]|$)',
+        r'3[\.\)]\s*(.+?)$'
+    ]
+    parsed_replies = []
+    for pattern in reply_patterns[:3]:
+        matches = re.findall(pattern, generated_content, re.IGNORECASE | re.DOTALL)
+        if matches:
+            parsed_replies = [match.strip() for match in matches]
+            break
+    if not parsed_replies or len(parsed_replies) < 3:
+        for line in generated_content.split('\n'):
+            line = line.strip()
+            if re.match(r'^(Reply\s*[1-3]|[\d]+[\.\)])', line, re.IGNORECASE):
+                content = re.sub(r'^(Reply\s*[1-3][:\-]?\s*|[\d]+[\.\)]\s*)', '', line, flags=re.IGNORECASE).strip()
+                if content and content not in parsed_replies:
+                    parsed_replies.append(content)
+    if len(parsed_replies) < 3:
+        parts = re.split(r'\n\n+|\n---\n|Reply\s*[1-3]', generated_content, flags=re.IGNORECASE)
+        parts = [p.strip() for p in parts if p.strip() and len(p.strip()) > 10]
+        if len(parts) >= 3:
+            parsed_replies = parts[:3]
+        elif len(parts) > 0:
+            parsed_replies = parts
+            while len(parsed_replies) < 3:
+                parsed_replies.append(parsed_replies[-1] if parsed_replies else generated_content)
+        else:
+            content_length = len(generated_content)
+            chunk_size = content_length // 3
+            parsed_replies = [
+                generated_content[i:i+chunk_size].strip()
+                for i in range(0, content_length, chunk_size)
+            ][:3]
+    return parsed_replies
+
+
+def streamed_parse(text, chunk_size):
+    parser = ReplyParser(3)
+    for i in range(0, len(text), chunk_size):
+        parser.feed(text[i:i + chunk_size])
+    return parser.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--iterations", type=int, default=2000)
+    arg_parser.add_argument("--chunk-size", type=int, default=8, help="Characters per streamed chunk (Mistral deltas are ~1 token)")
+    args = arg_parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        outputs = json.load(f)["outputs"]
+    total_chars = sum(len(text) for text in outputs)
+
+    print(f"{len(outputs)} outputs, {total_chars} characters\n")
+    print(f"{'#':>3}  {'legacy':>6}  {'parser':>6}  complete")
+    for index, text in enumerate(outputs, 1):
+        legacy = legacy_parse(text)
+        result = parse_replies(text)
+        assert streamed_parse(text, args.chunk_size).replies == result.replies
+        print(f"{index:>3}  {len(legacy):>6}  {len(result.replies):>6}  {result.complete}")
+
+    cases = {
+        "legacy regex cascade": lambda: [legacy_parse(text) for text in outputs],
+        "ReplyParser (whole text)": lambda: [parse_replies(text) for text in outputs],
+        f"ReplyParser ({args.chunk_size}-char chunks)": lambda: [streamed_parse(text, args.chunk_size) for text in outputs],
+    }
+    print()
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=args.iterations, repeat=5))
+        per_output_us = seconds / (args.iterations * len(outputs)) * 1e6
+        print(f"{name:<32} {per_output_us:8.2f} us/output")
+
+
+if __name__ == "__main__":
+    main()
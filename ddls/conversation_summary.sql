@@ -0,0 +1,9 @@
+CREATE TABLE conversation_summary (
+  creator_id uuid REFERENCES creator(id),
+  fan_id uuid REFERENCES fan(id),
+  summary text NOT NULL DEFAULT '',
+  summarized_until timestamptz,
+  message_count integer NOT NULL DEFAULT 0,
+  updated_at timestamptz DEFAULT now(),
+  PRIMARY KEY (creator_id, fan_id)
+);
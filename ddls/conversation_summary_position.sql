@@ -0,0 +1,3 @@
+-- id of the last summarized message, so summaries page on (created_at, id) and don't skip messages sharing a timestamp
+ALTER TABLE conversation_summary
+  ADD COLUMN summarized_until_id uuid;
@@ -0,0 +1,3 @@
+-- Optional system prompt used for speculative generation (NULL falls back to DEFAULT_SYSTEM_PROMPT_ID)
+ALTER TABLE creator
+  ADD COLUMN default_system_prompt_id uuid REFERENCES system_prompt(id);
@@ -7,3 +7,7 @@ CREATE TABLE of_chat_message (
   created_at timestamptz DEFAULT now(),
   metadata jsonb DEFAULT '{}'
 );
+
+-- Keyset pagination of a conversation on (created_at, id)
+CREATE INDEX of_chat_message_conversation_idx
+  ON of_chat_message (creator_id, fan_id, created_at, id);
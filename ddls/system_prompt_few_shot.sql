@@ -0,0 +1,4 @@
+-- Optional few-shot example selection per system prompt (NULL keeps the full SAMPLE_CONVERSATIONS block)
+ALTER TABLE system_prompt
+  ADD COLUMN few_shot_k integer,
+  ADD COLUMN few_shot_source text CHECK (few_shot_source IN ('default', 'creator'));
@@ -0,0 +1,22 @@
+-- Row version for ETags: list and detail responses are fingerprinted by id and updated_at instead of hashing the serialized body
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at = clock_timestamp();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE creator
+  ADD COLUMN updated_at timestamptz DEFAULT now();
+CREATE TRIGGER creator_set_updated_at BEFORE UPDATE ON creator
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+ALTER TABLE fan
+  ADD COLUMN updated_at timestamptz DEFAULT now();
+CREATE TRIGGER fan_set_updated_at BEFORE UPDATE ON fan
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+ALTER TABLE system_prompt
+  ADD COLUMN updated_at timestamptz DEFAULT now();
+CREATE TRIGGER system_prompt_set_updated_at BEFORE UPDATE ON system_prompt
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
@@ -7,7 +7,13 @@ let selectedCreator = null;
 let selectedFan = null;
 let selectedSystemPrompt = null;
 let chatMessages = [];
+// Keyset cursors of the loaded chat history (see /get_chat_history)
+let chatCursors = { before: null, after: null, hasOlder: false };
 let pendingRecommendations = null;
+// Paging state of the fan list (see /get_fans)
+let fansCursor = null;
+let fanSearch = '';
+let fanSearchTimer = null;
 
 // Get API key from localStorage
 function getApiKey() {
@@ -46,21 +52,169 @@ async function fetchData(endpoint, options = {}) {
     }
 }
 
+// Fetch a Server-Sent Events stream from a POST endpoint.
+// EventSource only supports GET without custom headers, so the stream is
+// read with fetch and split into events manually. onEvent(event, data) is
+// called for every event; the promise resolves when the stream ends.
+async function fetchEventStream(endpoint, body, onEvent) {
+    const apiKey = getApiKey();
+    const response = await fetch(`${API_BASE_URL}${endpoint}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'X-API-Key': apiKey,
+        },
+        body: JSON.stringify(body),
+    });
+
+    if (!response.ok) {
+        if (response.status === 401) {
+            localStorage.removeItem('api_key');
+            window.location.href = '/login';
+            return;
+        }
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            const dataLines = [];
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length > 0) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+// Check that a recommendation is a real reply and not an error placeholder
+function isValidRecommendation(rec) {
+    const content = rec.content || '';
+    // Check if content looks like an error message (contains "Recommended reply" with persona/niches info)
+    if (content.includes('Recommended reply') && (content.includes('based on persona:') || content.includes('based on persona'))) {
+        return false; // This is likely an error placeholder, not a real recommendation
+    }
+    return true;
+}
+
+// Stream recommendations for the selected creator, fan and system prompt.
+// onRecommendation receives the list received so far each time a reply
+// completes; the final list from the "done" event is returned.
+async function streamRecommendations(onRecommendation) {
+    const received = [];
+    let finalRecommendations = null;
+
+    await fetchEventStream('/recommended_chats/stream', {
+        creator_id: selectedCreator.id,
+        fan_id: selectedFan.id,
+        system_prompt_id: selectedSystemPrompt.id,
+        chat_type: 'text'
+    }, (event, data) => {
+        if (event === 'recommendation') {
+            if (isValidRecommendation(data)) {
+                received.push(data);
+                onRecommendation(received.slice());
+            }
+        } else if (event === 'done') {
+            finalRecommendations = (data.recommendations || []).filter(isValidRecommendation);
+        } else if (event === 'error') {
+            throw new Error(data.error || 'Failed to generate recommendations');
+        }
+    });
+
+    if (!finalRecommendations) {
+        throw new Error('No recommendations received from server.');
+    }
+    return finalRecommendations;
+}
+
+// Follow next_cursor until every page of a list endpoint is loaded
+async function fetchAllPages(endpoint, key) {
+    let rows = [];
+    let cursor = null;
+    do {
+        const separator = endpoint.includes('?') ? '&' : '?';
+        const page = await fetchData(cursor ? `${endpoint}${separator}cursor=${encodeURIComponent(cursor)}` : endpoint);
+        rows = rows.concat(page[key] || []);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return rows;
+}
+
+// Load a page of fans; reset starts over (e.g. when the search changes)
+async function loadFans({ reset = false } = {}) {
+    let endpoint = '/get_fans?limit=100';
+    if (fanSearch) {
+        endpoint += `&name_prefix=${encodeURIComponent(fanSearch)}`;
+    }
+    if (!reset && fansCursor) {
+        endpoint += `&cursor=${encodeURIComponent(fansCursor)}`;
+    }
+    const page = await fetchData(endpoint);
+    fans = reset ? (page.fans || []) : fans.concat(page.fans || []);
+    // Keep the selected fan even when the current search hides it
+    if (selectedFan && !fans.some(f => f.id === selectedFan.id)) {
+        fans.unshift(selectedFan);
+    }
+    fansCursor = page.next_cursor;
+    renderFans();
+}
+
+window.loadMoreFans = function() {
+    loadFans().catch(error => {
+        showError('Failed to load fans.');
+        console.error(error);
+    });
+};
+
+window.onFanSearch = function(value) {
+    clearTimeout(fanSearchTimer);
+    fanSearchTimer = setTimeout(() => {
+        fanSearch = value.trim();
+        loadFans({ reset: true }).catch(error => {
+            showError('Failed to search fans.');
+            console.error(error);
+        });
+    }, 250);
+};
+
 // Load all data
 async function loadData() {
     try {
-        const [creatorsData, fansData, promptsData] = await Promise.all([
-            fetchData('/get_creators'),
-            fetchData('/get_fans'),
-            fetchData('/get_system_prompts')
+        const [creatorsData, promptsData] = await Promise.all([
+            fetchAllPages('/get_creators', 'creators'),
+            fetchAllPages('/get_system_prompts', 'system_prompts'),
+            loadFans({ reset: true })
         ]);
 
-        creators = creatorsData.creators || [];
-        fans = fansData.fans || [];
-        systemPrompts = promptsData.system_prompts || [];
+        creators = creatorsData;
+        systemPrompts = promptsData;
 
         renderCreators();
-        renderFans();
         renderSystemPrompts();
     } catch (error) {
         showError('Failed to load data. Please check if the Flask server is running.');
@@ -249,6 +403,14 @@ function renderFans() {
         
         container.appendChild(card);
     });
+
+    if (fansCursor) {
+        const more = document.createElement('button');
+        more.className = 'load-older-btn';
+        more.textContent = 'Load more fans';
+        more.onclick = window.loadMoreFans;
+        container.appendChild(more);
+    }
 }
 
 // Render system prompts
@@ -358,41 +520,13 @@ async function generateRecommendations() {
     recommendationsDiv.style.display = 'none';
 
     try {
-        // Call the recommended_chats API endpoint
-        const response = await fetchData('/recommended_chats', {
-            method: 'POST',
-            body: JSON.stringify({
-                creator_id: selectedCreator.id,
-                fan_id: selectedFan.id,
-                system_prompt_id: selectedSystemPrompt.id,
-                chat_type: 'text'
-            }),
-        });
-
-        // Check for error in response first
-        if (response.error) {
-            throw new Error(response.error);
-        }
+        // Stream from the recommended_chats API so each reply shows up as soon as it is ready
+        const recommendations = await streamRecommendations(partial => renderRecommendations(partial));
 
-        // Validate recommendations before displaying
-        if (response.recommendations && Array.isArray(response.recommendations) && response.recommendations.length > 0) {
-            // Filter out any recommendations that look like error messages
-            const validRecommendations = response.recommendations.filter(rec => {
-                const content = rec.content || '';
-                // Check if content looks like an error message (contains "Recommended reply" with persona/niches info)
-                if (content.includes('Recommended reply') && (content.includes('based on persona:') || content.includes('based on persona'))) {
-                    return false; // This is likely an error placeholder, not a real recommendation
-                }
-                return true;
-            });
-            
-            if (validRecommendations.length > 0) {
-                renderRecommendations(validRecommendations);
-            } else {
-                throw new Error('No valid recommendations generated. The AI service may be experiencing issues. Please try again.');
-            }
+        if (recommendations.length > 0) {
+            renderRecommendations(recommendations);
         } else {
-            throw new Error('No recommendations received from server.');
+            throw new Error('No valid recommendations generated. The AI service may be experiencing issues. Please try again.');
         }
     } catch (error) {
         showError(error.message || 'Failed to generate recommendations');
@@ -864,23 +998,80 @@ function setupModalHandlers() {
     }
 }
 
-// Load chat history
+function chatHistoryUrl(params = '') {
+    return `/get_chat_history?creator_id=${selectedCreator.id}&fan_id=${selectedFan.id}${params}`;
+}
+
+// Load the newest page of chat history
 async function loadChatHistory() {
     if (!selectedCreator || !selectedFan) {
         return;
     }
 
     try {
-        const response = await fetchData(`/get_chat_history?creator_id=${selectedCreator.id}&fan_id=${selectedFan.id}`);
+        const response = await fetchData(chatHistoryUrl());
         chatMessages = response.messages || [];
+        chatCursors = { before: response.next_before, after: response.next_after, hasOlder: response.has_more };
         renderChatMessages();
     } catch (error) {
         console.error('Error loading chat history:', error);
         chatMessages = [];
+        chatCursors = { before: null, after: null, hasOlder: false };
         renderChatMessages();
     }
 }
 
+// Prepend the page before the oldest loaded message, keeping the scroll position
+async function loadOlderMessages() {
+    if (!chatCursors.hasOlder || !chatCursors.before) {
+        return;
+    }
+
+    const container = document.getElementById('chatbot-messages');
+    const distanceFromBottom = container.scrollHeight - container.scrollTop;
+    try {
+        const response = await fetchData(chatHistoryUrl(`&before=${encodeURIComponent(chatCursors.before)}`));
+        chatMessages = mergeMessages(response.messages || [], chatMessages);
+        chatCursors.before = response.next_before;
+        chatCursors.hasOlder = response.has_more;
+        renderChatMessages({ scroll: false });
+        container.scrollTop = container.scrollHeight - distanceFromBottom;
+    } catch (error) {
+        console.error('Error loading older messages:', error);
+    }
+}
+
+// Append only the messages stored since the newest one already loaded
+async function loadNewMessages() {
+    if (!selectedCreator || !selectedFan) {
+        return;
+    }
+    if (!chatCursors.after) {
+        await loadChatHistory();
+        return;
+    }
+
+    try {
+        let hasMore = true;
+        while (hasMore) {
+            const response = await fetchData(chatHistoryUrl(`&after=${encodeURIComponent(chatCursors.after)}`));
+            chatMessages = mergeMessages(chatMessages, response.messages || []);
+            chatCursors.after = response.next_after;
+            hasMore = response.has_more;
+        }
+        renderChatMessages();
+    } catch (error) {
+        console.error('Error loading new messages:', error);
+    }
+}
+
+// Concatenate message lists, skipping ids already present (e.g. a queued
+// reply shown before the server stored it)
+function mergeMessages(first, second) {
+    const seen = new Set(first.map(msg => msg.id));
+    return first.concat(second.filter(msg => !seen.has(msg.id)));
+}
+
 // Check if both creator and fan are selected, then load chat
 function checkAndLoadChat() {
     const chatbotContainer = document.getElementById('chatbot-container');
@@ -911,7 +1102,7 @@ function checkAndLoadChat() {
 }
 
 // Render chat messages
-function renderChatMessages() {
+function renderChatMessages({ scroll = true } = {}) {
     const container = document.getElementById('chatbot-messages');
     
     if (chatMessages.length === 0) {
@@ -923,7 +1114,11 @@ function renderChatMessages() {
         return;
     }
     
-    container.innerHTML = chatMessages.map(msg => {
+    const olderButton = chatCursors.hasOlder
+        ? '<button class="load-older-btn" onclick="loadOlderMessages()">Load earlier messages</button>'
+        : '';
+    
+    container.innerHTML = olderButton + chatMessages.map(msg => {
         const sender = msg.sender || 'fan';
         const content = escapeHtml(msg.content || '');
         const time = msg.created_at ? new Date(msg.created_at).toLocaleTimeString() : '';
@@ -944,7 +1139,9 @@ function renderChatMessages() {
     }
     
     // Scroll to bottom
-    container.scrollTop = container.scrollHeight;
+    if (scroll) {
+        container.scrollTop = container.scrollHeight;
+    }
 }
 
 // Show loading indicator
@@ -973,6 +1170,15 @@ function hideLoadingIndicator() {
     }
 }
 
+// Remove the pending recommendations block from the chat
+function removePendingRecommendations() {
+    const container = document.getElementById('chatbot-messages');
+    const recommendationsDiv = container.querySelector('.recommendations-pending');
+    if (recommendationsDiv) {
+        recommendationsDiv.remove();
+    }
+}
+
 // Render pending recommendations in chat
 function renderPendingRecommendations() {
     const container = document.getElementById('chatbot-messages');
@@ -1027,8 +1233,8 @@ async function sendFanMessage() {
         // Clear input
         input.value = '';
         
-        // Reload chat history to show the new message
-        await loadChatHistory();
+        // Fetch the new message (and anything else that arrived meanwhile)
+        await loadNewMessages();
         
         // Clear any existing pending recommendations
         pendingRecommendations = null;
@@ -1074,41 +1280,20 @@ async function generateChatRecommendations() {
     }
     
     try {
-        const response = await fetchData('/recommended_chats', {
-            method: 'POST',
-            body: JSON.stringify({
-                creator_id: selectedCreator.id,
-                fan_id: selectedFan.id,
-                system_prompt_id: selectedSystemPrompt.id,
-                chat_type: 'text'
-            })
+        // Show each reply as soon as it has been generated
+        const recommendations = await streamRecommendations(partial => {
+            hideLoadingIndicator();
+            pendingRecommendations = partial;
+            removePendingRecommendations();
+            renderPendingRecommendations();
         });
-        
-        // Check for error in response first
-        if (response.error) {
-            throw new Error(response.error);
-        }
-        
-        // Validate recommendations before displaying
-        if (response.recommendations && Array.isArray(response.recommendations) && response.recommendations.length > 0) {
-            // Filter out any recommendations that look like error messages
-            const validRecommendations = response.recommendations.filter(rec => {
-                const content = rec.content || '';
-                // Check if content looks like an error message (contains "Recommended reply" with persona/niches info)
-                if (content.includes('Recommended reply') && (content.includes('based on persona:') || content.includes('based on persona'))) {
-                    return false; // This is likely an error placeholder, not a real recommendation
-                }
-                return true;
-            });
-            
-            if (validRecommendations.length > 0) {
-                pendingRecommendations = validRecommendations;
-                renderPendingRecommendations();
-            } else {
-                throw new Error('No valid recommendations generated. Please try again.');
-            }
+
+        if (recommendations.length > 0) {
+            pendingRecommendations = recommendations;
+            removePendingRecommendations();
+            renderPendingRecommendations();
         } else {
-            throw new Error('No recommendations received from server.');
+            throw new Error('No valid recommendations generated. Please try again.');
         }
     } catch (error) {
         console.error('Error generating recommendations:', error);
@@ -1171,7 +1356,7 @@ window.selectRecommendation = async function(index) {
     
     try {
         // Store selected reply
-        await fetchData('/chatter_selected_chat_reply', {
+        const stored = await fetchData('/chatter_selected_chat_reply', {
             method: 'POST',
             body: JSON.stringify({
                 fan_id: selectedFan.id,
@@ -1185,9 +1370,21 @@ window.selectRecommendation = async function(index) {
         // Clear pending recommendations
         pendingRecommendations = null;
         
-        // Hide loading and reload chat history to show the new message
+        // Hide loading and fetch the new message. A reply queued by the
+        // write-behind journal is not stored yet, so it is shown right away
+        // and the stored copy is skipped by id when it arrives.
         hideLoadingIndicator();
-        await loadChatHistory();
+        if (stored && stored.queued) {
+            chatMessages = mergeMessages(chatMessages, [{
+                id: stored.message_id,
+                sender: 'creator',
+                content: selectedRec.content,
+                created_at: new Date().toISOString()
+            }]);
+            renderChatMessages();
+        } else {
+            await loadNewMessages();
+        }
     } catch (error) {
         hideLoadingIndicator();
         showError(error.message || 'Failed to send reply');
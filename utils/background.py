@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import threading
+import traceback
+
+
+class BoundedExecutor:
+    """
+    Thread pool for fire-and-forget background jobs with a cap on queued work.
+
+    At most ``max_in_flight`` jobs may be queued or running at once; submit()
+    drops (and counts) jobs beyond that instead of letting the queue grow
+    without bound. Job failures are logged and counted, never raised.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_in_flight: int):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> bool:
+        """
+        Queue fn(*args, **kwargs) unless the in-flight cap is reached.
+
+        Returns:
+            True if the job was queued, False if it was dropped
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+        self._executor.submit(self._run, fn, args, kwargs)
+        return True
+
+    def _run(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        try:
+            fn(*args, **kwargs)
+            with self._lock:
+                self.completed += 1
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            print(f"Background job in {self.name} failed:")
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and outcome counters, for the metrics endpoint."""
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed
+            }
@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from supabase import Client
+from utils.creator import get_creators_by_ids
+from utils.fan import get_fans_by_ids
+from utils.system_prompt import get_system_prompts_by_ids
+from utils.chat_history import get_recent_chat_histories
+from utils.summaries import CONVERSATION_SUMMARIES, get_conversation_summaries
+from utils.context_builder import CONTEXT_HISTORY_LIMIT
+from utils.call_policy import parse_deadline
+from utils.chats import RecommendationContext, generate_chat_recommendations, lookup_executor, parse_generation_options
+import os
+import uuid
+
+# Mistral calls a batch runs at once (shared by all batch requests of a process)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# Largest number of items one batch request may contain
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+
+CHAT_TYPES = ("text", "image", "video")
+
+batch_executor = ThreadPoolExecutor(
+    max_workers=BATCH_MAX_CONCURRENCY,
+    thread_name_prefix="batch"
+)
+
+
+def validate_batch_item(item: Any) -> Optional[str]:
+    """Return why a batch item is invalid, or None if it can be generated."""
+    if not isinstance(item, dict):
+        return "Item must be an object"
+    if not item.get("fan_id") or not item.get("creator_id"):
+        return "fan_id and creator_id are required"
+    if not item.get("system_prompt_id"):
+        return "system_prompt_id is required"
+    # A malformed id would fail the shared in_ queries for every item
+    for key in ("fan_id", "creator_id", "system_prompt_id"):
+        try:
+            uuid.UUID(str(item[key]))
+        except ValueError:
+            return f"{key} must be a UUID"
+    if item.get("chat_type", "text") not in CHAT_TYPES:
+        return f"chat_type must be one of: {', '.join(CHAT_TYPES)}"
+    try:
+        parse_generation_options(item)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def _item_context(
+    item: Dict[str, Any],
+    creators: Dict[str, Dict[str, Any]],
+    fans: Dict[str, Dict[str, Any]],
+    system_prompts: Dict[str, Dict[str, Any]],
+    histories: Dict[Tuple[str, str], List[Dict[str, Any]]],
+    summaries: Dict[Tuple[str, str], Optional[Dict[str, Any]]]
+) -> RecommendationContext:
+    """
+    Pick an item's context out of the bulk lookups.
+
+    Raises:
+        ValueError: If the creator, fan or system prompt is not found (in
+            that order, like fetch_recommendation_context)
+    """
+    pair = (item["creator_id"], item["fan_id"])
+    creator = creators.get(item["creator_id"])
+    if creator is None:
+        raise ValueError("Creator not found")
+    fan = fans.get(item["fan_id"])
+    if fan is None:
+        raise ValueError("Fan not found")
+    system_prompt_data = system_prompts.get(item["system_prompt_id"])
+    if system_prompt_data is None:
+        raise ValueError("System prompt not found")
+    return creator, fan, system_prompt_data, histories.get(pair, []), summaries.get(pair)
+
+
+def _generate_item(deadline: Optional[float], **kwargs: Any) -> Any:
+    """
+    Generate one item on batch_executor. Without a batch deadline the item
+    gets the default REQUEST_DEADLINE_MS from when its generation starts,
+    so time spent queued behind other items does not count against it.
+    """
+    if deadline is None:
+        deadline = parse_deadline(None)
+    return generate_chat_recommendations(deadline=deadline, **kwargs)
+
+
+def generate_batch_recommendations(
+    supabase: Client,
+    items: List[Any],
+    force_refresh: bool = False,
+    deadline: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Generate recommendations for many conversations in one request.
+
+    Creators, fans, system prompts, recent chat histories and (when
+    CONVERSATION_SUMMARIES is enabled) summaries of all items are loaded with
+    a handful of in_ queries instead of one round trip per item and entity.
+    The Mistral calls then run on batch_executor, at most
+    BATCH_MAX_CONCURRENCY at a time, through the same cache and coalescing
+    as /recommended_chats. An item that fails gets its own error; the other
+    items are unaffected.
+
+    Args:
+        supabase: Supabase client instance
+        items: Request items, each with fan_id, creator_id, system_prompt_id
+            and optional chat_type, num_candidates and generation_mode
+        force_refresh: Skip the recommendation cache for every item
+        deadline: time.monotonic() by which the whole batch is needed (from
+            X-Request-Deadline-Ms); items whose generation has not finished
+            by then fail. Without one each item gets REQUEST_DEADLINE_MS
+            from when its generation starts
+
+    Returns:
+        Dictionary with "results" (one entry per item, in request order, with
+        either recommendations and metadata or an error) and the
+        "succeeded" and "failed" counts
+    """
+    results = []
+    valid = []
+    for index, item in enumerate(items):
+        result = {"index": index}
+        if isinstance(item, dict):
+            result.update({
+                "fan_id": item.get("fan_id"),
+                "creator_id": item.get("creator_id"),
+                "system_prompt_id": item.get("system_prompt_id"),
+                "chat_type": item.get("chat_type", "text")
+            })
+        error = validate_batch_item(item)
+        if error:
+            result["error"] = error
+        else:
+            valid.append((item, result))
+        results.append(result)
+
+    if valid:
+        pairs = list(dict.fromkeys((item["creator_id"], item["fan_id"]) for item, _ in valid))
+        # The bulk queries are independent, so they run concurrently too
+        creators_future = lookup_executor.submit(get_creators_by_ids, supabase, [item["creator_id"] for item, _ in valid])
+        fans_future = lookup_executor.submit(get_fans_by_ids, supabase, [item["fan_id"] for item, _ in valid])
+        system_prompts_future = lookup_executor.submit(get_system_prompts_by_ids, supabase, [item["system_prompt_id"] for item, _ in valid])
+        histories_future = lookup_executor.submit(get_recent_chat_histories, supabase, pairs, CONTEXT_HISTORY_LIMIT)
+        summaries_future = lookup_executor.submit(get_conversation_summaries, supabase, pairs) if CONVERSATION_SUMMARIES else None
+        summaries = {}
+        if summaries_future is not None:
+            try:
+                summaries = summaries_future.result()
+            except Exception as e:
+                print(f"Conversation summary lookup failed: {str(e)}")
+        try:
+            creators = creators_future.result()
+            fans = fans_future.result()
+            system_prompts = system_prompts_future.result()
+            histories = histories_future.result()
+        except Exception as e:
+            # Without the context no item can be generated, but the response
+            # keeps its per-item shape
+            for _, result in valid:
+                result["error"] = f"Lookup failed: {str(e)}"
+            valid = []
+
+        generations = []
+        for item, result in valid:
+            try:
+                context = _item_context(item, creators, fans, system_prompts, histories, summaries)
+            except ValueError as e:
+                result["error"] = str(e)
+                continue
+            num_candidates, generation_mode = parse_generation_options(item)
+            generations.append((result, batch_executor.submit(
+                _generate_item,
+                deadline,
+                supabase=supabase,
+                creator_id=item["creator_id"],
+                fan_id=item["fan_id"],
+                system_prompt_id=item["system_prompt_id"],
+                chat_type=item.get("chat_type", "text"),
+                force_refresh=force_refresh,
+                prefetched_context=context,
+                num_candidates=num_candidates,
+                generation_mode=generation_mode
+            )))
+
+        for result, future in generations:
+            try:
+                recommendation_set = future.result()
+            except Exception as e:
+                result["error"] = str(e)
+                continue
+            result["recommendations"] = recommendation_set.recommendations
+            result["metadata"] = recommendation_set.metadata
+
+    failed = sum(1 for result in results if "error" in result)
+    return {
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed
+    }
@@ -0,0 +1,120 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple
+from supabase import Client
+from postgrest.exceptions import APIError
+from utils.cache import TTLCache, MISSING
+import httpx
+import os
+
+# Ids per in_ filter, so request URLs stay well below proxy limits
+IN_FILTER_CHUNK_SIZE = int(os.getenv("IN_FILTER_CHUNK_SIZE", "100"))
+
+
+def chunks(values: List[Any], size: int = IN_FILTER_CHUNK_SIZE) -> Iterator[List[Any]]:
+    """Split a list into consecutive slices of at most size items."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def get_rows_by_ids(supabase: Client, table: str, ids: Iterable[str], cache: TTLCache) -> Dict[str, Dict[str, Any]]:
+    """
+    Load rows by id with as few round trips as possible.
+    
+    Rows already in the cache are returned from it; the rest are loaded with
+    one in_ query per IN_FILTER_CHUNK_SIZE ids and written to the cache.
+    
+    Args:
+        supabase: Supabase client instance
+        table: Table to read
+        ids: Row ids to load (duplicates are ignored)
+        cache: Entity cache keyed by id
+        
+    Returns:
+        Dictionary of id to row; ids that don't exist are left out
+    """
+    rows = {}
+    missing = []
+    for row_id in dict.fromkeys(ids):
+        row = cache.get(row_id)
+        if row is MISSING:
+            missing.append(row_id)
+        else:
+            rows[row_id] = row
+    for id_chunk in chunks(missing):
+        response = supabase.table(table).select("*").in_("id", id_chunk).execute()
+        for row in response.data or []:
+            rows[row["id"]] = row
+            cache.set(row["id"], row)
+    return rows
+
+
+def write_error_status(error: Exception) -> Optional[int]:
+    """
+    HTTP status PostgREST answered a failed write with, from its error code.
+    
+    APIError carries the Postgres SQLSTATE or PostgREST's own PGRSTnnn code
+    (the bare HTTP status when the body had none), mapped the way PostgREST
+    maps them. None when the request never got an answer.
+    """
+    if not isinstance(error, APIError):
+        return None
+    code = str(error.code or "")
+    if len(code) == 3 and code.isdigit():
+        return int(code)
+    if code.startswith("PGRST"):
+        return {"0": 503, "1": 400, "2": 400, "3": 401}.get(code[5:6], 500)
+    if code == "42501":
+        return 403
+    if code[:2] == "23":
+        return 409
+    if code[:2] in ("22", "42"):
+        return 400
+    return 500
+
+
+def is_rejected_write(error: Exception) -> bool:
+    """Whether a write failed because of the rows sent (a 4xx other than auth, timeout or rate limit): sending them again cannot succeed."""
+    status = write_error_status(error)
+    return status is not None and 400 <= status < 500 and status not in (401, 403, 408, 429)
+
+
+def is_transient_write_error(error: Exception) -> bool:
+    """Whether a write may succeed if sent again (connection failures, timeouts, rate limits, 5xx)."""
+    if isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+        return True
+    status = write_error_status(error)
+    return status is not None and (status >= 500 or status in (408, 429))
+
+
+def insert_isolating_rejects(insert: Callable[[List[Dict[str, Any]]], Any], rows: List[Dict[str, Any]]) -> List[Tuple[int, Exception]]:
+    """
+    Insert rows, splitting the batch around the rows the database rejects.
+    
+    A rejected batch is halved until each failing row is on its own, so one
+    bad row costs about 2 * log2(len(rows)) extra requests and every other
+    row is still written. Inserts must be idempotent (upserts on id): halves
+    of a batch that failed are sent again.
+    
+    Args:
+        insert: Writes a list of rows, raising on failure
+        rows: Rows to write
+        
+    Returns:
+        (index in rows, error) of each rejected row
+        
+    Raises:
+        Exception: Any error other than a rejection (see is_rejected_write)
+    """
+    if not rows:
+        return []
+    try:
+        insert(rows)
+        return []
+    except Exception as e:
+        if not is_rejected_write(e):
+            raise
+        if len(rows) == 1:
+            return [(0, e)]
+    middle = len(rows) // 2
+    rejected = insert_isolating_rejects(insert, rows[:middle])
+    rejected += [(middle + index, error) for index, error in insert_isolating_rejects(insert, rows[middle:])]
+    return rejected
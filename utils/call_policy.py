@@ -0,0 +1,322 @@
+"""
+Retries, hedging and deadlines for Mistral calls.
+
+A call is retried with full-jitter exponential backoff when Mistral answers
+429 or 5xx or the connection fails. With hedging on, a second identical
+request is sent when the first has not answered within the recent
+MISTRAL_HEDGE_PERCENTILE latency, and whichever finishes first wins. Every
+attempt is bounded by the caller's deadline, and no retry or hedge starts
+once the deadline would be passed.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from mistralai.models.sdkerror import SDKError
+import asyncio
+import httpx
+import os
+import random
+import threading
+import time
+
+T = TypeVar("T")
+
+# Attempts after the first, and the backoff bounds in seconds
+MISTRAL_MAX_RETRIES = int(os.getenv("MISTRAL_MAX_RETRIES", "2"))
+MISTRAL_RETRY_BASE_DELAY = float(os.getenv("MISTRAL_RETRY_BASE_DELAY", "0.25"))
+MISTRAL_RETRY_MAX_DELAY = float(os.getenv("MISTRAL_RETRY_MAX_DELAY", "4"))
+
+# Opt-in: send a second request when the first is slower than the recent
+# MISTRAL_HEDGE_PERCENTILE latency (but waits at least
+# MISTRAL_HEDGE_MIN_DELAY seconds, and MISTRAL_HEDGE_DEFAULT_DELAY until
+# MISTRAL_HEDGE_MIN_SAMPLES calls have been measured). A hedge costs the
+# tokens of a second generation.
+MISTRAL_HEDGE = os.getenv("MISTRAL_HEDGE", "false").lower() in ("1", "true", "yes")
+MISTRAL_HEDGE_PERCENTILE = float(os.getenv("MISTRAL_HEDGE_PERCENTILE", "95"))
+MISTRAL_HEDGE_MIN_DELAY = float(os.getenv("MISTRAL_HEDGE_MIN_DELAY", "0.5"))
+MISTRAL_HEDGE_DEFAULT_DELAY = float(os.getenv("MISTRAL_HEDGE_DEFAULT_DELAY", "3"))
+MISTRAL_HEDGE_MIN_SAMPLES = int(os.getenv("MISTRAL_HEDGE_MIN_SAMPLES", "20"))
+
+# Deadline of a recommendation request when the client does not send
+# X-Request-Deadline-Ms (0 = none)
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "30000"))
+REQUEST_DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Runs the attempts of hedged sync calls; a losing attempt finishes here in
+# the background (a sync request cannot be cancelled)
+hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MISTRAL_HEDGE_MAX_WORKERS", "32")),
+    thread_name_prefix="hedge"
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before Mistral answered."""
+
+
+def parse_deadline(value: Optional[str]) -> Optional[float]:
+    """
+    Turn an X-Request-Deadline-Ms header into a time.monotonic() deadline.
+
+    Args:
+        value: Milliseconds the client will wait, from now; REQUEST_DEADLINE_MS
+            when missing
+
+    Returns:
+        Deadline, or None when there is none
+
+    Raises:
+        ValueError: If the header is not a positive integer
+    """
+    if value is None or value == "":
+        return time.monotonic() + REQUEST_DEADLINE_MS / 1000 if REQUEST_DEADLINE_MS > 0 else None
+    try:
+        milliseconds = int(value)
+    except ValueError:
+        raise ValueError(f"{REQUEST_DEADLINE_HEADER} must be an integer")
+    if milliseconds <= 0:
+        raise ValueError(f"{REQUEST_DEADLINE_HEADER} must be positive")
+    return time.monotonic() + milliseconds / 1000
+
+
+def remaining_seconds(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until a deadline (None when there is none)."""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call may succeed if sent again (rate limits, server errors, connection failures)."""
+    if isinstance(error, SDKError):
+        return getattr(error, "status_code", None) in RETRYABLE_STATUS
+    return isinstance(error, (httpx.TransportError, httpx.TimeoutException))
+
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter backoff before retry number attempt + 1, at least the server's Retry-After."""
+    delay = random.uniform(0, min(MISTRAL_RETRY_MAX_DELAY, MISTRAL_RETRY_BASE_DELAY * (2 ** attempt)))
+    raw_response = getattr(error, "raw_response", None)
+    retry_after = getattr(raw_response, "headers", {}).get("Retry-After") if raw_response is not None else None
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+class CallPolicy:
+    """
+    Retry, hedging and deadline policy for one kind of call, with its latency
+    window and counters.
+    """
+
+    def __init__(self, name: str, window: int = 500):
+        self.name = name
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.failures = 0
+
+    def _record(self, elapsed: float) -> None:
+        with self._lock:
+            self._latencies.append(elapsed)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Latency percentile in seconds over the recent successful calls (None without samples)."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first attempt before hedging."""
+        with self._lock:
+            samples = len(self._latencies)
+        if samples < MISTRAL_HEDGE_MIN_SAMPLES:
+            return MISTRAL_HEDGE_DEFAULT_DELAY
+        return max(MISTRAL_HEDGE_MIN_DELAY, self.percentile(MISTRAL_HEDGE_PERCENTILE))
+
+    def _deadline_exceeded(self, error: Optional[Exception] = None) -> DeadlineExceeded:
+        self._count("deadline_exceeded")
+        message = f"Deadline exceeded waiting for {self.name}"
+        return DeadlineExceeded(f"{message}: {str(error)}" if error else message)
+
+    def _timeout_ms(self, deadline: Optional[float]) -> Optional[int]:
+        remaining = remaining_seconds(deadline)
+        if remaining is None:
+            return None
+        if remaining <= 0:
+            raise self._deadline_exceeded()
+        return max(1, int(remaining * 1000))
+
+    def _attempt(self, call: Callable[[Optional[int]], T], deadline: Optional[float]) -> T:
+        started = time.monotonic()
+        result = call(self._timeout_ms(deadline))
+        self._record(time.monotonic() - started)
+        return result
+
+    def _hedged(self, call: Callable[[Optional[int]], T], deadline: Optional[float]) -> T:
+        first = hedge_executor.submit(self._attempt, call, deadline)
+        remaining = remaining_seconds(deadline)
+        hedge_delay = self.hedge_delay()
+        done, _ = wait([first], timeout=hedge_delay if remaining is None else min(hedge_delay, remaining))
+        if done:
+            return first.result()
+        if deadline is not None and remaining_seconds(deadline) <= 0:
+            raise self._deadline_exceeded()
+
+        self._count("hedges")
+        second = hedge_executor.submit(self._attempt, call, deadline)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=remaining_seconds(deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                raise self._deadline_exceeded()
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is second:
+                    self._count("hedge_wins")
+                return result
+        raise error
+
+    def call(self, call: Callable[[Optional[int]], T], deadline: Optional[float] = None, hedge: bool = MISTRAL_HEDGE) -> T:
+        """
+        Run a Mistral call under the policy.
+
+        Args:
+            call: Sends the request; receives the attempt's timeout in
+                milliseconds (None without a deadline), e.g. for timeout_ms
+            deadline: time.monotonic() by which the result is needed
+            hedge: Whether a slow attempt may be hedged (off for calls that
+                must not run twice, like opening a stream)
+
+        Returns:
+            The first successful result
+
+        Raises:
+            DeadlineExceeded: If the deadline passed first
+            Exception: The last error when it is not retryable or the retries
+                are used up
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(call, deadline) if hedge else self._attempt(call, deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if deadline is not None and remaining_seconds(deadline) <= 0:
+                    raise self._deadline_exceeded(e) from e
+                if not is_retryable(e) or attempt >= MISTRAL_MAX_RETRIES:
+                    self._count("failures")
+                    raise
+                delay = retry_delay(attempt, e)
+                if deadline is not None and remaining_seconds(deadline) <= delay:
+                    raise self._deadline_exceeded(e) from e
+                self._count("retries")
+                print(f"{self.name} call failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    async def _aattempt(self, call: Callable[[Optional[int]], Awaitable[T]], deadline: Optional[float]) -> T:
+        started = time.monotonic()
+        result = await call(self._timeout_ms(deadline))
+        self._record(time.monotonic() - started)
+        return result
+
+    async def _ahedged(self, call: Callable[[Optional[int]], Awaitable[T]], deadline: Optional[float]) -> T:
+        first = asyncio.ensure_future(self._aattempt(call, deadline))
+        remaining = remaining_seconds(deadline)
+        hedge_delay = self.hedge_delay()
+        done, _ = await asyncio.wait([first], timeout=hedge_delay if remaining is None else min(hedge_delay, remaining))
+        if done:
+            return first.result()
+        if deadline is not None and remaining_seconds(deadline) <= 0:
+            first.cancel()
+            raise self._deadline_exceeded()
+
+        self._count("hedges")
+        second = asyncio.ensure_future(self._aattempt(call, deadline))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=remaining_seconds(deadline), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise self._deadline_exceeded()
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if task is second:
+                        self._count("hedge_wins")
+                    return result
+            raise error
+        finally:
+            # Unlike threads, the losing request can be cancelled
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, call: Callable[[Optional[int]], Awaitable[T]], deadline: Optional[float] = None, hedge: bool = MISTRAL_HEDGE) -> T:
+        """Async variant of call (the losing hedged attempt is cancelled)."""
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                return await (self._ahedged(call, deadline) if hedge else self._aattempt(call, deadline))
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if deadline is not None and remaining_seconds(deadline) <= 0:
+                    raise self._deadline_exceeded(e) from e
+                if not is_retryable(e) or attempt >= MISTRAL_MAX_RETRIES:
+                    self._count("failures")
+                    raise
+                delay = retry_delay(attempt, e)
+                if deadline is not None and remaining_seconds(deadline) <= delay:
+                    raise self._deadline_exceeded(e) from e
+                self._count("retries")
+                print(f"{self.name} call failed ({str(e)}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and latency percentiles, for the metrics endpoint."""
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        hedge_delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "hedging": MISTRAL_HEDGE,
+                "calls": self.calls,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "deadline_exceeded": self.deadline_exceeded,
+                "failures": self.failures,
+                "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "hedge_delay_ms": round(hedge_delay * 1000, 1) if MISTRAL_HEDGE else None
+            }
+
+
+recommendation_policy = CallPolicy("recommendation")
+summary_policy = CallPolicy("summary")
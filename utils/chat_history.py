@@ -0,0 +1,282 @@
+from datetime import datetime
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple
+from supabase import AsyncClient, Client
+from utils.bulk import chunks
+import base64
+import os
+import uuid
+
+# Rows one bulk history query may return; matches PostgREST's default max-rows
+HISTORY_BULK_MAX_ROWS = int(os.getenv("HISTORY_BULK_MAX_ROWS", "1000"))
+
+# Messages per /get_chat_history page when no limit is given, and the largest
+# limit accepted
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "100"))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", "500"))
+
+
+class HistoryPage(NamedTuple):
+    """One page of a conversation, oldest first, with cursors to the neighbouring pages."""
+    messages: List[Dict[str, Any]]
+    has_more: bool
+    next_before: Optional[str]
+    next_after: Optional[str]
+
+
+def get_recent_chat_history(
+    supabase: Client,
+    creator_id: str,
+    fan_id: str,
+    limit: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    Helper function to get the most recent messages between a creator and fan.
+
+    Args:
+        supabase: Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        limit: Maximum number of messages to fetch
+
+    Returns:
+        List of chat message dictionaries, newest first (empty if the pair
+        hasn't started conversing yet)
+    """
+    chat_history_response = supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id).order("created_at", desc=True).limit(limit).execute()
+    return chat_history_response.data if chat_history_response.data else []
+
+
+async def aget_recent_chat_history(
+    supabase: AsyncClient,
+    creator_id: str,
+    fan_id: str,
+    limit: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    Async variant of get_recent_chat_history.
+
+    Args:
+        supabase: Async Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        limit: Maximum number of messages to fetch
+
+    Returns:
+        List of chat message dictionaries, newest first
+    """
+    chat_history_response = await supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id).order("created_at", desc=True).limit(limit).execute()
+    return chat_history_response.data if chat_history_response.data else []
+
+
+def get_recent_chat_histories(
+    supabase: Client,
+    pairs: List[Tuple[str, str]],
+    limit: int = 10
+) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """
+    Helper function to get the most recent messages of many conversations.
+    
+    Conversations are loaded in groups with in_ filters, sized so a group's
+    messages fit in HISTORY_BULK_MAX_ROWS rows. If a group hits that row
+    limit, conversations that came back short are re-read one by one.
+    
+    Args:
+        supabase: Supabase client instance
+        pairs: (creator_id, fan_id) of each conversation
+        limit: Maximum number of messages per conversation
+        
+    Returns:
+        Dictionary of (creator_id, fan_id) to chat messages, newest first
+    """
+    histories = {pair: [] for pair in pairs}
+    group_size = max(1, HISTORY_BULK_MAX_ROWS // max(1, limit))
+    for group in chunks(list(histories), group_size):
+        row_limit = min(len(group) * limit, HISTORY_BULK_MAX_ROWS)
+        chat_history_response = supabase.table("of_chat_message").select("*").in_("creator_id", sorted({creator_id for creator_id, _ in group})).in_("fan_id", sorted({fan_id for _, fan_id in group})).order("created_at", desc=True).limit(row_limit).execute()
+        rows = chat_history_response.data or []
+        for chat in rows:
+            history = histories.get((chat.get("creator_id"), chat.get("fan_id")))
+            # Other creator/fan combinations of the in_ filters are ignored
+            if history is not None and len(history) < limit:
+                history.append(chat)
+        if len(rows) >= row_limit:
+            for pair in group:
+                if len(histories[pair]) < limit:
+                    histories[pair] = get_recent_chat_history(supabase, pair[0], pair[1], limit)
+    return histories
+
+
+def get_chat_history(supabase: Client, creator_id: str, fan_id: str) -> List[Dict[str, Any]]:
+    """
+    Helper function to get the full conversation between a creator and fan.
+
+    Args:
+        supabase: Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+
+    Returns:
+        List of chat message dictionaries, oldest first
+    """
+    chat_history_response = supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id).order("created_at", desc=False).execute()
+    return chat_history_response.data if chat_history_response.data else []
+
+
+async def aget_chat_history(supabase: AsyncClient, creator_id: str, fan_id: str) -> List[Dict[str, Any]]:
+    """
+    Async variant of get_chat_history.
+
+    Args:
+        supabase: Async Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+
+    Returns:
+        List of chat message dictionaries, oldest first
+    """
+    chat_history_response = await supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id).order("created_at", desc=False).execute()
+    return chat_history_response.data if chat_history_response.data else []
+
+
+def history_page_fingerprint(page: HistoryPage) -> str:
+    """
+    Cheap fingerprint of a page for its ETag.
+
+    Messages are never updated in place, so the ids on the page plus its
+    has_more flag and cursors determine the whole response body.
+    """
+    return "|".join([str(chat.get("id") or "") for chat in page.messages] + [str(page.has_more), page.next_before or "", page.next_after or ""])
+
+
+def encode_history_cursor(chat: Dict[str, Any]) -> str:
+    """Opaque cursor for a message's (created_at, id) position."""
+    return base64.urlsafe_b64encode(f"{chat['created_at']}|{chat['id']}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a cursor from encode_history_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, chat_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8").split("|", 1)
+        datetime.fromisoformat(created_at)
+        chat_id = str(uuid.UUID(chat_id))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, chat_id
+
+
+def _history_page_query(query: Any, limit: int, before: Optional[str], after: Optional[str], since: Optional[str]) -> Tuple[Any, bool]:
+    """
+    Apply the keyset filter and ordering of a history page to a query.
+
+    Rows are ordered by (created_at, id), so messages sharing a timestamp
+    keep a fixed order and a cursor points between two exact rows; rows
+    inserted after a cursor was issued never shift the pages before it.
+
+    Returns:
+        Tuple of (query, whether it reads newest first)
+    """
+    if sum(value is not None for value in (before, after, since)) > 1:
+        raise ValueError("Use only one of before, after and since")
+    descending = after is None and since is None
+    if before is not None:
+        created_at, chat_id = decode_history_cursor(before)
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{chat_id})')
+    elif after is not None:
+        created_at, chat_id = decode_history_cursor(after)
+        query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{chat_id})')
+    elif since is not None:
+        try:
+            since = datetime.fromisoformat(since).isoformat()
+        except ValueError:
+            raise ValueError("since must be an ISO 8601 timestamp")
+        query = query.gt("created_at", since)
+    # One extra row tells whether there is another page
+    return query.order("created_at", desc=descending).order("id", desc=descending).limit(limit + 1), descending
+
+
+def _history_page(rows: List[Dict[str, Any]], limit: int, descending: bool, before: Optional[str], after: Optional[str]) -> HistoryPage:
+    has_more = len(rows) > limit
+    messages = rows[:limit]
+    if descending:
+        messages.reverse()
+    return HistoryPage(
+        messages=messages,
+        has_more=has_more,
+        next_before=encode_history_cursor(messages[0]) if messages else before,
+        next_after=encode_history_cursor(messages[-1]) if messages else after
+    )
+
+
+def get_chat_history_page(
+    supabase: Client,
+    creator_id: str,
+    fan_id: str,
+    limit: int = CHAT_HISTORY_PAGE_SIZE,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[str] = None
+) -> HistoryPage:
+    """
+    Helper function to get one page of a conversation with keyset pagination.
+
+    Without a cursor the newest messages are returned. before pages back in
+    time from a cursor; after and since return messages newer than a cursor
+    or a timestamp, for fetching only what arrived since the last call.
+
+    Args:
+        supabase: Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        limit: Maximum number of messages in the page
+        before: Cursor; return messages older than it
+        after: Cursor; return messages newer than it
+        since: ISO 8601 timestamp; return messages created after it
+
+    Returns:
+        HistoryPage with messages oldest first. has_more tells whether more
+        messages exist in the direction being paged (older without a cursor
+        or with before, newer with after or since).
+
+    Raises:
+        ValueError: If a cursor or timestamp is invalid or more than one of
+            before, after and since is given
+    """
+    query = supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id)
+    query, descending = _history_page_query(query, limit, before, after, since)
+    chat_history_response = query.execute()
+    return _history_page(chat_history_response.data or [], limit, descending, before, after)
+
+
+async def aget_chat_history_page(
+    supabase: AsyncClient,
+    creator_id: str,
+    fan_id: str,
+    limit: int = CHAT_HISTORY_PAGE_SIZE,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[str] = None
+) -> HistoryPage:
+    """
+    Async variant of get_chat_history_page.
+
+    Args:
+        supabase: Async Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        limit: Maximum number of messages in the page
+        before: Cursor; return messages older than it
+        after: Cursor; return messages newer than it
+        since: ISO 8601 timestamp; return messages created after it
+
+    Returns:
+        HistoryPage with messages oldest first
+    """
+    query = supabase.table("of_chat_message").select("*").eq("fan_id", fan_id).eq("creator_id", creator_id)
+    query, descending = _history_page_query(query, limit, before, after, since)
+    chat_history_response = await query.execute()
+    return _history_page(chat_history_response.data or [], limit, descending, before, after)
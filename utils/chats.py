@@ -1,15 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, List, Any
-from utils.creator import get_creator_by_id
-from utils.fan import get_fan_by_id
-from utils.system_prompt import get_system_prompt_by_id
-from supabase import Client
-from mistralai import Mistral
+from typing import Dict, List, Any, Iterator, NamedTuple, Optional, Tuple
+from utils.creator import get_creator_by_id, aget_creator_by_id
+from utils.fan import get_fan_by_id, aget_fan_by_id
+from utils.system_prompt import get_system_prompt_by_id, aget_system_prompt_by_id
+from utils.chat_history import get_recent_chat_history, aget_recent_chat_history
+from utils.summaries import CONVERSATION_SUMMARIES, get_conversation_summary, aget_conversation_summary, record_history_window
+from utils.context_builder import CONTEXT_HISTORY_LIMIT, message_tokens, pack_history, prefix_hash, record_prefix, token_budget
+from utils.tokenizer import count_tokens, tokenizer_name
+from utils.prompt_template import compile_template
+from utils.examples import ExampleIndex, creator_example_index, format_example_pairs, latest_fan_message, parse_example_pairs
+from utils.reply_parser import ReplyParser, clean_single_reply, parse_replies
+from utils.recommendation_cache import recommendation_cache_key, get_cached_recommendations, cache_recommendations
+from utils.singleflight import SingleFlight, AsyncSingleFlight
+from supabase import AsyncClient, Client
+from utils.http_clients import mistral_client
+from utils.call_policy import DeadlineExceeded, recommendation_policy, remaining_seconds
+from utils.model_router import ModelRouter, RouteDecision
 from mistralai.models.sdkerror import SDKError
+import asyncio
 import os
-import re
 
-mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
+# Bounded pool for the PostgREST lookups that run before every Mistral call
+lookup_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LOOKUP_MAX_WORKERS", "16")),
+    thread_name_prefix="lookup"
+)
+
+# Coalesces concurrent identical recommendation requests; followers give up
+# after RECOMMENDATION_COALESCE_TIMEOUT seconds if the leader is stuck
+recommendation_flight = SingleFlight(
+    name="recommendation",
+    timeout=float(os.getenv("RECOMMENDATION_COALESCE_TIMEOUT", "30"))
+)
+async_recommendation_flight = AsyncSingleFlight(
+    name="recommendation",
+    timeout=float(os.getenv("RECOMMENDATION_COALESCE_TIMEOUT", "30"))
+)
 
 # Sample conversations for AI training examples
 SAMPLE_CONVERSATIONS = """fan: I'm definitely interested in you
@@ -103,11 +130,121 @@ fan: Yes all the time baby
 creator: Mmm baby, I just wanna be your nasty little slutt tonight 😈 you ready to play with me? 🙈"""
 
 
+# Built once at startup; per-creator indexes extend it (see utils.examples)
+default_example_index = ExampleIndex(parse_example_pairs(SAMPLE_CONVERSATIONS))
+
+# Few-shot settings for system prompts without few_shot_k / few_shot_source.
+# Without a k the whole SAMPLE_CONVERSATIONS block is sent.
+FEW_SHOT_K = os.getenv("FEW_SHOT_K")
+FEW_SHOT_SOURCE = os.getenv("FEW_SHOT_SOURCE", "default")
+
+
+def select_few_shot_examples(
+    system_prompt_data: Dict[str, Any],
+    creator: Dict[str, Any],
+    chat_history: List[Dict[str, Any]]
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Pick the sample conversations to show the model.
+    
+    The system prompt's few_shot_k and few_shot_source columns (falling back
+    to FEW_SHOT_K and FEW_SHOT_SOURCE) select how many pairs to send and from
+    which set: "default" (SAMPLE_CONVERSATIONS) or "creator" (plus the
+    creator's example file). With a k, the pairs whose fan message is most
+    similar to the fan's latest message are retrieved.
+    
+    Args:
+        system_prompt_data: System prompt data dictionary
+        creator: Creator data dictionary
+        chat_history: List of chat message dictionaries
+    
+    Returns:
+        Tuple of (formatted examples, details for the response metadata)
+    """
+    k = system_prompt_data.get("few_shot_k")
+    if k is None and FEW_SHOT_K:
+        k = int(FEW_SHOT_K)
+    source = system_prompt_data.get("few_shot_source") or FEW_SHOT_SOURCE
+    
+    index = default_example_index
+    if source == "creator" and creator.get("id"):
+        index = creator_example_index(creator["id"], default_example_index)
+    
+    if k is None and index is default_example_index:
+        examples = SAMPLE_CONVERSATIONS
+        selected = len(index)
+    else:
+        pairs = index.top_k(latest_fan_message(chat_history) or "", len(index) if k is None else int(k))
+        examples = format_example_pairs(pairs)
+        selected = len(pairs)
+    return examples, {
+        "few_shot_source": source,
+        "few_shot_examples": selected,
+        "few_shot_available": len(index),
+        "few_shot_retrieved": k is not None
+    }
+
+
+def _format_list_value(value: Any, empty: str) -> str:
+    """Format a list (comma-separated) or scalar creator field as a string."""
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value) if value else empty
+    return str(value) if value else empty
+
+
+def _format_chat_logs(chat_history: List[Dict[str, Any]]) -> str:
+    """Format chat history as one "[role]: content" line per message."""
+    if not chat_history:
+        return "No previous chat history."
+    chat_logs = []
+    for chat in chat_history:
+        role = chat.get("role", chat.get("sender", "unknown"))
+        content = chat.get("content", chat.get("message", ""))
+        chat_logs.append(f"[{role}]: {content}")
+    return "\n".join(chat_logs)
+
+
+def _format_conversation_summary(summary: Optional[Dict[str, Any]]) -> str:
+    """Return the rolling summary text of a conversation, or a placeholder."""
+    if not summary or not summary.get("summary"):
+        return "No earlier conversation summary."
+    return summary["summary"]
+
+
+# Builders for every supported template variable. Only the placeholders a
+# compiled template actually uses are computed.
+TEMPLATE_VARIABLES = {
+    "creator_name": lambda creator, fan, chat_history, summary: str(creator.get("name", creator.get("creator_name", "Creator"))),
+    "fan_name": lambda creator, fan, chat_history, summary: str(fan.get("name", fan.get("fan_name", "Fan"))),
+    "lifetime_spend": lambda creator, fan, chat_history, summary: str(fan.get("lifetime_spend", 0)),
+    "creator_niche": lambda creator, fan, chat_history, summary: _format_list_value(creator.get("niches", []), "None"),
+    "creator_personality": lambda creator, fan, chat_history, summary: _format_list_value(creator.get("persona", []), "None"),
+    "emojis_enabled": lambda creator, fan, chat_history, summary: "Yes" if creator.get("emojis_enabled", False) else "No",
+    "nsfw_enabled": lambda creator, fan, chat_history, summary: "Yes" if creator.get("nsfw", False) else "No",
+    "emojis_used": lambda creator, fan, chat_history, summary: _format_list_value(creator.get("emojis_used", ""), ""),
+    "chat logs": lambda creator, fan, chat_history, summary: _format_chat_logs(chat_history),
+    "conversation_summary": lambda creator, fan, chat_history, summary: _format_conversation_summary(summary)
+}
+
+
+# Template variables grouped by how often their values change, for the
+# stable prefix layout (most static first)
+CREATOR_VARIABLES = ("creator_name", "creator_niche", "creator_personality", "emojis_enabled", "nsfw_enabled", "emojis_used")
+FAN_VARIABLES = ("fan_name", "lifetime_spend")
+CONVERSATION_VARIABLES = ("conversation_summary", "chat logs")
+
+# "template" renders the system prompt as written with the sample
+# conversations appended; "stable_prefix" uses render_stable_prefix_prompt
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "template")
+
+
 def replace_template_variables(
     template: str,
     creator: Dict[str, Any],
     fan: Dict[str, Any],
-    chat_history: List[Dict[str, Any]]
+    chat_history: List[Dict[str, Any]],
+    prompt_id: Optional[str] = None,
+    conversation_summary: Optional[Dict[str, Any]] = None
 ) -> str:
     """
     Replace template variables in system prompt with actual values.
@@ -122,278 +259,834 @@ def replace_template_variables(
     - {{nsfw_enabled}} - Whether NSFW is allowed (Yes/No)
     - {{emojis_used}} - Emojis to use
     - {{chat logs}} - Formatted chat history
+    - {{conversation_summary}} - Rolling summary of messages older than the chat history
+    
+    The template is compiled once per prompt id and content hash, and only
+    the variables it uses are computed.
     
     Args:
         template: System prompt template with {{variables}}
         creator: Creator data dictionary
         fan: Fan data dictionary
         chat_history: List of chat message dictionaries
+        prompt_id: ID of the system prompt the template belongs to
+        conversation_summary: Summary row of the conversation, if any
         
     Returns:
         System prompt with variables replaced
     """
-    # Extract values from creator
-    creator_name = creator.get("name", creator.get("creator_name", "Creator"))
-    creator_niches = creator.get("niches", [])
-    creator_persona = creator.get("persona", [])
-    emojis_enabled = creator.get("emojis_enabled", False)
-    emojis_used = creator.get("emojis_used", "")
-    nsfw_enabled = creator.get("nsfw", False)
-    
-    # Extract values from fan
-    fan_name = fan.get("name", fan.get("fan_name", "Fan"))
-    lifetime_spend = fan.get("lifetime_spend", 0)
-    
-    # Format creator niches (handle list or string)
-    if isinstance(creator_niches, list):
-        creator_niche_str = ", ".join(str(item) for item in creator_niches) if creator_niches else "None"
-    else:
-        creator_niche_str = str(creator_niches) if creator_niches else "None"
+    compiled = compile_template(template, prompt_id)
+    values = {
+        name: TEMPLATE_VARIABLES[name](creator, fan, chat_history, conversation_summary)
+        for name in compiled.placeholders
+        if name in TEMPLATE_VARIABLES
+    }
+    return compiled.render(values)
+
+
+def render_stable_prefix_prompt(
+    template: str,
+    creator: Dict[str, Any],
+    fan: Dict[str, Any],
+    chat_history: List[Dict[str, Any]],
+    prompt_id: Optional[str] = None,
+    conversation_summary: Optional[Dict[str, Any]] = None,
+    examples: str = SAMPLE_CONVERSATIONS,
+    examples_vary: bool = False
+) -> Tuple[str, str, str]:
+    """
+    Render the system prompt ordered from most static to most dynamic.
     
-    # Format creator personality (handle list or string)
-    if isinstance(creator_persona, list):
-        creator_personality_str = ", ".join(str(item) for item in creator_persona) if creator_persona else "None"
-    else:
-        creator_personality_str = str(creator_persona) if creator_persona else "None"
+    The template's placeholders are replaced by references such as
+    [creator_name], and their values follow in sections: instructions,
+    sample conversations, creator profile, fan context, then conversation
+    summary and chat logs. Requests for the same system prompt then share a
+    byte-identical prefix up to the creator profile, and requests for the
+    same creator up to the fan context, so provider-side prefix caching can
+    reuse it. Examples retrieved for the current message (examples_vary)
+    are placed after the fan context instead, so they don't break the prefix.
     
-    # Format emojis_used (handle list or string)
-    if isinstance(emojis_used, list):
-        emojis_used_str = ", ".join(str(item) for item in emojis_used) if emojis_used else ""
-    else:
-        emojis_used_str = str(emojis_used) if emojis_used else ""
-    
-    # Format chat logs
-    if chat_history:
-        chat_logs = []
-        for chat in chat_history:
-            # Format each chat message
-            role = chat.get("role", chat.get("sender", "unknown"))
-            content = chat.get("content", chat.get("message", ""))
-            timestamp = chat.get("created_at", "")
-            chat_logs.append(f"[{role}]: {content}")
-        chat_logs_str = "\n".join(chat_logs)
-    else:
-        chat_logs_str = "No previous chat history."
-    
-    # Replace template variables (ensure all values are strings)
-    replacements = {
-        "{{creator_name}}": str(creator_name),
-        "{{fan_name}}": str(fan_name),
-        "{{lifetime_spend}}": str(lifetime_spend),
-        "{{creator_niche}}": str(creator_niche_str),
-        "{{creator_personality}}": str(creator_personality_str),
-        "{{emojis_enabled}}": "Yes" if emojis_enabled else "No",
-        "{{nsfw_enabled}}": "Yes" if nsfw_enabled else "No",
-        "{{emojis_used}}": str(emojis_used_str),
-        "{{chat logs}}": str(chat_logs_str)
-    }
+    Args:
+        template: System prompt template with {{variables}}
+        creator: Creator data dictionary
+        fan: Fan data dictionary
+        chat_history: List of chat message dictionaries
+        prompt_id: ID of the system prompt the template belongs to
+        conversation_summary: Summary row of the conversation, if any
+        examples: Sample conversations to include
+        examples_vary: Whether examples depend on the current message
+        
+    Returns:
+        Tuple of (system prompt, static prefix shared by every request for
+        the template, prefix shared by every request for the creator)
+    """
+    compiled = compile_template(template, prompt_id)
+    placeholders = compiled.placeholders
     
-    # Perform replacements
-    result = template
-    for placeholder, value in replacements.items():
-        result = result.replace(placeholder, value)
+    def section(title, names, block=False):
+        # Multi-line values (summary, chat logs) start on their own line
+        lines = [
+            f"[{name}]:{chr(10) if block else ' '}{TEMPLATE_VARIABLES[name](creator, fan, chat_history, conversation_summary)}"
+            for name in names
+            if name in placeholders
+        ]
+        return f"\n\n{title}:\n" + ("\n\n" if block else "\n").join(lines) if lines else ""
     
-    return result
+    instructions = compiled.render({name: f"[{name}]" for name in placeholders if name in TEMPLATE_VARIABLES})
+    examples_section = "\n\nSample conversation examples:\n" + examples
+    static_prefix = instructions + ("" if examples_vary else examples_section)
+    creator_prefix = static_prefix + section("Creator profile", CREATOR_VARIABLES)
+    system_prompt = creator_prefix + section("Fan context", FAN_VARIABLES)
+    if examples_vary:
+        system_prompt += examples_section
+    system_prompt += section("Conversation", CONVERSATION_VARIABLES, block=True)
+    return system_prompt, static_prefix, creator_prefix
 
-def generate_chat_recommendations(
+
+# (creator, fan, system_prompt_data, chat_history, conversation_summary)
+RecommendationContext = Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], List[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+def _recommendation_context_from_results(
+    chat_history: Any,
+    creator: Any,
+    fan: Any,
+    system_prompt_data: Any,
+    conversation_summary: Any = None
+) -> RecommendationContext:
+    """
+    Turn the outcomes of the concurrent lookups into the context tuple.
+    
+    Each argument is either the lookup result or the exception it raised.
+    Errors are raised in the order the serial implementation raised them:
+    chat history, creator, fan, system prompt. A failed summary lookup is
+    logged and treated as no summary.
+    """
+    if isinstance(chat_history, BaseException):
+        raise chat_history
+    
+    if isinstance(creator, ValueError):
+        raise ValueError("Creator not found")
+    if isinstance(creator, BaseException):
+        raise creator
+    
+    if isinstance(fan, ValueError):
+        raise ValueError("Fan not found")
+    if isinstance(fan, BaseException):
+        raise fan
+    
+    if isinstance(system_prompt_data, ValueError):
+        raise ValueError("System prompt not found")
+    if isinstance(system_prompt_data, BaseException):
+        raise system_prompt_data
+    
+    if isinstance(conversation_summary, BaseException):
+        print(f"Conversation summary lookup failed: {str(conversation_summary)}")
+        conversation_summary = None
+    
+    return creator, fan, system_prompt_data, chat_history, conversation_summary
+
+
+def _future_outcome(future: Any) -> Any:
+    """Return the result of a future, or the exception it raised."""
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+
+def fetch_recommendation_context(
     supabase: Client,
     creator_id: str,
     fan_id: str,
     system_prompt_id: str,
-    chat_history: List[Dict[str, str]],
-    chat_type: str = "text"
-) -> List[Dict[str, Any]]:
+    chat_history: Optional[List[Dict[str, Any]]] = None
+) -> RecommendationContext:
     """
-    Generate 5 chat reply recommendations based on context.
+    Fetch creator, fan, system prompt, recent chat history and (when
+    CONVERSATION_SUMMARIES is enabled) the conversation summary concurrently.
     
-    This is a placeholder implementation. In production, you would:
-    1. Use an LLM (OpenAI, Anthropic, etc.) to generate contextual replies
-    2. Consider creator persona, tone, niches
-    3. Factor in fan lifetime spend for personalization
-    4. Use system prompts for guidance
-    5. Respect NSFW settings
-    6. Adapt to chat type (text/image/video)
+    The lookups are independent PostgREST round trips, so they are submitted
+    to the shared lookup executor and awaited together. Errors are raised in
+    the same order the serial implementation raised them.
     
     Args:
+        supabase: Supabase client instance
         creator_id: Creator ID to fetch creator data
         fan_id: Fan ID to fetch fan data
         system_prompt_id: System prompt ID to fetch system prompt data
-        chat_history: List of previous chat messages
-        chat_type: Type of chat (text/image/video)
+        chat_history: Already fetched chat history (skips the history query)
     
     Returns:
-        List of 5 recommendation dictionaries
+        Tuple of (creator, fan, system_prompt_data, chat_history,
+        conversation_summary)
+    
+    Raises:
+        ValueError: If the creator, fan or system prompt is not found
     """
-    # Fetch creator, fan, and system prompt data using helper functions
-    try:
-        creator = get_creator_by_id(supabase,creator_id)
-    except ValueError:
-        raise ValueError("Creator not found")
+    history_future = None
+    if chat_history is None:
+        history_future = lookup_executor.submit(get_recent_chat_history, supabase, creator_id, fan_id, CONTEXT_HISTORY_LIMIT)
+    creator_future = lookup_executor.submit(get_creator_by_id, supabase, creator_id)
+    fan_future = lookup_executor.submit(get_fan_by_id, supabase, fan_id)
+    system_prompt_future = lookup_executor.submit(get_system_prompt_by_id, supabase, system_prompt_id)
+    summary_future = None
+    if CONVERSATION_SUMMARIES:
+        summary_future = lookup_executor.submit(get_conversation_summary, supabase, creator_id, fan_id)
     
-    try:
-        fan = get_fan_by_id(supabase,fan_id)
-    except ValueError:
-        raise ValueError("Fan not found")
+    return _recommendation_context_from_results(
+        _future_outcome(history_future) if history_future is not None else chat_history,
+        _future_outcome(creator_future),
+        _future_outcome(fan_future),
+        _future_outcome(system_prompt_future),
+        _future_outcome(summary_future) if summary_future is not None else None
+    )
+
+
+async def afetch_recommendation_context(
+    supabase: AsyncClient,
+    creator_id: str,
+    fan_id: str,
+    system_prompt_id: str,
+    chat_history: Optional[List[Dict[str, Any]]] = None
+) -> RecommendationContext:
+    """
+    Async variant of fetch_recommendation_context using the async Supabase client.
     
-    try:
-        system_prompt_data = get_system_prompt_by_id(supabase,system_prompt_id)
-        print('system_prompt_id', system_prompt_id)
-        print('system_prompt_data', system_prompt_data)
-    except ValueError:
-        raise ValueError("System prompt not found")
+    Args:
+        supabase: Async Supabase client instance
+        creator_id: Creator ID to fetch creator data
+        fan_id: Fan ID to fetch fan data
+        system_prompt_id: System prompt ID to fetch system prompt data
+        chat_history: Already fetched chat history (skips the history query)
     
-    # Placeholder implementation - replace with actual LLM integration
-    recommendations = []
+    Returns:
+        Tuple of (creator, fan, system_prompt_data, chat_history,
+        conversation_summary)
+    
+    Raises:
+        ValueError: If the creator, fan or system prompt is not found
+    """
+    async def existing_history():
+        return chat_history
+    
+    async def no_summary():
+        return None
+    
+    results = await asyncio.gather(
+        aget_recent_chat_history(supabase, creator_id, fan_id, CONTEXT_HISTORY_LIMIT) if chat_history is None else existing_history(),
+        aget_creator_by_id(supabase, creator_id),
+        aget_fan_by_id(supabase, fan_id),
+        aget_system_prompt_by_id(supabase, system_prompt_id),
+        aget_conversation_summary(supabase, creator_id, fan_id) if CONVERSATION_SUMMARIES else no_summary(),
+        return_exceptions=True
+    )
+    return _recommendation_context_from_results(*results)
+
+
+# Final user turn asking Mistral for the reply options
+RECOMMENDATION_REQUEST = """Generate exactly 3 different reply options. Each reply should be unique, warm, affectionate, and appropriate. Format your response as follows:
+
+Reply 1: [your first reply here]
+Reply 2: [your second reply here]
+Reply 3: [your third reply here]
+
+Make sure each reply is distinct and shows different ways to make the fan feel special and valued."""
+
+# Default route; MODEL_ROUTING_RULES can pick other models and parameters
+# per fan and chat type (see utils.model_router)
+RECOMMENDATION_MODEL = "mistral-small-latest"
+RECOMMENDATION_TEMPERATURE = 0.8  # Good balance for creativity and consistency
+RECOMMENDATION_MAX_TOKENS = 500  # Increased to accommodate 3 replies
+RECOMMENDATION_COUNT = 3
+
+model_router = ModelRouter(RECOMMENDATION_MODEL, RECOMMENDATION_TEMPERATURE, RECOMMENDATION_MAX_TOKENS)
+
+# Replies a request may ask for (num_candidates)
+RECOMMENDATION_MAX_CANDIDATES = int(os.getenv("RECOMMENDATION_MAX_CANDIDATES", "5"))
+
+# How the replies are generated:
+#   single           one completion that lists every reply
+#   parallel         one short completion per reply, all at once, each with
+#                    its own style hint
+#   multi_candidate  one short completion with n=num_candidates
+GENERATION_MODES = ("single", "parallel", "multi_candidate")
+RECOMMENDATION_GENERATION_MODE = os.getenv("RECOMMENDATION_GENERATION_MODE", "single")
+
+# max_tokens of each completion in the parallel and multi_candidate modes
+# (a single reply needs far fewer than the whole list)
+PARALLEL_REPLY_MAX_TOKENS = int(os.getenv("PARALLEL_REPLY_MAX_TOKENS", "150"))
+
+# Style asked of the n-th parallel reply, so they differ from each other
+REPLY_DIVERSITY_HINTS = [
+    "warm and affectionate",
+    "playful and teasing",
+    "curious, ending with a question for the fan",
+    "bold and flirty",
+    "short and casual"
+]
+
+# Runs the completions of the parallel mode
+reply_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PARALLEL_REPLY_MAX_WORKERS", "32")),
+    thread_name_prefix="reply"
+)
+
+
+def parse_generation_options(data: Dict[str, Any]) -> Tuple[int, str]:
+    """
+    Read num_candidates and generation_mode from a request body.
+    
+    Returns:
+        Tuple of (number of replies, generation mode)
+    
+    Raises:
+        ValueError: If either is invalid
+    """
+    num_candidates = data.get("num_candidates", RECOMMENDATION_COUNT)
+    if isinstance(num_candidates, bool) or not isinstance(num_candidates, int) or not 1 <= num_candidates <= RECOMMENDATION_MAX_CANDIDATES:
+        raise ValueError(f"num_candidates must be an integer between 1 and {RECOMMENDATION_MAX_CANDIDATES}")
+    generation_mode = data.get("generation_mode") or RECOMMENDATION_GENERATION_MODE
+    if generation_mode not in GENERATION_MODES:
+        raise ValueError(f"generation_mode must be one of: {', '.join(GENERATION_MODES)}")
+    return num_candidates, generation_mode
+
+
+def recommendation_request(count: int = RECOMMENDATION_COUNT) -> str:
+    """Final user turn asking for count reply options in one completion."""
+    if count == RECOMMENDATION_COUNT:
+        return RECOMMENDATION_REQUEST
+    if count == 1:
+        return single_reply_request()
+    lines = "\n".join(f"Reply {i}: [reply {i} here]" for i in range(1, count + 1))
+    return f"""Generate exactly {count} different reply options. Each reply should be unique, warm, affectionate, and appropriate. Format your response as follows:
+
+{lines}
+
+Make sure each reply is distinct and shows different ways to make the fan feel special and valued."""
+
+
+def single_reply_request(hint: Optional[str] = None) -> str:
+    """Final user turn asking for one reply, optionally in a given style."""
+    style = f" Make it {hint}." if hint else ""
+    return f"Write one reply to the fan that is warm and appropriate and makes them feel special and valued.{style} Respond with the message text only, without a label, quotes or explanation."
+
+
+def candidate_messages(recommendation_messages: List[Dict[str, str]], index: int) -> List[Dict[str, str]]:
+    """The message list of the index-th (0-based) parallel reply: the shared context plus its own request."""
+    hint = REPLY_DIVERSITY_HINTS[index % len(REPLY_DIVERSITY_HINTS)]
+    return recommendation_messages[:-1] + [{"role": "user", "content": single_reply_request(hint)}]
+
+
+class RecommendationSet(NamedTuple):
+    """Generated recommendations and the token counts of the prompt behind them."""
+    recommendations: List[Dict[str, Any]]
+    metadata: Dict[str, Any]
+
+
+def build_recommendation_messages(
+    supabase: Client,
+    creator_id: str,
+    fan_id: str,
+    system_prompt_id: str,
+    chat_history: Optional[List[Dict[str, str]]] = None
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Fetch the recommendation context and build the Mistral message list.
+    
+    Args:
+        supabase: Supabase client instance
+        creator_id: Creator ID to fetch creator data
+        fan_id: Fan ID to fetch fan data
+        system_prompt_id: System prompt ID to fetch system prompt data
+        chat_history: List of previous chat messages (fetched concurrently
+            with the other lookups when omitted)
     
-    # Extract context
-    creator_persona = creator.get("persona", [])
-    creator_niches = creator.get("niches", [])
+    Returns:
+        Tuple of (Mistral chat messages ending with the reply request,
+        token counts of the context)
+    
+    Raises:
+        ValueError: If the creator, fan or system prompt is not found
+    """
+    # Fetch creator, fan, system prompt and chat history concurrently
+    creator, fan, system_prompt_data, chat_history, conversation_summary = fetch_recommendation_context(
+        supabase=supabase,
+        creator_id=creator_id,
+        fan_id=fan_id,
+        system_prompt_id=system_prompt_id,
+        chat_history=chat_history
+    )
+    return assemble_recommendation_messages(creator, fan, system_prompt_data, chat_history, system_prompt_id, conversation_summary=conversation_summary)
+
+
+def _chat_role(chat: Dict[str, Any]) -> str:
+    """Map a chat message's sender to a Mistral role ("user" or "assistant")."""
+    role = chat.get("role", chat.get("sender", "user"))
+    # Normalize role to "user" or "assistant"
+    if role.lower() in ["fan", "user", "customer"]:
+        return "user"
+    elif role.lower() in ["creator", "assistant", "bot"]:
+        return "assistant"
+    return role
+
+
+def _chat_content(chat: Dict[str, Any]) -> str:
+    return chat.get("content", chat.get("message", ""))
+
+
+def _chat_log_line(chat: Dict[str, Any]) -> str:
+    return _format_chat_logs([chat])
+
+
+def assemble_recommendation_messages(
+    creator: Dict[str, Any],
+    fan: Dict[str, Any],
+    system_prompt_data: Dict[str, Any],
+    chat_history: List[Dict[str, Any]],
+    system_prompt_id: str,
+    model: str = RECOMMENDATION_MODEL,
+    conversation_summary: Optional[Dict[str, Any]] = None,
+    request: str = RECOMMENDATION_REQUEST
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Build the Mistral message list from already fetched context.
+    
+    The newest messages that fit in the model's token budget are packed in
+    chronological order. The history is sent once: inside the system prompt
+    if the template uses {{chat logs}}, otherwise as chat turns. With
+    PROMPT_LAYOUT=stable_prefix the system prompt is laid out by
+    render_stable_prefix_prompt and the hash of its creator-level prefix is
+    recorded for reuse metrics.
+    
+    Args:
+        creator: Creator data dictionary
+        fan: Fan data dictionary
+        system_prompt_data: System prompt data dictionary
+        chat_history: List of previous chat messages, in any order
+        system_prompt_id: ID of the system prompt
+        model: Model the messages are for (selects the token budget)
+        conversation_summary: Summary row of the conversation, if any
+        request: Final user turn (see recommendation_request)
+    
+    Returns:
+        Tuple of (Mistral chat messages ending with the reply request,
+        token counts of the context)
+    """
+    print('system_prompt_id', system_prompt_id)
+    print('system_prompt_data', system_prompt_data)
     
     # Get system prompt text (note: field name is "system_prompt" not "prompt")
     system_prompt_template = system_prompt_data.get("system_prompt", "")
     print('creator', creator)
     print('fan', fan)
-    # Replace template variables with actual values
-    system_prompt = replace_template_variables(
-        template=system_prompt_template,
-        creator=creator,
-        fan=fan,
-        chat_history=chat_history
-    )
+    placeholders = compile_template(system_prompt_template, system_prompt_id).placeholders
+    history_in_system_prompt = "chat logs" in placeholders
+    examples, examples_details = select_few_shot_examples(system_prompt_data, creator, chat_history)
     
-    # Append sample conversations to the system prompt for AI training examples
-    system_prompt = system_prompt + "\n\nSample conversation examples:\n" + SAMPLE_CONVERSATIONS
+    def render_system_prompt(history):
+        if PROMPT_LAYOUT == "stable_prefix":
+            return render_stable_prefix_prompt(
+                template=system_prompt_template,
+                creator=creator,
+                fan=fan,
+                chat_history=history,
+                prompt_id=system_prompt_id,
+                conversation_summary=conversation_summary,
+                examples=examples,
+                examples_vary=examples_details["few_shot_retrieved"]
+            )
+        # Replace template variables with actual values and append sample
+        # conversations to the system prompt for AI training examples
+        system_prompt = replace_template_variables(
+            template=system_prompt_template,
+            creator=creator,
+            fan=fan,
+            chat_history=history,
+            prompt_id=system_prompt_id,
+            conversation_summary=conversation_summary
+        )
+        return system_prompt + "\n\nSample conversation examples:\n" + examples, None, None
     
-    print('system_prompt', system_prompt)
+    # Whatever is left after the system prompt and the request goes to history
+    budget = token_budget(model)
+    fixed_tokens = message_tokens(render_system_prompt([])[0]) + message_tokens(request)
+    packed_history = pack_history(
+        [chat for chat in chat_history if _chat_content(chat)],
+        budget - fixed_tokens,
+        _chat_log_line if history_in_system_prompt else _chat_content
+    )
+    if CONVERSATION_SUMMARIES and packed_history.messages:
+        # Whatever the packer left out is due for the summary
+        record_history_window(creator.get("id"), fan.get("id"), packed_history.messages[0])
     
-    # Prepare messages for Mistral API
-    messages = []
+    system_prompt, static_prefix, creator_prefix = render_system_prompt(packed_history.messages if history_in_system_prompt else [])
+    print('system_prompt', system_prompt)
     
-    # Add system prompt as the first message
-    messages.append({
+    # Prepare messages for Mistral API, starting with the system prompt
+    messages = [{
         "role": "system",
         "content": system_prompt
-    })
+    }]
     
     # Format chat history for Mistral (convert to proper message format)
-    formatted_chat_history = []
-    for chat in chat_history:
-        # Map chat message to Mistral format
-        role = chat.get("role", chat.get("sender", "user"))
-        # Normalize role to "user" or "assistant"
-        if role.lower() in ["fan", "user", "customer"]:
-            role = "user"
-        elif role.lower() in ["creator", "assistant", "bot"]:
-            role = "assistant"
-        
-        content = chat.get("content", chat.get("message", ""))
-        if content:  # Only add non-empty messages
-            formatted_chat_history.append({
-                "role": role,
-                "content": content
-            })
+    if not history_in_system_prompt:
+        messages.extend(
+            {"role": _chat_role(chat), "content": _chat_content(chat)}
+            for chat in packed_history.messages
+        )
     
-    # Add formatted chat history to messages
-    messages.extend(formatted_chat_history)
+    # Add a user message asking for the reply options
+    messages.append({
+        "role": "user",
+        "content": request
+    })
     
-    # Generate 3 recommendations using Mistral AI in a single API call
-    try:
-        # Add a user message asking for 3 different reply options
-        request_message = {
-            "role": "user",
-            "content": """Generate exactly 3 different reply options. Each reply should be unique, warm, affectionate, and appropriate. Format your response as follows:
+    system_prompt_tokens = message_tokens(system_prompt)
+    context = {
+        "model": model,
+        "tokenizer": tokenizer_name(),
+        "token_budget": budget,
+        "prompt_tokens": sum(message_tokens(message["content"]) for message in messages),
+        "system_prompt_tokens": system_prompt_tokens,
+        "history_tokens": packed_history.tokens,
+        "history_messages": len(packed_history.messages),
+        "history_available": packed_history.available,
+        "history_truncated": packed_history.truncated,
+        "history_placement": "system_prompt" if history_in_system_prompt else "turns",
+        "summary_tokens": count_tokens(_format_conversation_summary(conversation_summary)) if "conversation_summary" in placeholders else 0,
+        "prompt_layout": PROMPT_LAYOUT,
+        "few_shot_tokens": count_tokens(examples),
+        **examples_details
+    }
+    if creator_prefix is not None:
+        prefix_tokens = count_tokens(creator_prefix)
+        context["prefix_hash"], context["prefix_reused"] = record_prefix(creator_prefix, prefix_tokens)
+        context["prefix_tokens"] = prefix_tokens
+        context["static_prefix_hash"] = prefix_hash(static_prefix)
+    return messages, context
 
-Reply 1: [your first reply here]
-Reply 2: [your second reply here]
-Reply 3: [your third reply here]
 
-Make sure each reply is distinct and shows different ways to make the fan feel special and valued."""
-        }
-        
-        # Create messages for Mistral API call
-        recommendation_messages = messages + [request_message]
-        
-        # Call Mistral API once to get 3 recommendations
-        response = mistral_client.chat.complete(
-            model="mistral-small-latest",
-            messages=recommendation_messages,
-            temperature=0.8,  # Good balance for creativity and consistency
-            max_tokens=500  # Increased to accommodate 3 replies
+def route_recommendation(
+    creator: Dict[str, Any],
+    fan: Dict[str, Any],
+    system_prompt_data: Dict[str, Any],
+    chat_history: List[Dict[str, Any]],
+    system_prompt_id: str,
+    chat_type: str,
+    conversation_summary: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = "single"
+) -> Tuple[RouteDecision, List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Route a request to a model and build its messages for that model.
+    
+    In the parallel and multi_candidate modes max_tokens is capped at
+    PARALLEL_REPLY_MAX_TOKENS, since each completion holds a single reply.
+    
+    Returns:
+        Tuple of (routing decision, Mistral chat messages, context metadata
+        including the routing rule and reason)
+    """
+    decision = model_router.route(fan, chat_type, deadline)
+    if generation_mode != "single":
+        decision = decision._replace(max_tokens=min(decision.max_tokens, PARALLEL_REPLY_MAX_TOKENS))
+    messages, context = assemble_recommendation_messages(
+        creator, fan, system_prompt_data, chat_history, system_prompt_id,
+        model=decision.model,
+        conversation_summary=conversation_summary,
+        request=recommendation_request(num_candidates) if generation_mode == "single" else single_reply_request()
+    )
+    context["routing_rule"] = decision.rule
+    context["routing_reason"] = decision.reason
+    context["generation_mode"] = generation_mode
+    context["num_candidates"] = num_candidates
+    return decision, messages, context
+
+
+def build_recommendation(reply_content: str, index: int, chat_type: str, batch_id: str) -> Dict[str, Any]:
+    """
+    Create a recommendation object for the n-th (1-based) reply.
+    
+    Args:
+        reply_content: Reply text
+        index: 1-based position of the reply
+        chat_type: Type of chat (text/image/video)
+        batch_id: Identifier shared by all replies of one generation
+    
+    Returns:
+        Recommendation dictionary
+    """
+    return {
+        "reply_id": f"rec_{index}_{batch_id}",
+        "content": reply_content.strip(),
+        "confidence": 0.9 - ((index - 1) * 0.1),  # Decreasing confidence: 0.9, 0.8, 0.7
+        "chat_type": chat_type
+    }
+
+
+def recommendations_from_content(generated_content: str, chat_type: str, count: int = RECOMMENDATION_COUNT) -> List[Dict[str, Any]]:
+    """
+    Parse generated text into recommendation objects.
+    
+    Args:
+        generated_content: Full text generated by Mistral
+        chat_type: Type of chat (text/image/video)
+        count: Number of replies that were requested
+    
+    Returns:
+        List of count recommendation dictionaries
+    
+    Raises:
+        ValueError: If fewer than count replies could be parsed
+    """
+    # Parse the response to extract the recommendations
+    parse_result = parse_replies(generated_content, count)
+    
+    # If we got fewer recommendations than requested, raise an error
+    if not parse_result.complete:
+        raise ValueError(f"Failed to generate enough recommendations. Only got {len(parse_result.replies)} recommendations.")
+    
+    return recommendations_from_replies(parse_result.replies[:count], chat_type)
+
+
+def recommendations_from_replies(replies: List[str], chat_type: str) -> List[Dict[str, Any]]:
+    """Build recommendation objects from reply texts, in order."""
+    batch_id = str(datetime.utcnow().timestamp())
+    return [
+        build_recommendation(reply_content, i, chat_type, batch_id)
+        for i, reply_content in enumerate(replies, 1)
+    ]
+
+
+def _single_replies(response: Any) -> List[str]:
+    """Replies of a completion (or its n choices) that were each asked for one reply."""
+    replies = [clean_single_reply(choice.message.content or "") for choice in response.choices]
+    if not all(replies):
+        raise ValueError("Failed to generate enough recommendations. A completion was empty.")
+    return replies
+
+
+def complete_recommendations(
+    decision: RouteDecision,
+    recommendation_messages: List[Dict[str, str]],
+    chat_type: str,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = "single",
+    deadline: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Call Mistral for the replies in the given mode.
+    
+    Every completion goes through recommendation_policy (retries, hedging,
+    deadline). In the parallel mode the num_candidates completions run
+    concurrently on reply_executor, so the set takes about as long as the
+    slowest short reply rather than one long completion.
+    
+    Returns:
+        Tuple of (recommendation dictionaries, total tokens)
+    
+    Raises:
+        ValueError: If fewer replies than requested were generated
+    """
+    def complete(messages, n=None):
+        return recommendation_policy.call(
+            lambda timeout_ms: mistral_client.chat.complete(
+                model=decision.model,
+                messages=messages,
+                temperature=decision.temperature,
+                max_tokens=decision.max_tokens,
+                timeout_ms=timeout_ms,
+                **({"n": n} if n else {})
+            ),
+            deadline
         )
-        
-        # Extract the generated content
-        generated_content = response.choices[0].message.content
-        
-        # Parse the response to extract 3 recommendations
-        # Try to find patterns like "Reply 1:", "Reply 2:", "Reply 3:" or numbered lists
-        
-        # Pattern to match "Reply 1:", "Reply 2:", "Reply 3:" or "1.", "2.", "3."
-        reply_patterns = [
-            r'Reply\s*1[:\-]\s*(.+?)(?=Reply\s*2|Reply\s*3|$)',
-            r'Reply\s*2[:\-]\s*(.+?)(?=Reply\s*3|$)',
-            r'Reply\s*3[:\-]\s*(.+?)$',
-            r'1[\.\)]\s*(.+?)(?=2[\.\)]|$)',
-            r'2[\.\)]\s*(.+?)(?=3[\.\)]|$)',
-            r'3[\.\)]\s*(.+?)$'
+    
+    if generation_mode == "parallel":
+        futures = [
+            reply_executor.submit(complete, candidate_messages(recommendation_messages, index))
+            for index in range(num_candidates)
         ]
-        
-        parsed_replies = []
-        
-        # Try to extract replies using patterns
-        for pattern in reply_patterns[:3]:  # Try "Reply X:" patterns first
-            matches = re.findall(pattern, generated_content, re.IGNORECASE | re.DOTALL)
-            if matches:
-                parsed_replies = [match.strip() for match in matches]
-                break
-        
-        # If pattern matching didn't work, try splitting by newlines and looking for numbered items
-        if not parsed_replies or len(parsed_replies) < 3:
-            lines = generated_content.split('\n')
-            for line in lines:
-                line = line.strip()
-                # Look for lines that start with numbers or "Reply"
-                if re.match(r'^(Reply\s*[1-3]|[\d]+[\.\)])', line, re.IGNORECASE):
-                    # Extract content after the number/prefix
-                    content = re.sub(r'^(Reply\s*[1-3][:\-]?\s*|[\d]+[\.\)]\s*)', '', line, flags=re.IGNORECASE).strip()
-                    if content and content not in parsed_replies:
-                        parsed_replies.append(content)
-        
-        # If we still don't have 3 replies, split the content into 3 parts
-        if len(parsed_replies) < 3:
-            # Split by common delimiters or just split the text into 3 roughly equal parts
-            parts = re.split(r'\n\n+|\n---\n|Reply\s*[1-3]', generated_content, flags=re.IGNORECASE)
-            parts = [p.strip() for p in parts if p.strip() and len(p.strip()) > 10]
-            
-            if len(parts) >= 3:
-                parsed_replies = parts[:3]
-            elif len(parts) > 0:
-                # If we have fewer parts, distribute them
-                parsed_replies = parts
-                # Pad with the last part if needed
-                while len(parsed_replies) < 3:
-                    parsed_replies.append(parsed_replies[-1] if parsed_replies else generated_content)
-            else:
-                # Fallback: split the entire content into 3 parts
-                content_length = len(generated_content)
-                chunk_size = content_length // 3
-                parsed_replies = [
-                    generated_content[i:i+chunk_size].strip()
-                    for i in range(0, content_length, chunk_size)
-                ][:3]
-        
-        # Create recommendation objects from parsed replies
-        for i, reply_content in enumerate(parsed_replies[:3], 1):
-            recommendation = {
-                "reply_id": f"rec_{i}_{datetime.utcnow().timestamp()}",
-                "content": reply_content.strip(),
-                "confidence": 0.9 - ((i - 1) * 0.1),  # Decreasing confidence: 0.9, 0.8, 0.7
-                "chat_type": chat_type
-            }
-            recommendations.append(recommendation)
-        
-        # If we got fewer than 3 recommendations, raise an error
-        if len(recommendations) < 3:
-            raise ValueError(f"Failed to generate enough recommendations. Only got {len(recommendations)} recommendations.")
+        try:
+            responses = [future.result() for future in futures]
+        finally:
+            # One failed reply fails the set; don't start the ones still queued
+            for future in futures:
+                future.cancel()
+        replies = [reply for response in responses for reply in _single_replies(response)]
+        return recommendations_from_replies(replies, chat_type), sum(_total_tokens(response) for response in responses)
+    
+    if generation_mode == "multi_candidate":
+        response = complete(recommendation_messages, num_candidates)
+        replies = _single_replies(response)
+        if len(replies) < num_candidates:
+            raise ValueError(f"Failed to generate enough recommendations. Only got {len(replies)} recommendations.")
+        return recommendations_from_replies(replies[:num_candidates], chat_type), _total_tokens(response)
+    
+    response = complete(recommendation_messages)
+    return recommendations_from_content(response.choices[0].message.content, chat_type, num_candidates), _total_tokens(response)
+
+
+async def acomplete_recommendations(
+    decision: RouteDecision,
+    recommendation_messages: List[Dict[str, str]],
+    chat_type: str,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = "single",
+    deadline: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Async variant of complete_recommendations (parallel completions run as concurrent tasks)."""
+    async def complete(messages, n=None):
+        return await recommendation_policy.acall(
+            lambda timeout_ms: mistral_client.chat.complete_async(
+                model=decision.model,
+                messages=messages,
+                temperature=decision.temperature,
+                max_tokens=decision.max_tokens,
+                timeout_ms=timeout_ms,
+                **({"n": n} if n else {})
+            ),
+            deadline
+        )
+    
+    if generation_mode == "parallel":
+        responses = await asyncio.gather(*(
+            complete(candidate_messages(recommendation_messages, index))
+            for index in range(num_candidates)
+        ))
+        replies = [reply for response in responses for reply in _single_replies(response)]
+        return recommendations_from_replies(replies, chat_type), sum(_total_tokens(response) for response in responses)
+    
+    if generation_mode == "multi_candidate":
+        response = await complete(recommendation_messages, num_candidates)
+        replies = _single_replies(response)
+        if len(replies) < num_candidates:
+            raise ValueError(f"Failed to generate enough recommendations. Only got {len(replies)} recommendations.")
+        return recommendations_from_replies(replies[:num_candidates], chat_type), _total_tokens(response)
+    
+    response = await complete(recommendation_messages)
+    return recommendations_from_content(response.choices[0].message.content, chat_type, num_candidates), _total_tokens(response)
+
+
+def _total_tokens(response: Any) -> int:
+    """Total tokens reported by a Mistral response (0 when not reported)."""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", 0) or 0
+
+
+def generate_chat_recommendations(
+    supabase: Client,
+    creator_id: str,
+    fan_id: str,
+    system_prompt_id: str,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    chat_type: str = "text",
+    force_refresh: bool = False,
+    speculative: bool = False,
+    prefetched_context: Optional[RecommendationContext] = None,
+    deadline: Optional[float] = None,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = RECOMMENDATION_GENERATION_MODE
+) -> RecommendationSet:
+    """
+    Generate chat reply recommendations (3 by default) based on context.
+    
+    Results are cached per system prompt, creator and fan state, last message
+    and chat type, so repeated requests for an unchanged conversation don't
+    pay for another Mistral call. Concurrent identical requests (same
+    creator, fan, system prompt and chat type) are coalesced into a single
+    generation whose result or error every caller receives.
+    
+    Args:
+        creator_id: Creator ID to fetch creator data
+        fan_id: Fan ID to fetch fan data
+        system_prompt_id: System prompt ID to fetch system prompt data
+        chat_history: List of previous chat messages (fetched concurrently
+            with the other lookups when omitted)
+        chat_type: Type of chat (text/image/video)
+        force_refresh: Skip the recommendation cache and generate a new set
+        speculative: Mark the cached result as pre-generated ahead of a request
+            (see utils.speculative)
+        prefetched_context: Already loaded (creator, fan, system_prompt_data,
+            chat_history, conversation_summary), e.g. from bulk lookups; skips
+            fetch_recommendation_context
+        deadline: time.monotonic() by which the caller needs the result (see
+            utils.call_policy); no retry starts past it
+        num_candidates: Number of replies to generate
+        generation_mode: "single", "parallel" or "multi_candidate" (see
+            GENERATION_MODES)
+    
+    Returns:
+        RecommendationSet with num_candidates recommendation dictionaries and
+        the context token counts
+    
+    Raises:
+        DeadlineExceeded: If the deadline passed before Mistral answered
+    """
+    return recommendation_flight.do(
+        (creator_id, fan_id, system_prompt_id, chat_type, num_candidates, generation_mode),
+        lambda: _generate_chat_recommendations(
+            supabase, creator_id, fan_id, system_prompt_id, chat_history, chat_type, force_refresh, speculative,
+            prefetched_context, deadline, num_candidates, generation_mode
+        ),
+        timeout=remaining_seconds(deadline)
+    )
+
+
+def _generate_chat_recommendations(
+    supabase: Client,
+    creator_id: str,
+    fan_id: str,
+    system_prompt_id: str,
+    chat_history: Optional[List[Dict[str, str]]],
+    chat_type: str,
+    force_refresh: bool,
+    speculative: bool = False,
+    prefetched_context: Optional[RecommendationContext] = None,
+    deadline: Optional[float] = None,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = RECOMMENDATION_GENERATION_MODE
+) -> RecommendationSet:
+    """Generate (or fetch from cache) a recommendation set; see generate_chat_recommendations."""
+    if prefetched_context is not None:
+        creator, fan, system_prompt_data, chat_history, conversation_summary = prefetched_context
+    else:
+        # Fetch creator, fan, system prompt and chat history concurrently
+        creator, fan, system_prompt_data, chat_history, conversation_summary = fetch_recommendation_context(
+            supabase=supabase,
+            creator_id=creator_id,
+            fan_id=fan_id,
+            system_prompt_id=system_prompt_id,
+            chat_history=chat_history
+        )
+    
+    cache_key = recommendation_cache_key(
+        system_prompt_id, system_prompt_data, creator, fan, chat_history, chat_type, conversation_summary, num_candidates
+    )
+    if not force_refresh:
+        cached = get_cached_recommendations(cache_key)
+        if cached is not None:
+            return RecommendationSet(*cached)
+    
+    decision, recommendation_messages, context = route_recommendation(
+        creator, fan, system_prompt_data, chat_history, system_prompt_id, chat_type, conversation_summary, deadline,
+        num_candidates, generation_mode
+    )
+    
+    # Generate the recommendations using Mistral AI, retried (and hedged when
+    # enabled) within the deadline
+    try:
+        with model_router.measure(decision) as routing_log:
+            recommendations, total_tokens = complete_recommendations(
+                decision, recommendation_messages, chat_type, num_candidates, generation_mode, deadline
+            )
+            routing_log["tokens"] = total_tokens
+            routing_log["generation_mode"] = generation_mode
+    
+    except DeadlineExceeded as e:
+        print(str(e))
+        raise
     
     except SDKError as e:
         # If Mistral API fails, raise an error instead of returning placeholders
@@ -407,4 +1100,324 @@ Make sure each reply is distinct and shows different ways to make the fan feel s
         print(error_msg)
         raise Exception(error_msg)
     
-    return recommendations
\ No newline at end of file
+    cache_recommendations(cache_key, creator_id, fan_id, recommendations, total_tokens, speculative, context)
+    return RecommendationSet(recommendations, context)
+
+
+async def agenerate_chat_recommendations(
+    supabase: AsyncClient,
+    creator_id: str,
+    fan_id: str,
+    system_prompt_id: str,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    chat_type: str = "text",
+    force_refresh: bool = False,
+    deadline: Optional[float] = None,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = RECOMMENDATION_GENERATION_MODE
+) -> RecommendationSet:
+    """
+    Async variant of generate_chat_recommendations for the ASGI server.
+    
+    Uses the async Supabase client for the lookups and
+    mistral_client.chat.complete_async for the completion, so the event loop
+    is free while the LLM call is in flight. Concurrent identical requests are
+    coalesced the same way as in generate_chat_recommendations.
+    
+    Args:
+        supabase: Async Supabase client instance
+        creator_id: Creator ID to fetch creator data
+        fan_id: Fan ID to fetch fan data
+        system_prompt_id: System prompt ID to fetch system prompt data
+        chat_history: List of previous chat messages (fetched concurrently
+            with the other lookups when omitted)
+        chat_type: Type of chat (text/image/video)
+        force_refresh: Skip the recommendation cache and generate a new set
+        deadline: time.monotonic() by which the caller needs the result
+        num_candidates: Number of replies to generate
+        generation_mode: "single", "parallel" or "multi_candidate"
+    
+    Returns:
+        RecommendationSet with num_candidates recommendation dictionaries and
+        the context token counts
+    
+    Raises:
+        DeadlineExceeded: If the deadline passed before Mistral answered
+    """
+    return await async_recommendation_flight.do(
+        (creator_id, fan_id, system_prompt_id, chat_type, num_candidates, generation_mode),
+        lambda: _agenerate_chat_recommendations(
+            supabase, creator_id, fan_id, system_prompt_id, chat_history, chat_type, force_refresh, deadline,
+            num_candidates, generation_mode
+        ),
+        timeout=remaining_seconds(deadline)
+    )
+
+
+async def _agenerate_chat_recommendations(
+    supabase: AsyncClient,
+    creator_id: str,
+    fan_id: str,
+    system_prompt_id: str,
+    chat_history: Optional[List[Dict[str, str]]],
+    chat_type: str,
+    force_refresh: bool,
+    deadline: Optional[float] = None,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = RECOMMENDATION_GENERATION_MODE
+) -> RecommendationSet:
+    """Generate (or fetch from cache) a recommendation set; see agenerate_chat_recommendations."""
+    creator, fan, system_prompt_data, chat_history, conversation_summary = await afetch_recommendation_context(
+        supabase=supabase,
+        creator_id=creator_id,
+        fan_id=fan_id,
+        system_prompt_id=system_prompt_id,
+        chat_history=chat_history
+    )
+    
+    cache_key = recommendation_cache_key(
+        system_prompt_id, system_prompt_data, creator, fan, chat_history, chat_type, conversation_summary, num_candidates
+    )
+    if not force_refresh:
+        cached = get_cached_recommendations(cache_key)
+        if cached is not None:
+            return RecommendationSet(*cached)
+    
+    decision, recommendation_messages, context = route_recommendation(
+        creator, fan, system_prompt_data, chat_history, system_prompt_id, chat_type, conversation_summary, deadline,
+        num_candidates, generation_mode
+    )
+    
+    try:
+        with model_router.measure(decision) as routing_log:
+            recommendations, total_tokens = await acomplete_recommendations(
+                decision, recommendation_messages, chat_type, num_candidates, generation_mode, deadline
+            )
+            routing_log["tokens"] = total_tokens
+            routing_log["generation_mode"] = generation_mode
+    
+    except DeadlineExceeded as e:
+        print(str(e))
+        raise
+    
+    except SDKError as e:
+        error_msg = f"Mistral API error: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+    
+    except Exception as e:
+        error_msg = f"Error generating recommendations: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+    
+    cache_recommendations(cache_key, creator_id, fan_id, recommendations, total_tokens, metadata=context)
+    return RecommendationSet(recommendations, context)
+
+
+def stream_chat_recommendations(
+    supabase: Client,
+    creator_id: str,
+    fan_id: str,
+    system_prompt_id: str,
+    chat_type: str = "text",
+    force_refresh: bool = False,
+    deadline: Optional[float] = None,
+    num_candidates: int = RECOMMENDATION_COUNT,
+    generation_mode: str = RECOMMENDATION_GENERATION_MODE
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Prepare a streamed recommendation set, yielding each reply once it is complete.
+    
+    The lookups run eagerly, so missing entities raise ValueError before the
+    first event is produced. The returned iterator yields
+    ("recommendation", recommendation) events, followed by a single
+    ("done", recommendation_set) event carrying the same RecommendationSet
+    generate_chat_recommendations would return. A cached set is replayed
+    without calling Mistral.
+    
+    Args:
+        supabase: Supabase client instance
+        creator_id: Creator ID to fetch creator data
+        fan_id: Fan ID to fetch fan data
+        system_prompt_id: System prompt ID to fetch system prompt data
+        chat_type: Type of chat (text/image/video)
+        force_refresh: Skip the recommendation cache and generate a new set
+        deadline: time.monotonic() by which the stream must have started;
+            opening it is retried (never hedged) until then
+        num_candidates: Number of replies to generate
+        generation_mode: "single" streams one completion; "parallel" yields
+            each short completion as it finishes; "multi_candidate" yields
+            all replies once its single completion returns
+    
+    Returns:
+        Iterator of (event name, payload) tuples
+    
+    Raises:
+        ValueError: If the creator, fan or system prompt is not found
+    """
+    creator, fan, system_prompt_data, chat_history, conversation_summary = fetch_recommendation_context(
+        supabase=supabase,
+        creator_id=creator_id,
+        fan_id=fan_id,
+        system_prompt_id=system_prompt_id
+    )
+    
+    cache_key = recommendation_cache_key(
+        system_prompt_id, system_prompt_data, creator, fan, chat_history, chat_type, conversation_summary, num_candidates
+    )
+    cached = None if force_refresh else get_cached_recommendations(cache_key)
+    if cached is not None:
+        return _replay_recommendations(RecommendationSet(*cached))
+    
+    decision, recommendation_messages, context = route_recommendation(
+        creator, fan, system_prompt_data, chat_history, system_prompt_id, chat_type, conversation_summary, deadline,
+        num_candidates, generation_mode
+    )
+    if generation_mode != "single":
+        return _stream_completed_replies(
+            recommendation_messages, context, chat_type, cache_key, creator_id, fan_id, decision, deadline,
+            num_candidates, generation_mode
+        )
+    return _stream_recommendations(
+        recommendation_messages, context, chat_type, cache_key, creator_id, fan_id, decision, deadline, num_candidates
+    )
+
+
+def _replay_recommendations(recommendation_set: RecommendationSet) -> Iterator[Tuple[str, Any]]:
+    """Yield a cached recommendation set as stream events."""
+    for recommendation in recommendation_set.recommendations:
+        yield "recommendation", recommendation
+    yield "done", recommendation_set
+
+
+def _stream_recommendations(
+    recommendation_messages: List[Dict[str, str]],
+    context: Dict[str, Any],
+    chat_type: str,
+    cache_key: str,
+    creator_id: str,
+    fan_id: str,
+    decision: RouteDecision,
+    deadline: Optional[float] = None,
+    num_candidates: int = RECOMMENDATION_COUNT
+) -> Iterator[Tuple[str, Any]]:
+    """Stream a completion from Mistral and yield each reply as soon as it closes."""
+    batch_id = str(datetime.utcnow().timestamp())
+    parser = ReplyParser(num_candidates)
+    recommendations = []
+    total_tokens = 0
+    
+    def emit(replies):
+        for reply_content in replies:
+            if len(recommendations) >= num_candidates:
+                break
+            recommendation = build_recommendation(reply_content, len(recommendations) + 1, chat_type, batch_id)
+            recommendations.append(recommendation)
+            yield "recommendation", recommendation
+    
+    try:
+        with model_router.measure(decision) as routing_log:
+            # Only opening the stream is retried: once replies have been sent
+            # a second attempt would produce different ones
+            stream = recommendation_policy.call(
+                lambda timeout_ms: mistral_client.chat.stream(
+                    model=decision.model,
+                    messages=recommendation_messages,
+                    temperature=decision.temperature,
+                    max_tokens=decision.max_tokens,
+                    timeout_ms=timeout_ms
+                ),
+                deadline,
+                hedge=False
+            )
+            with stream as events:
+                for event in events:
+                    # The last chunk reports token usage for the whole completion
+                    total_tokens = _total_tokens(event.data) or total_tokens
+                    delta = event.data.choices[0].delta.content if event.data.choices else None
+                    if delta:
+                        yield from emit(parser.feed(delta))
+            routing_log["tokens"] = total_tokens
+    
+    except SDKError as e:
+        error_msg = f"Mistral API error: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+    
+    parse_result = parser.close()
+    yield from emit(parse_result.replies[len(recommendations):])
+    if not parse_result.complete:
+        raise Exception(f"Error generating recommendations: Failed to generate enough recommendations. Only got {len(parse_result.replies)} recommendations.")
+    
+    cache_recommendations(cache_key, creator_id, fan_id, recommendations, total_tokens, metadata=context)
+    yield "done", RecommendationSet(recommendations, context)
+
+
+def _stream_completed_replies(
+    recommendation_messages: List[Dict[str, str]],
+    context: Dict[str, Any],
+    chat_type: str,
+    cache_key: str,
+    creator_id: str,
+    fan_id: str,
+    decision: RouteDecision,
+    deadline: Optional[float],
+    num_candidates: int,
+    generation_mode: str
+) -> Iterator[Tuple[str, Any]]:
+    """Yield the replies of the parallel (as each completion finishes) or multi_candidate mode."""
+    if generation_mode == "multi_candidate":
+        try:
+            with model_router.measure(decision) as routing_log:
+                recommendations, total_tokens = complete_recommendations(
+                    decision, recommendation_messages, chat_type, num_candidates, generation_mode, deadline
+                )
+                routing_log["tokens"] = total_tokens
+                routing_log["generation_mode"] = generation_mode
+        except SDKError as e:
+            error_msg = f"Mistral API error: {str(e)}"
+            print(error_msg)
+            raise Exception(error_msg)
+        for recommendation in recommendations:
+            yield "recommendation", recommendation
+    else:
+        batch_id = str(datetime.utcnow().timestamp())
+        recommendations = []
+        total_tokens = 0
+        
+        def complete(index):
+            return recommendation_policy.call(
+                lambda timeout_ms: mistral_client.chat.complete(
+                    model=decision.model,
+                    messages=candidate_messages(recommendation_messages, index),
+                    temperature=decision.temperature,
+                    max_tokens=decision.max_tokens,
+                    timeout_ms=timeout_ms
+                ),
+                deadline
+            )
+        
+        futures = [reply_executor.submit(complete, index) for index in range(num_candidates)]
+        try:
+            with model_router.measure(decision) as routing_log:
+                # Replies are numbered in the order they finish, so the
+                # first one can be shown while the others are still running
+                for future in as_completed(futures):
+                    response = future.result()
+                    total_tokens += _total_tokens(response)
+                    for reply_content in _single_replies(response):
+                        recommendation = build_recommendation(reply_content, len(recommendations) + 1, chat_type, batch_id)
+                        recommendations.append(recommendation)
+                        yield "recommendation", recommendation
+                routing_log["tokens"] = total_tokens
+                routing_log["generation_mode"] = generation_mode
+        except SDKError as e:
+            error_msg = f"Mistral API error: {str(e)}"
+            print(error_msg)
+            raise Exception(error_msg)
+        finally:
+            for future in futures:
+                future.cancel()
+    
+    cache_recommendations(cache_key, creator_id, fan_id, recommendations, total_tokens, metadata=context)
+    yield "done", RecommendationSet(recommendations, context)
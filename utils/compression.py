@@ -0,0 +1,112 @@
+from typing import Iterable, Iterator, Optional
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Off switch (e.g. when a reverse proxy already compresses)
+COMPRESSION = os.getenv("COMPRESSION", "true").lower() in ("1", "true", "yes")
+
+# Bodies smaller than this are sent as is: the headers and CPU cost more
+# than the bytes saved
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+# Dynamic responses favour speed; bodies compressed once (static assets)
+# use the highest levels
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml"
+)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the content coding for an Accept-Encoding header.
+
+    Returns:
+        "br" (when the brotli package is installed) or "gzip" if the client
+        accepts it, else None
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    """Whether a content type is worth compressing (images, archives etc. are already compressed)."""
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, coding: str, best: bool = False) -> bytes:
+    """Compress a whole body; best selects the highest level, for bodies compressed once and reused."""
+    if coding == "br":
+        return brotli.compress(data, quality=11 if best else COMPRESSION_BROTLI_QUALITY)
+    compressor = zlib.compressobj(9 if best else COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks: Iterable[bytes], coding: str) -> Iterator[bytes]:
+    """
+    Compress a streamed body chunk by chunk.
+
+    Every chunk is flushed as soon as it is compressed, so the client can
+    decode each event when it arrives instead of when the stream ends.
+    """
+    if coding == "br":
+        compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def weaken_etag(etag: Optional[str]) -> Optional[str]:
+    """
+    Mark an ETag weak once the body it was computed for is re-encoded.
+
+    The compressed bytes differ from the ones the ETag names, but they are
+    the same content; If-None-Match uses the weak comparison, so a client
+    echoing the weak tag still gets a 304.
+    """
+    if not etag or etag.startswith("W/"):
+        return etag
+    return f"W/{etag}"
+
+
+def add_vary(vary: Optional[str], header: str) -> str:
+    """Add a header name to a Vary value unless it is already listed."""
+    names = [name.strip() for name in (vary or "").split(",") if name.strip()]
+    if header.lower() not in (name.lower() for name in names) and "*" not in names:
+        names.append(header)
+    return ", ".join(names)
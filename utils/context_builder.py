@@ -0,0 +1,143 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+from utils.cache import TTLCache, MISSING
+from utils.tokenizer import count_tokens, truncate_to_tokens
+import hashlib
+import json
+import os
+import threading
+
+# Prompt token budget (system prompt, history and request) per model.
+# CONTEXT_TOKEN_BUDGETS takes a JSON object to override or extend it, e.g.
+# '{"mistral-small-latest": 12000}'; unknown models get CONTEXT_TOKEN_BUDGET.
+MODEL_TOKEN_BUDGETS: Dict[str, int] = {
+    "mistral-small-latest": 8000,
+    "mistral-medium-latest": 16000,
+    "mistral-large-latest": 16000,
+    "ministral-8b-latest": 8000,
+    "open-mistral-nemo": 8000
+}
+MODEL_TOKEN_BUDGETS.update({
+    model: int(budget)
+    for model, budget in json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", "{}")).items()
+})
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+
+# How many recent messages are fetched for the builder to pack from
+CONTEXT_HISTORY_LIMIT = int(os.getenv("CONTEXT_HISTORY_LIMIT", "50"))
+
+# Tokens charged per message for role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class PackedHistory(NamedTuple):
+    """Messages selected to fit a token budget, oldest first."""
+    messages: List[Dict[str, Any]]
+    tokens: int
+    available: int
+    truncated: bool
+
+
+def token_budget(model: str) -> int:
+    """Return the prompt token budget configured for a model."""
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+def message_tokens(text: str) -> int:
+    """Tokens a message costs in the prompt, including its overhead."""
+    return count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+
+def chronological(chat_history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return chat history sorted oldest first, whatever order it was fetched in."""
+    return sorted(chat_history, key=lambda chat: (str(chat.get("created_at") or ""), str(chat.get("id") or "")))
+
+
+def pack_history(
+    chat_history: List[Dict[str, Any]],
+    budget: int,
+    render: Callable[[Dict[str, Any]], str]
+) -> PackedHistory:
+    """
+    Select the newest messages that fit in a token budget.
+
+    Messages are taken newest first until the next one would not fit, then
+    returned in chronological order. If even the newest message does not fit
+    on its own, its content is truncated to the remaining budget so the
+    message being replied to is never dropped.
+
+    Args:
+        chat_history: Chat message dictionaries, in any order
+        budget: Tokens available for the history
+        render: Returns the text a message is sent as (a chat log line or a
+            turn's content)
+
+    Returns:
+        PackedHistory with the selected messages and their token count
+    """
+    packed = []
+    used = 0
+    truncated = False
+    for chat in reversed(chronological(chat_history)):
+        cost = message_tokens(render(chat))
+        if used + cost > budget:
+            if not packed:
+                content = chat.get("content", chat.get("message", "")) or ""
+                # Whatever the rendering adds around the content still has to fit
+                allowance = budget - (cost - count_tokens(content))
+                if allowance > 0:
+                    chat = {**chat, "content": truncate_to_tokens(content, allowance)}
+                    packed.append(chat)
+                    used += message_tokens(render(chat))
+                    truncated = True
+            break
+        packed.append(chat)
+        used += cost
+    packed.reverse()
+    return PackedHistory(messages=packed, tokens=used, available=len(chat_history), truncated=truncated)
+
+
+# Prompt prefixes sent recently, to measure how often a request starts with a
+# prefix the provider may still have cached (PREFIX_REUSE_WINDOW approximates
+# how long it keeps one)
+prefix_cache = TTLCache(
+    name="prompt_prefix",
+    ttl=float(os.getenv("PREFIX_REUSE_WINDOW", "300")),
+    maxsize=int(os.getenv("PREFIX_CACHE_SIZE", "10000"))
+)
+_reused_prefix_tokens = 0
+_reused_prefix_lock = threading.Lock()
+
+
+def prefix_hash(prefix: str) -> str:
+    """Short stable hash identifying a prompt prefix."""
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+
+def record_prefix(prefix: str, tokens: int) -> Tuple[str, bool]:
+    """
+    Record that a prompt starting with prefix is being sent.
+
+    Args:
+        prefix: Leading text of the prompt shared with other requests
+        tokens: Token count of the prefix
+
+    Returns:
+        Tuple of (prefix hash, whether the same prefix was sent within
+        PREFIX_REUSE_WINDOW seconds)
+    """
+    global _reused_prefix_tokens
+    key = prefix_hash(prefix)
+    reused = prefix_cache.get(key) is not MISSING
+    if reused:
+        with _reused_prefix_lock:
+            _reused_prefix_tokens += tokens
+    prefix_cache.set(key, True)
+    return key, reused
+
+
+def prefix_stats() -> Dict[str, Any]:
+    """Prefix reuse counters, for the metrics endpoint."""
+    stats = prefix_cache.stats()
+    with _reused_prefix_lock:
+        stats["reused_tokens"] = _reused_prefix_tokens
+    return stats
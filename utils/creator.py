@@ -1,5 +1,20 @@
-from typing import Dict, Any
-from supabase import Client
+from typing import Dict, List, Any, Optional
+from supabase import AsyncClient, Client
+from utils.cache import TTLCache, MISSING
+from utils.bulk import get_rows_by_ids
+from utils.listing import ListPage, list_page, prefix_pattern
+import os
+
+# Creators almost never change, so they can be cached for a long time
+creator_cache = TTLCache(
+    name="creator",
+    ttl=float(os.getenv("CREATOR_CACHE_TTL", "600")),
+    maxsize=int(os.getenv("CREATOR_CACHE_SIZE", "1024"))
+)
+
+# Column the name_prefix filter of /get_creators matches; the creator table has
+# no name column by default, so the filter is off unless one is configured
+CREATOR_NAME_COLUMN = os.getenv("CREATOR_NAME_COLUMN", "")
 
 
 def get_creator_by_id(supabase: Client, creator_id: str) -> Dict[str, Any]:
@@ -11,12 +26,116 @@ def get_creator_by_id(supabase: Client, creator_id: str) -> Dict[str, Any]:
         creator_id: The creator ID to fetch
         
     Returns:
-        Creator data dictionary
+        Creator data dictionary (shared with the cache, treat as read-only)
         
     Raises:
         ValueError: If creator not found
     """
+    creator = creator_cache.get(creator_id)
+    if creator is not MISSING:
+        return creator
     creator_response = supabase.table("creator").select("*").eq("id", creator_id).execute()
     if not creator_response.data:
         raise ValueError("Creator not found")
-    return creator_response.data[0]
\ No newline at end of file
+    creator = creator_response.data[0]
+    creator_cache.set(creator_id, creator)
+    return creator
+
+
+async def aget_creator_by_id(supabase: AsyncClient, creator_id: str) -> Dict[str, Any]:
+    """
+    Async variant of get_creator_by_id, sharing the same cache.
+    
+    Args:
+        supabase: Async Supabase client instance
+        creator_id: The creator ID to fetch
+        
+    Returns:
+        Creator data dictionary (shared with the cache, treat as read-only)
+        
+    Raises:
+        ValueError: If creator not found
+    """
+    creator = creator_cache.get(creator_id)
+    if creator is not MISSING:
+        return creator
+    creator_response = await supabase.table("creator").select("*").eq("id", creator_id).execute()
+    if not creator_response.data:
+        raise ValueError("Creator not found")
+    creator = creator_response.data[0]
+    creator_cache.set(creator_id, creator)
+    return creator
+
+
+def get_creators_by_ids(supabase: Client, creator_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Helper function to get many creators at once.
+    
+    Cached creators are served from the cache; the rest are loaded with
+    in_ queries and cached.
+    
+    Args:
+        supabase: Supabase client instance
+        creator_ids: The creator IDs to fetch
+        
+    Returns:
+        Dictionary of creator ID to creator data (creators that don't exist are left out)
+    """
+    return get_rows_by_ids(supabase, "creator", creator_ids, creator_cache)
+
+
+def list_creators(
+    supabase: Client,
+    limit: int,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    name_prefix: Optional[str] = None
+) -> ListPage:
+    """
+    Helper function to get one page of creators.
+    
+    Args:
+        supabase: Supabase client instance
+        limit: Maximum number of creators in the page
+        cursor: next_cursor of the previous page
+        fields: Columns to return (all when None)
+        name_prefix: Only creators whose CREATOR_NAME_COLUMN starts with it
+            (case-insensitive)
+        
+    Returns:
+        ListPage of creator rows ordered by id
+    
+    Raises:
+        ValueError: If name_prefix is given but CREATOR_NAME_COLUMN is not set
+    """
+    query = supabase.table("creator").select(",".join(fields) if fields else "*")
+    if name_prefix:
+        if not CREATOR_NAME_COLUMN:
+            raise ValueError("name_prefix is not supported: CREATOR_NAME_COLUMN is not set")
+        query = query.ilike(CREATOR_NAME_COLUMN, prefix_pattern(name_prefix))
+    page = list_page(query, limit, cursor)
+    if not fields:
+        for creator in page.rows:
+            cache_creator(creator)
+    return page
+
+
+def cache_creator(creator: Dict[str, Any]) -> None:
+    """
+    Store a freshly written creator row in the cache.
+    
+    Args:
+        creator: Creator row as returned by an insert or update
+    """
+    if creator and creator.get("id"):
+        creator_cache.set(creator["id"], creator)
+
+
+def invalidate_creator(creator_id: str) -> None:
+    """
+    Drop a creator from the cache so the next lookup hits the database.
+    
+    Args:
+        creator_id: The creator ID to invalidate
+    """
+    creator_cache.invalidate(creator_id)
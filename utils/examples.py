@@ -0,0 +1,149 @@
+from typing import Dict, List, Any, Optional, Tuple
+from utils.cache import TTLCache, MISSING
+import numpy as np
+import os
+import zlib
+
+# Per-creator example sets: <EXAMPLES_DIR>/<creator_id>.txt, in the same
+# "fan: ...\ncreator: ..." format as SAMPLE_CONVERSATIONS
+EXAMPLES_DIR = os.getenv("EXAMPLES_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples"))
+
+# Character n-gram sizes and hashed vector width of the TF-IDF index
+NGRAM_SIZES = (2, 3, 4)
+HASH_DIM = 4096
+
+# Indexes for creators with their own example file, rebuilt after the TTL so
+# edited files are picked up
+creator_index_cache = TTLCache(
+    name="example_index",
+    ttl=float(os.getenv("EXAMPLE_INDEX_TTL", "600")),
+    maxsize=int(os.getenv("EXAMPLE_INDEX_CACHE_SIZE", "256"))
+)
+
+
+def parse_example_pairs(text: str) -> List[Tuple[str, str]]:
+    """
+    Parse blank-line separated "fan: ..." / "creator: ..." blocks.
+
+    Args:
+        text: Example conversations, e.g. SAMPLE_CONVERSATIONS
+
+    Returns:
+        List of (fan message, creator reply) pairs; incomplete blocks are skipped
+    """
+    pairs = []
+    for block in text.strip().split("\n\n"):
+        fan_line = creator_line = None
+        for line in block.strip().splitlines():
+            if line.startswith("fan:"):
+                fan_line = line[len("fan:"):].strip()
+            elif line.startswith("creator:"):
+                creator_line = line[len("creator:"):].strip()
+        if fan_line is not None and creator_line is not None:
+            pairs.append((fan_line, creator_line))
+    return pairs
+
+
+def format_example_pairs(pairs: List[Tuple[str, str]]) -> str:
+    """Format pairs back into the SAMPLE_CONVERSATIONS layout."""
+    return "\n\n".join(f"fan: {fan_line}\ncreator: {creator_line}" for fan_line, creator_line in pairs)
+
+
+def _ngram_buckets(text: str) -> np.ndarray:
+    """Hashed character n-gram ids of a lowercased, whitespace-normalized text."""
+    padded = f" {' '.join(text.lower().split())} "
+    return np.fromiter(
+        (
+            zlib.crc32(padded[i:i + n].encode("utf-8")) % HASH_DIM
+            for n in NGRAM_SIZES
+            for i in range(len(padded) - n + 1)
+        ),
+        dtype=np.int64
+    )
+
+
+class ExampleIndex:
+    """
+    In-memory TF-IDF index over the fan side of example pairs.
+
+    Each pair's fan message becomes a hashed character n-gram vector
+    (log-scaled term frequency times inverse document frequency, L2
+    normalized); a query is scored against all pairs with one matrix-vector
+    product.
+    """
+
+    def __init__(self, pairs: List[Tuple[str, str]]):
+        self.pairs = pairs
+        counts = np.zeros((len(pairs), HASH_DIM), dtype=np.float32)
+        for row, (fan_line, _) in enumerate(pairs):
+            counts[row] = np.bincount(_ngram_buckets(fan_line), minlength=HASH_DIM)
+        document_frequency = np.count_nonzero(counts, axis=0)
+        self._idf = (np.log((1 + len(pairs)) / (1 + document_frequency)) + 1).astype(np.float32)
+        self._vectors = self._normalize(np.log1p(counts) * self._idf)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def top_k(self, query: str, k: int) -> List[Tuple[str, str]]:
+        """
+        Return the k pairs whose fan message is most similar to query.
+
+        Args:
+            query: Text to match (usually the fan's latest message)
+            k: Number of pairs to return
+
+        Returns:
+            The selected pairs in their original order (all pairs if k is at
+            least the index size, the first k if query is empty)
+        """
+        if k >= len(self.pairs):
+            return list(self.pairs)
+        if k <= 0:
+            return []
+        if not query or not query.strip():
+            return self.pairs[:k]
+        query_vector = self._normalize(
+            np.log1p(np.bincount(_ngram_buckets(query), minlength=HASH_DIM).astype(np.float32)) * self._idf
+        )
+        scores = self._vectors @ query_vector
+        selected = np.argpartition(-scores, k - 1)[:k]
+        return [self.pairs[i] for i in np.sort(selected)]
+
+
+def creator_example_index(creator_id: str, base: ExampleIndex) -> ExampleIndex:
+    """
+    Return the index of base examples plus the creator's own example file.
+
+    Args:
+        creator_id: Creator whose file (<EXAMPLES_DIR>/<creator_id>.txt) to add
+        base: Index of the shared examples
+
+    Returns:
+        A combined index, or base itself if the creator has no example file
+    """
+    index = creator_index_cache.get(creator_id)
+    if index is not MISSING:
+        return index
+    path = os.path.join(EXAMPLES_DIR, f"{os.path.basename(str(creator_id))}.txt")
+    index = base
+    if os.path.isfile(path):
+        with open(path, encoding="utf-8") as examples_file:
+            creator_pairs = parse_example_pairs(examples_file.read())
+        if creator_pairs:
+            index = ExampleIndex(base.pairs + creator_pairs)
+    creator_index_cache.set(creator_id, index)
+    return index
+
+
+def latest_fan_message(chat_history: List[Dict[str, Any]]) -> Optional[str]:
+    """Content of the newest fan message in the history, whatever its order."""
+    fan_messages = [chat for chat in chat_history if chat.get("sender", chat.get("role")) in ("fan", "user")]
+    if not fan_messages:
+        return None
+    newest = max(fan_messages, key=lambda chat: (str(chat.get("created_at") or ""), str(chat.get("id") or "")))
+    return newest.get("content", newest.get("message"))
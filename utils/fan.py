@@ -1,5 +1,20 @@
-from typing import Dict, Any
-from supabase import Client
+from typing import Dict, List, Any, Optional
+from supabase import AsyncClient, Client
+from utils.cache import TTLCache, MISSING
+from utils.bulk import get_rows_by_ids
+from utils.listing import ListPage, list_page, prefix_pattern
+import os
+
+# Fans change more often (lifetime spend), so keep their TTL short
+fan_cache = TTLCache(
+    name="fan",
+    ttl=float(os.getenv("FAN_CACHE_TTL", "60")),
+    maxsize=int(os.getenv("FAN_CACHE_SIZE", "10000"))
+)
+
+# Column the name_prefix filter of /get_fans matches; the fan table has
+# no name column by default, so the filter is off unless one is configured
+FAN_NAME_COLUMN = os.getenv("FAN_NAME_COLUMN", "")
 
 
 def get_fan_by_id(supabase: Client,fan_id: str) -> Dict[str, Any]:
@@ -10,12 +25,125 @@ def get_fan_by_id(supabase: Client,fan_id: str) -> Dict[str, Any]:
         fan_id: The fan ID to fetch
         
     Returns:
-        Fan data dictionary
+        Fan data dictionary (shared with the cache, treat as read-only)
         
     Raises:
         ValueError: If fan not found
     """
+    fan = fan_cache.get(fan_id)
+    if fan is not MISSING:
+        return fan
     fan_response = supabase.table("fan").select("*").eq("id", fan_id).execute()
     if not fan_response.data:
         raise ValueError("Fan not found")
-    return fan_response.data[0]
\ No newline at end of file
+    fan = fan_response.data[0]
+    fan_cache.set(fan_id, fan)
+    return fan
+
+
+async def aget_fan_by_id(supabase: AsyncClient, fan_id: str) -> Dict[str, Any]:
+    """
+    Async variant of get_fan_by_id, sharing the same cache.
+    
+    Args:
+        supabase: Async Supabase client instance
+        fan_id: The fan ID to fetch
+        
+    Returns:
+        Fan data dictionary (shared with the cache, treat as read-only)
+        
+    Raises:
+        ValueError: If fan not found
+    """
+    fan = fan_cache.get(fan_id)
+    if fan is not MISSING:
+        return fan
+    fan_response = await supabase.table("fan").select("*").eq("id", fan_id).execute()
+    if not fan_response.data:
+        raise ValueError("Fan not found")
+    fan = fan_response.data[0]
+    fan_cache.set(fan_id, fan)
+    return fan
+
+
+def get_fans_by_ids(supabase: Client, fan_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Helper function to get many fans at once.
+    
+    Cached fans are served from the cache; the rest are loaded with
+    in_ queries and cached.
+    
+    Args:
+        supabase: Supabase client instance
+        fan_ids: The fan IDs to fetch
+        
+    Returns:
+        Dictionary of fan ID to fan data (fans that don't exist are left out)
+    """
+    return get_rows_by_ids(supabase, "fan", fan_ids, fan_cache)
+
+
+def list_fans(
+    supabase: Client,
+    limit: int,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    name_prefix: Optional[str] = None,
+    creator_id: Optional[str] = None
+) -> ListPage:
+    """
+    Helper function to get one page of fans.
+    
+    Args:
+        supabase: Supabase client instance
+        limit: Maximum number of fans in the page
+        cursor: next_cursor of the previous page
+        fields: Columns to return (all when None)
+        name_prefix: Only fans whose FAN_NAME_COLUMN starts with it
+            (case-insensitive)
+        creator_id: Only fans with at least one message with this creator
+        
+    Returns:
+        ListPage of fan rows ordered by id
+    
+    Raises:
+        ValueError: If name_prefix is given but FAN_NAME_COLUMN is not set
+    """
+    select = ",".join(fields) if fields else "*"
+    if creator_id:
+        # Inner join on the conversation, capped at one message per fan
+        select += ",of_chat_message!inner(creator_id)"
+    query = supabase.table("fan").select(select)
+    if name_prefix:
+        if not FAN_NAME_COLUMN:
+            raise ValueError("name_prefix is not supported: FAN_NAME_COLUMN is not set")
+        query = query.ilike(FAN_NAME_COLUMN, prefix_pattern(name_prefix))
+    if creator_id:
+        query = query.eq("of_chat_message.creator_id", creator_id).limit(1, foreign_table="of_chat_message")
+    page = list_page(query, limit, cursor)
+    for fan in page.rows:
+        fan.pop("of_chat_message", None)
+        if not fields:
+            cache_fan(fan)
+    return page
+
+
+def cache_fan(fan: Dict[str, Any]) -> None:
+    """
+    Store a freshly written fan row in the cache.
+    
+    Args:
+        fan: Fan row as returned by an insert or update
+    """
+    if fan and fan.get("id"):
+        fan_cache.set(fan["id"], fan)
+
+
+def invalidate_fan(fan_id: str) -> None:
+    """
+    Drop a fan from the cache so the next lookup hits the database.
+    
+    Args:
+        fan_id: The fan ID to invalidate
+    """
+    fan_cache.invalidate(fan_id)
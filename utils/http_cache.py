@@ -0,0 +1,103 @@
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from utils.cache import TTLCache, MISSING
+import hashlib
+import json
+import os
+
+# Sent with every ETag'd response: clients and CDNs may store it but must
+# revalidate (If-None-Match) before reuse, so a changed row is never served
+# stale. Responses depend on the API key, hence the Vary.
+HTTP_CACHE_CONTROL = os.getenv("HTTP_CACHE_CONTROL", "no-cache")
+HTTP_VARY = "X-API-Key"
+
+# Serialized bodies of responses whose ETag is known before serializing
+# (see conditional_body), keyed by ETag
+response_body_cache = TTLCache(
+    name="response_body",
+    ttl=float(os.getenv("RESPONSE_BODY_CACHE_TTL", "60")),
+    maxsize=int(os.getenv("RESPONSE_BODY_CACHE_SIZE", "1024"))
+)
+
+
+def rows_basis(rows: Iterable[Dict[str, Any]], *extra: Any) -> Optional[str]:
+    """
+    Fingerprint of rows by id and updated_at, as a conditional_body basis.
+
+    updated_at is bumped by a trigger on every update
+    (ddls/updated_at.sql), so together with the id it stands for the whole
+    row. extra holds whatever else shapes the body (projection, cursors).
+
+    Returns:
+        The fingerprint, or None when a row has no updated_at (the column is
+        not migrated or not selected), in which case the body is hashed
+    """
+    versions = []
+    for row in rows:
+        if not row.get("updated_at"):
+            return None
+        versions.append(f"{row.get('id')}@{row['updated_at']}")
+    return "|".join([str(value) for value in extra] + versions)
+
+
+def json_body(payload: Any) -> bytes:
+    """
+    Serialize a JSON response body.
+
+    The Flask and ASGI routes both use this, so the bodies they put in
+    response_body_cache under a strong ETag are the same bytes.
+    """
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(data: bytes) -> str:
+    """Strong ETag (quoted) of some bytes."""
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header value matches an ETag.
+
+    Uses the weak comparison RFC 9110 prescribes for If-None-Match, so a
+    W/ prefix added by a proxy still matches.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+
+def conditional_body(
+    if_none_match: Optional[str],
+    serialize: Callable[[], bytes],
+    basis: Optional[str] = None
+) -> Tuple[str, Optional[bytes]]:
+    """
+    Resolve the ETag and body of a conditional GET.
+
+    Without a basis the body is serialized once and the ETag is its hash.
+    With a basis (a cheap fingerprint that changes whenever the body would,
+    e.g. the ids of immutable rows) the ETag is derived from it first, so a
+    matching If-None-Match or an already cached body skips serialization.
+
+    Args:
+        if_none_match: The request's If-None-Match header
+        serialize: Returns the response body
+        basis: Optional fingerprint of the response content
+
+    Returns:
+        Tuple of (ETag, body); body is None when the client's copy is
+        current and a 304 should be sent
+    """
+    if basis is None:
+        body = serialize()
+        etag = make_etag(body)
+        return etag, None if etag_matches(if_none_match, etag) else body
+    etag = make_etag(basis.encode("utf-8"))
+    if etag_matches(if_none_match, etag):
+        return etag, None
+    body = response_body_cache.get(etag)
+    if body is MISSING:
+        body = serialize()
+        response_body_cache.set(etag, body)
+    return etag, body
@@ -0,0 +1,383 @@
+"""
+Shared HTTP transport for the Mistral and Supabase clients.
+
+Every outbound client is built on an httpx client with an explicit pool
+size, keep-alive expiry, timeouts and (when the h2 package is installed)
+HTTP/2, and with a transport that counts requests in flight and measures
+how long each waited for the pool. warm_up_connections opens the
+connections before the first request needs them.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from supabase import AsyncClient, AsyncClientOptions, Client, ClientOptions, acreate_client, create_client
+from mistralai import Mistral
+import asyncio
+import httpx
+import importlib.util
+import os
+import threading
+import time
+
+# Pool per client: connections in total, and idle ones kept open for reuse
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "32"))
+# Seconds an idle connection is kept before it is closed
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+
+# HTTP/2 multiplexes concurrent requests over one connection; needs h2
+HTTP2 = os.getenv("HTTP2", "true").lower() in ("1", "true", "yes") and importlib.util.find_spec("h2") is not None
+
+# Seconds: connect (TCP + TLS), read (between bytes; Mistral generations
+# stream slowly), write, and waiting for a free connection from the pool
+HTTP_TIMEOUT = httpx.Timeout(
+    connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+    read=float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+    write=float(os.getenv("HTTP_WRITE_TIMEOUT", "10")),
+    pool=float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+)
+# Retries of failed connection attempts (never of sent requests)
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", "1"))
+
+# Open connections at startup, how many per client, and (when > 0) seconds
+# between warm-ups that keep them open through quiet periods
+HTTP_WARMUP = os.getenv("HTTP_WARMUP", "true").lower() in ("1", "true", "yes")
+HTTP_WARMUP_CONNECTIONS = int(os.getenv("HTTP_WARMUP_CONNECTIONS", "1" if HTTP2 else "4"))
+HTTP_KEEP_WARM_INTERVAL = float(os.getenv("HTTP_KEEP_WARM_INTERVAL", "0"))
+
+MISTRAL_SERVER_URL = os.getenv("MISTRAL_SERVER_URL", "https://api.mistral.ai")
+
+# A request that waited longer than this for a connection (or, over HTTP/2,
+# a free stream) counts as a pool wait
+HTTP_POOL_WAIT_THRESHOLD_MS = float(os.getenv("HTTP_POOL_WAIT_THRESHOLD_MS", "1"))
+
+# Events of httpx's "trace" request extension that mark the end of the pool
+# wait: a new connection starts, or the request goes out on an existing one
+_POOL_ACQUIRED_EVENTS = ("connect_tcp.started", "connect_unix_socket.started", "send_request_headers.started")
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+)
+
+
+class PoolStats:
+    """Request counters of one connection pool."""
+
+    def __init__(self, name: str, max_connections: int):
+        self.name = name
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.waits = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.pool_timeouts = 0
+        self.errors = 0
+        self.warmups = 0
+        self.last_warmup_ms = 0.0
+
+    def acquire(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def waited(self, wait_ms: float) -> None:
+        with self._lock:
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            if wait_ms > HTTP_POOL_WAIT_THRESHOLD_MS:
+                self.waits += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def failed(self, error: Exception) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.errors += 1
+            if isinstance(error, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+
+    def warmed(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self.warmups += 1
+            self.last_warmup_ms = elapsed_ms
+
+    def stats(self, pool: Any = None) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "http2": HTTP2,
+                "max_connections": self.max_connections,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "requests": self.requests,
+                "waits": self.waits,
+                "avg_wait_ms": round(self.total_wait_ms / self.requests, 2) if self.requests else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 2),
+                "pool_timeouts": self.pool_timeouts,
+                "errors": self.errors,
+                "warmups": self.warmups,
+                "last_warmup_ms": round(self.last_warmup_ms, 2)
+            }
+        # httpcore's pool lists its connections; not part of httpx's API,
+        # so it is only reported when present
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            connections = list(connections)
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for connection in connections if connection.is_idle())
+        return stats
+
+
+def _trace_pool_wait(request: httpx.Request, stats: PoolStats, is_async: bool = False) -> None:
+    """
+    Record how long request waits for the pool, through httpx's trace
+    extension (chained with a trace the caller set; httpcore awaits the
+    callback of an async transport, so is_async picks its kind).
+
+    The wait ends when httpcore starts opening a connection for the request
+    or sends its headers on an existing one. This includes waiting for a
+    free HTTP/2 stream, which request counts cannot show.
+    """
+    started = time.perf_counter()
+    previous = request.extensions.get("trace")
+    recorded = False
+
+    def record(event: str) -> None:
+        nonlocal recorded
+        if not recorded and event.endswith(_POOL_ACQUIRED_EVENTS):
+            recorded = True
+            stats.waited((time.perf_counter() - started) * 1000)
+
+    if is_async:
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            record(event)
+            if previous is not None:
+                await previous(event, info)
+    else:
+        def trace(event: str, info: Dict[str, Any]) -> None:
+            record(event)
+            if previous is not None:
+                previous(event, info)
+    request.extensions["trace"] = trace
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body that returns its pool slot when closed (a streamed body holds it until then)."""
+
+    def __init__(self, stream: httpx.SyncByteStream, stats: PoolStats):
+        self._stream = stream
+        self._stats = stats
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._stats.release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """Async counterpart of _ReleasingStream."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, stats: PoolStats):
+        self._stream = stream
+        self._stats = stats
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._stats.release()
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """HTTPTransport that records pool usage in a PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.acquire()
+        _trace_pool_wait(request, self.stats)
+        try:
+            response = super().handle_request(request)
+        except Exception as e:
+            self.stats.failed(e)
+            raise
+        response.stream = _ReleasingStream(response.stream, self.stats)
+        return response
+
+
+class AsyncInstrumentedTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that records pool usage in a PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.acquire()
+        _trace_pool_wait(request, self.stats, is_async=True)
+        try:
+            response = await super().handle_async_request(request)
+        except Exception as e:
+            self.stats.failed(e)
+            raise
+        response.stream = _AsyncReleasingStream(response.stream, self.stats)
+        return response
+
+
+# name -> (stats, transport, client, warm-up URL, warm-up headers)
+_pools: Dict[str, Tuple[PoolStats, Any, Any, str, Dict[str, str]]] = {}
+
+
+def http_client(name: str, warmup_url: str, warmup_headers: Optional[Dict[str, str]] = None) -> httpx.Client:
+    """Pooled, instrumented httpx client registered under name for warm-up and metrics."""
+    stats = PoolStats(name, HTTP_MAX_CONNECTIONS)
+    transport = InstrumentedTransport(stats, http2=HTTP2, limits=HTTP_LIMITS, retries=HTTP_CONNECT_RETRIES)
+    client = httpx.Client(transport=transport, timeout=HTTP_TIMEOUT)
+    _pools[name] = (stats, transport, client, warmup_url, warmup_headers or {})
+    return client
+
+
+def async_http_client(name: str, warmup_url: str, warmup_headers: Optional[Dict[str, str]] = None) -> httpx.AsyncClient:
+    """Async counterpart of http_client (its warm-up runs in awarm_up_connections)."""
+    stats = PoolStats(name, HTTP_MAX_CONNECTIONS)
+    transport = AsyncInstrumentedTransport(stats, http2=HTTP2, limits=HTTP_LIMITS, retries=HTTP_CONNECT_RETRIES)
+    client = httpx.AsyncClient(transport=transport, timeout=HTTP_TIMEOUT)
+    _pools[name] = (stats, transport, client, warmup_url, warmup_headers or {})
+    return client
+
+
+def _supabase_headers(key: str) -> Dict[str, str]:
+    return {"apikey": key, "Authorization": f"Bearer {key}"}
+
+
+def _client_options(options_class: Any, client: Any) -> Any:
+    try:
+        return options_class(httpx_client=client)
+    except TypeError:
+        # supabase-py releases before httpx_client was added build their own
+        # clients; only the timeout can be set
+        print("Installed supabase-py does not accept httpx_client; using its own connection pool")
+        return options_class(postgrest_client_timeout=HTTP_TIMEOUT)
+
+
+def create_supabase_client(url: str, key: str) -> Client:
+    """Supabase client on the shared "supabase" pool."""
+    client = http_client("supabase", f"{url}/rest/v1/", _supabase_headers(key))
+    return create_client(url, key, options=_client_options(ClientOptions, client))
+
+
+async def acreate_supabase_client(url: str, key: str) -> AsyncClient:
+    """Async Supabase client on the shared "supabase_async" pool."""
+    client = async_http_client("supabase_async", f"{url}/rest/v1/", _supabase_headers(key))
+    return await acreate_client(url, key, options=_client_options(AsyncClientOptions, client))
+
+
+# One Mistral client for the whole process (recommendations and summaries),
+# so both share a pool of warm connections
+mistral_client = Mistral(
+    api_key=os.getenv("MISTRAL_API_KEY"),
+    server_url=MISTRAL_SERVER_URL,
+    client=http_client("mistral", f"{MISTRAL_SERVER_URL}/v1/models"),
+    async_client=async_http_client("mistral_async", f"{MISTRAL_SERVER_URL}/v1/models")
+)
+
+
+def _warm_up(name: str) -> None:
+    stats, _, client, url, headers = _pools[name]
+    started = time.perf_counter()
+    # Concurrent requests so each opens its own connection
+    threads = [
+        threading.Thread(target=_warm_request, args=(client, url, headers))
+        for _ in range(HTTP_WARMUP_CONNECTIONS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.warmed((time.perf_counter() - started) * 1000)
+
+
+def _warm_request(client: httpx.Client, url: str, headers: Dict[str, str]) -> None:
+    try:
+        # Any response will do: the point is the TCP and TLS handshake
+        client.head(url, headers=headers).close()
+    except Exception as e:
+        print(f"Connection warm-up of {url} failed: {str(e)}")
+
+
+def warm_up_connections() -> None:
+    """Open HTTP_WARMUP_CONNECTIONS connections in every sync pool."""
+    for name, (_, _, client, _, _) in list(_pools.items()):
+        if isinstance(client, httpx.Client):
+            _warm_up(name)
+
+
+async def awarm_up_connections() -> None:
+    """Open HTTP_WARMUP_CONNECTIONS connections in every async pool."""
+    async def warm_request(client: httpx.AsyncClient, url: str, headers: Dict[str, str]) -> None:
+        try:
+            await client.head(url, headers=headers)
+        except Exception as e:
+            print(f"Connection warm-up of {url} failed: {str(e)}")
+
+    async def warm(stats: PoolStats, client: httpx.AsyncClient, url: str, headers: Dict[str, str]) -> None:
+        started = time.perf_counter()
+        await asyncio.gather(*(warm_request(client, url, headers) for _ in range(HTTP_WARMUP_CONNECTIONS)))
+        stats.warmed((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(
+        warm(stats, client, url, headers)
+        for stats, _, client, url, headers in list(_pools.values())
+        if isinstance(client, httpx.AsyncClient)
+    ))
+
+
+def start_warm_up() -> Optional[threading.Thread]:
+    """
+    Warm the sync pools in the background, then every HTTP_KEEP_WARM_INTERVAL
+    seconds when it is set, so the first request after a quiet period does
+    not pay the handshakes either.
+    """
+    if not HTTP_WARMUP:
+        return None
+
+    def run():
+        while True:
+            warm_up_connections()
+            if HTTP_KEEP_WARM_INTERVAL <= 0:
+                return
+            time.sleep(HTTP_KEEP_WARM_INTERVAL)
+
+    thread = threading.Thread(target=run, name="http-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Usage of every pool, for the metrics endpoint."""
+    return {
+        name: stats.stats(getattr(transport, "_pool", None))
+        for name, (stats, transport, _, _, _) in list(_pools.items())
+    }
@@ -0,0 +1,289 @@
+"""
+Bulk import of historical chat messages into of_chat_message.
+
+Input is NDJSON (one message object per line) or CSV (header row with the
+column names), read as a stream so memory stays flat however large the file
+is. Run from the command line with:
+
+    python -m utils.ingest messages.ndjson
+    python -m utils.ingest messages.csv --format csv --batch-size 1000
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from supabase import Client
+from postgrest import ReturnMethod
+from utils.bulk import insert_isolating_rejects, is_transient_write_error
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import uuid
+
+# Namespace of the ids derived for rows that come without one
+MESSAGE_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "of_chat_message")
+
+# Rows per PostgREST request, and attempts per batch before it is given up
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", "0.5"))
+
+# Rejected rows listed in the report (the rest are only counted)
+INGEST_MAX_REPORTED_ERRORS = int(os.getenv("INGEST_MAX_REPORTED_ERRORS", "100"))
+
+INGEST_FORMATS = ("ndjson", "csv")
+
+MESSAGE_COLUMNS = ("id", "creator_id", "fan_id", "sender", "content", "created_at", "metadata")
+REQUIRED_COLUMNS = ("creator_id", "fan_id", "sender", "content", "created_at")
+SENDERS = ("creator", "fan")
+
+
+def read_ndjson(stream: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, parsed object) for each non-blank NDJSON line; bad JSON yields the error."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+
+def read_csv(stream: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, row dictionary) for each CSV record after the header."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def validate_message_row(row: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Check a row against the of_chat_message schema.
+
+    Every accepted row gets an id so a batch can be retried, or the file
+    imported again, without inserting it twice. A given id is kept; otherwise
+    it is derived from the creator, fan, timestamp, sender and content, so
+    the same message always gets the same id. metadata defaults to {}.
+
+    Args:
+        row: Parsed NDJSON object or CSV row
+
+    Returns:
+        Tuple of (row ready to insert, None) or (None, reason it was rejected)
+    """
+    if isinstance(row, Exception):
+        return None, f"Invalid JSON: {str(row)}"
+    if not isinstance(row, dict):
+        return None, "Row must be an object"
+    # CSV leaves empty cells as "" and extra cells under the None key
+    row = {key: value for key, value in row.items() if value not in (None, "")}
+    unknown = sorted(str(key) for key in row if key not in MESSAGE_COLUMNS)
+    if unknown:
+        return None, f"Unknown columns: {', '.join(unknown)}"
+    missing = [column for column in REQUIRED_COLUMNS if column not in row]
+    if missing:
+        return None, f"Missing columns: {', '.join(missing)}"
+
+    message = {}
+    for column in ("id", "creator_id", "fan_id"):
+        if column not in row:
+            continue
+        try:
+            message[column] = str(uuid.UUID(str(row[column])))
+        except ValueError:
+            return None, f"{column} must be a UUID"
+
+    if row["sender"] not in SENDERS:
+        return None, f"sender must be one of: {', '.join(SENDERS)}"
+    message["sender"] = row["sender"]
+
+    if not isinstance(row["content"], str) or not row["content"].strip():
+        return None, "content must be a non-empty string"
+    message["content"] = row["content"]
+
+    try:
+        message["created_at"] = datetime.fromisoformat(str(row["created_at"])).isoformat()
+    except ValueError:
+        return None, "created_at must be an ISO 8601 timestamp"
+
+    metadata = row.get("metadata", {})
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            return None, "metadata must be a JSON object"
+    if not isinstance(metadata, dict):
+        return None, "metadata must be a JSON object"
+    message["metadata"] = metadata
+
+    if "id" not in message:
+        message["id"] = str(uuid.uuid5(MESSAGE_ID_NAMESPACE, json.dumps(
+            [message["creator_id"], message["fan_id"], message["created_at"], message["sender"], message["content"]]
+        )))
+
+    return message, None
+
+
+def insert_message_batch(
+    supabase: Client,
+    batch: List[Dict[str, Any]],
+    max_retries: int = INGEST_MAX_RETRIES
+) -> Tuple[int, List[Tuple[int, Exception]]]:
+    """
+    Insert a batch of validated messages.
+
+    Rows are upserted on id with duplicates ignored, so a retry after a
+    request that reached the database (or a re-run of the same file) does
+    not create duplicates. Transient errors (connection failures, 5xx) are
+    retried with exponential backoff. Rows the database rejects (4xx, e.g.
+    an unknown creator_id) are isolated by splitting the batch, and the
+    other rows are still inserted.
+
+    Args:
+        supabase: Supabase client instance
+        batch: Rows returned by validate_message_row
+        max_retries: Attempts per request before a transient error is raised
+
+    Returns:
+        Tuple of (number of retries, (index in batch, error) of each rejected row)
+
+    Raises:
+        Exception: If a transient error persists, or any other error occurs
+    """
+    retries = 0
+
+    def upsert(rows):
+        nonlocal retries
+        for attempt in range(max_retries):
+            try:
+                supabase.table("of_chat_message").upsert(
+                    rows,
+                    on_conflict="id",
+                    ignore_duplicates=True,
+                    returning=ReturnMethod.minimal
+                ).execute()
+                return
+            except Exception as e:
+                if not is_transient_write_error(e) or attempt + 1 >= max_retries:
+                    raise
+                retries += 1
+                delay = INGEST_RETRY_BACKOFF * (2 ** attempt)
+                print(f"Ingest batch failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    rejected = insert_isolating_rejects(upsert, batch)
+    return retries, rejected
+
+
+def ingest_chat_messages(
+    supabase: Client,
+    stream: Iterable[str],
+    input_format: str = "ndjson",
+    batch_size: int = INGEST_BATCH_SIZE,
+    max_retries: int = INGEST_MAX_RETRIES
+) -> Dict[str, Any]:
+    """
+    Validate and insert chat messages from an NDJSON or CSV stream.
+
+    Lines are read one at a time and at most one batch is held in memory.
+    Invalid rows, and rows the database rejects, are skipped and reported; a
+    batch that still fails after max_retries is counted as failed and the
+    import moves on.
+
+    Args:
+        supabase: Supabase client instance
+        stream: Text lines (an open file, or a request body wrapper)
+        input_format: "ndjson" or "csv"
+        batch_size: Rows per insert request
+        max_retries: Attempts per batch
+
+    Returns:
+        Report with row counts, retries, elapsed seconds, rows per second and
+        up to INGEST_MAX_REPORTED_ERRORS rejected rows (line and error)
+    """
+    if input_format not in INGEST_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(INGEST_FORMATS)}")
+    rows = read_csv(stream) if input_format == "csv" else read_ndjson(stream)
+
+    report = {
+        "rows_read": 0,
+        "inserted": 0,
+        "rejected": 0,
+        "failed": 0,
+        "batches": 0,
+        "failed_batches": 0,
+        "retries": 0,
+        "errors": []
+    }
+    started = time.monotonic()
+    batch = []
+    batch_lines = []
+
+    def reject(line_number, error):
+        report["rejected"] += 1
+        if len(report["errors"]) < INGEST_MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_number, "error": error})
+
+    def flush():
+        report["batches"] += 1
+        try:
+            retries, rejected = insert_message_batch(supabase, batch, max_retries)
+            report["retries"] += retries
+            report["inserted"] += len(batch) - len(rejected)
+            for index, error in rejected:
+                reject(batch_lines[index], getattr(error, "message", None) or str(error))
+        except Exception as e:
+            print(f"Ingest batch of {len(batch)} rows failed: {str(e)}")
+            report["failed"] += len(batch)
+            report["failed_batches"] += 1
+        batch.clear()
+        batch_lines.clear()
+
+    for line_number, row in rows:
+        report["rows_read"] += 1
+        message, error = validate_message_row(row)
+        if error:
+            reject(line_number, error)
+            continue
+        batch.append(message)
+        batch_lines.append(line_number)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    elapsed = time.monotonic() - started
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["inserted"] / elapsed, 1) if elapsed > 0 else 0.0
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point; prints the report as JSON."""
+    parser = argparse.ArgumentParser(description="Import historical chat messages into of_chat_message")
+    parser.add_argument("path", help="NDJSON or CSV file, or - for stdin")
+    parser.add_argument("--format", choices=INGEST_FORMATS, help="Input format (default: from the file extension, else ndjson)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--max-retries", type=int, default=INGEST_MAX_RETRIES)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from utils.http_clients import create_supabase_client
+    load_dotenv()
+    supabase = create_supabase_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+
+    input_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    if args.path == "-":
+        report = ingest_chat_messages(supabase, sys.stdin, input_format, args.batch_size, args.max_retries)
+    else:
+        with open(args.path, encoding="utf-8", newline="") as stream:
+            report = ingest_chat_messages(supabase, stream, input_format, args.batch_size, args.max_retries)
+
+    print(json.dumps(report, indent=2))
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+from typing import Any, Dict, List, NamedTuple, Optional
+import os
+import re
+import uuid
+
+# Rows per list page when no limit is given, and the largest limit accepted
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "100"))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "1000"))
+
+_COLUMN_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class ListPage(NamedTuple):
+    """One page of a list endpoint, ordered by id."""
+    rows: List[Dict[str, Any]]
+    has_more: bool
+    next_cursor: Optional[str]
+
+
+def parse_page_limit(value: Optional[str], default: int, maximum: int) -> int:
+    """
+    Parse a limit query parameter.
+
+    Raises:
+        ValueError: If it is not an integer between 1 and maximum
+    """
+    if value is None or value == "":
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"limit must be between 1 and {maximum}")
+    return limit
+
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated fields= projection.
+
+    id is always included because the cursor is built from it.
+
+    Returns:
+        Column names, or None to select every column
+
+    Raises:
+        ValueError: If a field is not a plain column name
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    invalid = [field for field in fields if not _COLUMN_NAME.match(field)]
+    if invalid:
+        raise ValueError(f"Invalid fields: {', '.join(invalid)}")
+    return list(dict.fromkeys(["id"] + fields))
+
+
+def parse_list_cursor(value: Optional[str]) -> Optional[str]:
+    """
+    Validate a list cursor (the id of the last row of the previous page).
+
+    Raises:
+        ValueError: If the cursor is not a UUID
+    """
+    if not value:
+        return None
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def prefix_pattern(prefix: str) -> str:
+    """ilike pattern matching values that start with prefix (wildcards in it are escaped)."""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "")
+    return f"{escaped}*"
+
+
+def list_page(query: Any, limit: int, cursor: Optional[str]) -> ListPage:
+    """
+    Fetch one page of a filtered query with keyset pagination on id.
+
+    Args:
+        query: PostgREST select query with its filters applied
+        limit: Maximum number of rows in the page
+        cursor: Id of the last row of the previous page
+
+    Returns:
+        ListPage; next_cursor is None on the last page
+    """
+    if cursor:
+        query = query.gt("id", cursor)
+    # One extra row tells whether there is another page
+    response = query.order("id").limit(limit + 1).execute()
+    rows = response.data or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return ListPage(rows=rows, has_more=has_more, next_cursor=rows[-1]["id"] if has_more else None)
@@ -0,0 +1,296 @@
+"""
+Rule-based choice of the model and generation parameters per request.
+
+Rules come from MODEL_ROUTING_RULES (a JSON list, or @path to a JSON file)
+and are tried in order; the first whose conditions all match picks the
+model, temperature and max_tokens, otherwise the default route applies.
+Conditions: min_lifetime_spend / max_lifetime_spend (the fan's spend),
+chat_types (list). A fan whose spend is not a number matches no rule with
+a spend condition. A rule may also set latency_budget_ms and
+max_cost_usd. Example:
+
+    [
+      {"name": "top_spenders", "min_lifetime_spend": 500, "model": "mistral-medium-latest"},
+      {"name": "media", "chat_types": ["image", "video"], "max_tokens": 300}
+    ]
+
+The chosen model is then checked against the measured latency of recent
+calls. When its p95 exceeds its SLO (MODEL_LATENCY_SLOS_MS), the rule's
+latency budget or the time left until the request deadline, or its
+estimated cost exceeds the rule's max_cost_usd, the request falls back
+along MODEL_FALLBACKS to a faster or cheaper model. Every decision is
+logged with the latency and outcome of the call it routed.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from utils.cache import MISSING
+from utils.call_policy import remaining_seconds
+from utils.context_builder import token_budget
+import json
+import os
+import random
+import re
+import threading
+import time
+
+
+def _json_env(name: str, default: str) -> Any:
+    value = os.getenv(name, default)
+    if value.startswith("@"):
+        with open(value[1:], encoding="utf-8") as config:
+            return json.load(config)
+    return json.loads(value)
+
+
+MODEL_ROUTING_RULES: List[Dict[str, Any]] = _json_env("MODEL_ROUTING_RULES", "[]")
+
+# Faster model to use when a model is over its SLO, by model
+MODEL_FALLBACKS: Dict[str, str] = {
+    "mistral-large-latest": "mistral-medium-latest",
+    "mistral-medium-latest": "mistral-small-latest",
+    "mistral-small-latest": "ministral-8b-latest"
+}
+MODEL_FALLBACKS.update(_json_env("MODEL_FALLBACKS", "{}"))
+
+# p95 latency a model may have before requests fall back, in milliseconds
+MODEL_LATENCY_SLO_MS = float(os.getenv("MODEL_LATENCY_SLO_MS", "6000"))
+MODEL_LATENCY_SLOS_MS: Dict[str, float] = _json_env("MODEL_LATENCY_SLOS_MS", "{}")
+
+# USD per million tokens (prompt and completion alike), for max_cost_usd;
+# models without a price are treated as free
+MODEL_PRICES: Dict[str, float] = _json_env("MODEL_PRICES", "{}")
+
+# Latencies older than this are forgotten, and at least
+# MODEL_LATENCY_MIN_SAMPLES are needed before a model counts as slow, so a
+# model recovers once it has been left alone for a while
+MODEL_LATENCY_WINDOW = float(os.getenv("MODEL_LATENCY_WINDOW", "300"))
+MODEL_LATENCY_MIN_SAMPLES = int(os.getenv("MODEL_LATENCY_MIN_SAMPLES", "10"))
+
+# Share of requests that still go to a model that is over its SLO, so its
+# latency keeps being measured
+MODEL_ROUTING_PROBE_RATE = float(os.getenv("MODEL_ROUTING_PROBE_RATE", "0.05"))
+
+# Print one JSON line per routed call
+MODEL_ROUTING_LOG = os.getenv("MODEL_ROUTING_LOG", "true").lower() in ("1", "true", "yes")
+
+
+def parse_spend(value: Any) -> Optional[float]:
+    """
+    Read a fan's lifetime_spend, which is stored as free text.
+
+    Currency symbols, thousands separators and whitespace are ignored
+    ("$1,200" is 1200.0); an empty value is 0. Returns None when the value
+    is not a number.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return float(value or 0)
+    text = re.sub(r"[^0-9.+-]", "", str(value))
+    if not text:
+        return None if str(value).strip() else 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class RouteDecision(NamedTuple):
+    """Model and generation parameters chosen for one request, and why."""
+    rule: str
+    model: str
+    temperature: float
+    max_tokens: int
+    primary_model: str
+    reason: str
+
+
+class _ModelLatency:
+    """Recent call latencies of one model."""
+
+    def __init__(self, maxlen: int = 1000):
+        self.samples = deque(maxlen=maxlen)
+        self.calls = 0
+        self.errors = 0
+
+    def p95(self, now: float) -> Optional[float]:
+        while self.samples and self.samples[0][0] < now - MODEL_LATENCY_WINDOW:
+            self.samples.popleft()
+        if len(self.samples) < MODEL_LATENCY_MIN_SAMPLES:
+            return None
+        latencies = sorted(latency for _, latency in self.samples)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+class ModelRouter:
+    """Routes recommendation requests to a model by rules and measured latency."""
+
+    def __init__(self, default_model: str, default_temperature: float, default_max_tokens: int, rules: Optional[List[Dict[str, Any]]] = None):
+        self.default_route = {
+            "name": "default",
+            "model": default_model,
+            "temperature": default_temperature,
+            "max_tokens": default_max_tokens
+        }
+        self.rules = MODEL_ROUTING_RULES if rules is None else rules
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, _ModelLatency] = {}
+        # (rule, model, reason) -> [decisions, errors, total latency]
+        self._decisions: Dict[Tuple[str, str, str], List[float]] = {}
+
+    def _matching_rule(self, fan: Dict[str, Any], chat_type: str) -> Dict[str, Any]:
+        spend = MISSING
+        for index, rule in enumerate(self.rules):
+            if "min_lifetime_spend" in rule or "max_lifetime_spend" in rule:
+                if spend is MISSING:
+                    spend = parse_spend(fan.get("lifetime_spend"))
+                # A spend that cannot be read matches no spend condition
+                if spend is None:
+                    continue
+                if "min_lifetime_spend" in rule and spend < float(rule["min_lifetime_spend"]):
+                    continue
+                if "max_lifetime_spend" in rule and spend >= float(rule["max_lifetime_spend"]):
+                    continue
+            if "chat_types" in rule and chat_type not in rule["chat_types"]:
+                continue
+            return {**self.default_route, "name": f"rule_{index}", **rule}
+        return self.default_route
+
+    def model_p95(self, model: str) -> Optional[float]:
+        """Recent p95 latency of a model in seconds (None without enough samples)."""
+        with self._lock:
+            latency = self._latencies.get(model)
+            return latency.p95(time.monotonic()) if latency else None
+
+    def _rejection(self, model: str, rule: Dict[str, Any], deadline: Optional[float]) -> Optional[str]:
+        """Why a model should not serve the request, or None if it may."""
+        p95 = self.model_p95(model)
+        if p95 is not None:
+            if p95 * 1000 > MODEL_LATENCY_SLOS_MS.get(model, MODEL_LATENCY_SLO_MS):
+                return "slo"
+            if "latency_budget_ms" in rule and p95 * 1000 > float(rule["latency_budget_ms"]):
+                return "latency_budget"
+            remaining = remaining_seconds(deadline)
+            if remaining is not None and p95 > remaining:
+                return "deadline"
+        if "max_cost_usd" in rule and model in MODEL_PRICES:
+            # Upper bound: a full prompt budget plus the whole completion
+            tokens = token_budget(model) + int(rule["max_tokens"])
+            if tokens * MODEL_PRICES[model] / 1_000_000 > float(rule["max_cost_usd"]):
+                return "cost"
+        return None
+
+    def route(self, fan: Dict[str, Any], chat_type: str, deadline: Optional[float] = None) -> RouteDecision:
+        """
+        Choose the model and parameters for a request.
+
+        Args:
+            fan: Fan data dictionary (lifetime_spend is used)
+            chat_type: Type of chat (text/image/video)
+            deadline: time.monotonic() by which the result is needed
+
+        Returns:
+            RouteDecision; reason is "rule" when the rule's own model is used,
+            otherwise why the last model it fell back from was skipped
+        """
+        rule = self._matching_rule(fan, chat_type)
+        model = rule["model"]
+        reason = "rule"
+        tried = {model}
+        while True:
+            rejection = self._rejection(model, rule, deadline)
+            if rejection is None:
+                break
+            fallback = MODEL_FALLBACKS.get(model)
+            if fallback is None or fallback in tried:
+                break
+            if rejection == "slo" and random.random() < MODEL_ROUTING_PROBE_RATE:
+                reason = "probe"
+                break
+            model, reason = fallback, rejection
+            tried.add(model)
+        return RouteDecision(
+            rule=rule["name"],
+            model=model,
+            temperature=float(rule["temperature"]),
+            max_tokens=int(rule["max_tokens"]),
+            primary_model=rule["model"],
+            reason=reason
+        )
+
+    def record(self, decision: RouteDecision, elapsed: float, outcome: str, **details: Any) -> None:
+        """
+        Record the outcome of a routed call.
+
+        Args:
+            decision: The decision the call was made with
+            elapsed: Seconds the call took (retries included)
+            outcome: "ok", "error" or "deadline"
+            details: Extra fields for the log line (e.g. tokens)
+        """
+        now = time.monotonic()
+        with self._lock:
+            latency = self._latencies.setdefault(decision.model, _ModelLatency())
+            latency.calls += 1
+            # Failures count towards the latency too: a model that times out
+            # is a slow model
+            latency.samples.append((now, elapsed))
+            if outcome != "ok":
+                latency.errors += 1
+            totals = self._decisions.setdefault((decision.rule, decision.model, decision.reason), [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += outcome != "ok"
+            totals[2] += elapsed
+        if MODEL_ROUTING_LOG:
+            print("model_routing " + json.dumps({
+                **decision._asdict(),
+                "latency_ms": round(elapsed * 1000, 1),
+                "outcome": outcome,
+                **details
+            }, default=str))
+
+    @contextmanager
+    def measure(self, decision: RouteDecision) -> Iterator[Dict[str, Any]]:
+        """
+        Time a block as the call routed by decision and record its outcome.
+
+        Yields a dictionary the block can add log details to (e.g. tokens).
+        """
+        details: Dict[str, Any] = {}
+        started = time.monotonic()
+        try:
+            yield details
+        except TimeoutError:
+            self.record(decision, time.monotonic() - started, "deadline", **details)
+            raise
+        except Exception:
+            self.record(decision, time.monotonic() - started, "error", **details)
+            raise
+        self.record(decision, time.monotonic() - started, "ok", **details)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-model latency and per-decision counters, for the metrics endpoint."""
+        now = time.monotonic()
+        with self._lock:
+            models = {}
+            for model, latency in self._latencies.items():
+                p95 = latency.p95(now)
+                models[model] = {
+                    "calls": latency.calls,
+                    "errors": latency.errors,
+                    "recent_samples": len(latency.samples),
+                    "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                    "slo_ms": MODEL_LATENCY_SLOS_MS.get(model, MODEL_LATENCY_SLO_MS)
+                }
+            decisions = [
+                {
+                    "rule": rule,
+                    "model": model,
+                    "reason": reason,
+                    "count": int(count),
+                    "errors": int(errors),
+                    "avg_latency_ms": round(total / count * 1000, 1) if count else 0.0
+                }
+                for (rule, model, reason), (count, errors, total) in self._decisions.items()
+            ]
+        return {"rules": len(self.rules), "models": models, "decisions": decisions}
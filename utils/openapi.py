@@ -0,0 +1,855 @@
+"""
+OpenAPI document for the API, served at /api-docs/openapi.json.
+
+Paths come from the routes registered on the Flask app, so the document
+cannot list an endpoint that does not exist or miss one that does; the
+hand-written operation docs below only add detail. The document is built
+once per process and kept serialized, with compressed variants.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from utils.batch import BATCH_MAX_ITEMS
+from utils.call_policy import REQUEST_DEADLINE_HEADER, REQUEST_DEADLINE_MS
+from utils.chat_history import CHAT_HISTORY_MAX_PAGE_SIZE, CHAT_HISTORY_PAGE_SIZE
+from utils.chats import GENERATION_MODES, RECOMMENDATION_GENERATION_MODE, RECOMMENDATION_MAX_CANDIDATES
+from utils.http_cache import make_etag
+from utils.ingest import INGEST_BATCH_SIZE
+from utils.listing import LIST_MAX_PAGE_SIZE, LIST_PAGE_SIZE
+import gzip
+import json
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional: serve gzip and identity only
+    brotli = None
+
+# Routes that are part of the dashboard rather than the API
+EXCLUDED_ENDPOINTS = {"static", "index", "login", "logout", "openapi_spec"}
+
+SPEC_INFO = {
+    "title": "Middleman AI API",
+    "version": "1.0.0",
+    "description": "API for Middleman AI Chat Recommendation System"
+}
+
+# Operation docs by path and method; routes without an entry get a stub
+# built from their view function's docstring
+PATH_OPERATIONS: Dict[str, Dict[str, Any]] = {
+    "/recommended_chats": {
+        "post": {
+            "tags": ["Chat"],
+            "summary": "Generate chat recommendations",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["fan_id", "creator_id", "system_prompt_id"],
+                            "properties": {
+                                "fan_id": {"type": "string"},
+                                "creator_id": {"type": "string"},
+                                "system_prompt_id": {"type": "string"},
+                                "chat_type": {"type": "string", "enum": ["text", "image", "video"], "default": "text"},
+                                "force_refresh": {"type": "boolean", "default": False, "description": "Bypass the recommendation cache"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "200": {
+                    "description": "Success",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "recommendations": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "reply_id": {"type": "string"},
+                                                "content": {"type": "string"},
+                                                "confidence": {"type": "number"}
+                                            }
+                                        }
+                                    },
+                                    "metadata": {
+                                        "type": "object",
+                                        "description": "Token counts of the context sent to Mistral",
+                                        "properties": {
+                                            "model": {"type": "string"},
+                                            "tokenizer": {"type": "string"},
+                                            "token_budget": {"type": "integer"},
+                                            "prompt_tokens": {"type": "integer"},
+                                            "system_prompt_tokens": {"type": "integer"},
+                                            "history_tokens": {"type": "integer"},
+                                            "history_messages": {"type": "integer"},
+                                            "history_available": {"type": "integer"},
+                                            "history_truncated": {"type": "boolean"},
+                                            "history_placement": {"type": "string", "enum": ["system_prompt", "turns"]},
+                                            "summary_tokens": {"type": "integer"},
+                                            "prompt_layout": {"type": "string", "enum": ["template", "stable_prefix"]},
+                                            "prefix_hash": {"type": "string", "description": "Hash of the prompt prefix shared by every request for the creator (stable_prefix layout only)"},
+                                            "prefix_tokens": {"type": "integer"},
+                                            "prefix_reused": {"type": "boolean"},
+                                            "static_prefix_hash": {"type": "string"},
+                                            "few_shot_tokens": {"type": "integer"},
+                                            "few_shot_source": {"type": "string", "enum": ["default", "creator"]},
+                                            "few_shot_examples": {"type": "integer"},
+                                            "few_shot_available": {"type": "integer"},
+                                            "few_shot_retrieved": {"type": "boolean"},
+                                            "routing_rule": {"type": "string", "description": "MODEL_ROUTING_RULES entry that chose the model (default when none matched)"},
+                                            "routing_reason": {"type": "string", "enum": ["rule", "probe", "slo", "latency_budget", "deadline", "cost"]},
+                                            "generation_mode": {"type": "string", "enum": list(GENERATION_MODES)},
+                                            "num_candidates": {"type": "integer"}
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/recommended_chats/batch": {
+        "post": {
+            "tags": ["Chat"],
+            "summary": "Generate chat recommendations for many conversations",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["items"],
+                            "properties": {
+                                "items": {
+                                    "type": "array",
+                                    "minItems": 1,
+                                    "maxItems": BATCH_MAX_ITEMS,
+                                    "items": {
+                                        "type": "object",
+                                        "required": ["fan_id", "creator_id", "system_prompt_id"],
+                                        "properties": {
+                                            "fan_id": {"type": "string"},
+                                            "creator_id": {"type": "string"},
+                                            "system_prompt_id": {"type": "string"},
+                                            "chat_type": {"type": "string", "enum": ["text", "image", "video"], "default": "text"}
+                                        }
+                                    }
+                                },
+                                "force_refresh": {"type": "boolean", "default": False, "description": "Bypass the recommendation cache"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "200": {
+                    "description": "One result per item, in request order; failed items carry an error instead of recommendations",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "results": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "index": {"type": "integer"},
+                                                "fan_id": {"type": "string"},
+                                                "creator_id": {"type": "string"},
+                                                "system_prompt_id": {"type": "string"},
+                                                "chat_type": {"type": "string"},
+                                                "recommendations": {"type": "array", "items": {"type": "object"}},
+                                                "metadata": {"type": "object"},
+                                                "error": {"type": "string"}
+                                            }
+                                        }
+                                    },
+                                    "succeeded": {"type": "integer"},
+                                    "failed": {"type": "integer"}
+                                }
+                            }
+                        }
+                    }
+                },
+                "400": {"description": "Missing, empty or oversized items list"}
+            }
+        }
+    },
+    "/ingest/chat_messages": {
+        "post": {
+            "tags": ["Chat"],
+            "summary": "Bulk import historical chat messages (NDJSON or CSV)",
+            "parameters": [
+                {"name": "format", "in": "query", "schema": {"type": "string", "enum": ["ndjson", "csv"]}, "description": "Defaults to csv for a text/csv body, else ndjson"},
+                {"name": "batch_size", "in": "query", "schema": {"type": "integer", "minimum": 1, "default": INGEST_BATCH_SIZE}}
+            ],
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/x-ndjson": {"schema": {"type": "string", "description": "One of_chat_message object per line: creator_id, fan_id, sender, content, created_at, optional id and metadata"}},
+                    "text/csv": {"schema": {"type": "string", "description": "Header row with the of_chat_message column names"}}
+                }
+            },
+            "responses": {
+                "200": {
+                    "description": "Import report",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "rows_read": {"type": "integer"},
+                                    "inserted": {"type": "integer"},
+                                    "rejected": {"type": "integer"},
+                                    "failed": {"type": "integer", "description": "Valid rows in batches that failed after all retries"},
+                                    "batches": {"type": "integer"},
+                                    "failed_batches": {"type": "integer"},
+                                    "retries": {"type": "integer"},
+                                    "seconds": {"type": "number"},
+                                    "rows_per_second": {"type": "number"},
+                                    "errors": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "line": {"type": "integer"},
+                                                "error": {"type": "string"}
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                },
+                "400": {"description": "Invalid format or batch_size"}
+            }
+        }
+    },
+    "/recommended_chats/stream": {
+        "post": {
+            "tags": ["Chat"],
+            "summary": "Stream chat recommendations (Server-Sent Events)",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["fan_id", "creator_id", "system_prompt_id"],
+                            "properties": {
+                                "fan_id": {"type": "string"},
+                                "creator_id": {"type": "string"},
+                                "system_prompt_id": {"type": "string"},
+                                "chat_type": {"type": "string", "enum": ["text", "image", "video"], "default": "text"},
+                                "force_refresh": {"type": "boolean", "default": False, "description": "Bypass the recommendation cache"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "200": {
+                    "description": "Event stream of \"recommendation\" events followed by a \"done\" event with the full /recommended_chats payload",
+                    "content": {
+                        "text/event-stream": {
+                            "schema": {"type": "string"}
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/chatter_selected_chat_reply": {
+        "post": {
+            "tags": ["Chat"],
+            "summary": "Store selected chat reply",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["fan_id", "creator_id", "reply_content"],
+                            "properties": {
+                                "fan_id": {"type": "string"},
+                                "creator_id": {"type": "string"},
+                                "reply_content": {"type": "string"},
+                                "reply_id": {"type": "string"},
+                                "chat_type": {"type": "string"},
+                                "metadata": {"type": "object"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "201": {
+                    "description": "Created",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "message_id": {"type": "string"},
+                                    "message": {"type": "string"}
+                                }
+                            }
+                        }
+                    }
+                },
+                "202": {
+                    "description": "Accepted into the write-behind journal (WRITE_BEHIND); inserted in the background under message_id",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "message_id": {"type": "string"},
+                                    "queued": {"type": "boolean"},
+                                    "message": {"type": "string"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/get_creators": {
+        "get": {
+            "tags": ["Data"],
+            "summary": "Get creators (paginated)",
+            "parameters": [
+                {"name": "limit", "in": "query", "schema": {"type": "integer", "minimum": 1, "maximum": LIST_MAX_PAGE_SIZE, "default": LIST_PAGE_SIZE}},
+                {"name": "cursor", "in": "query", "schema": {"type": "string"}, "description": "next_cursor of the previous page"},
+                {"name": "fields", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated columns to return (id is always included)"},
+                {"name": "name_prefix", "in": "query", "schema": {"type": "string"}, "description": "Case-insensitive prefix of CREATOR_NAME_COLUMN (400 when it is not set)"}
+            ],
+            "responses": {
+                "200": {
+                    "description": "Success",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "creators": {"type": "array"},
+                                    "has_more": {"type": "boolean"},
+                                    "next_cursor": {"type": "string", "nullable": True}
+                                }
+                            }
+                        }
+                    }
+                },
+                "304": {"description": "Not modified (If-None-Match matched the ETag)"},
+                "400": {"description": "Invalid limit, cursor, fields or filter"}
+            }
+        }
+    },
+    "/get_fans": {
+        "get": {
+            "tags": ["Data"],
+            "summary": "Get fans (paginated)",
+            "parameters": [
+                {"name": "limit", "in": "query", "schema": {"type": "integer", "minimum": 1, "maximum": LIST_MAX_PAGE_SIZE, "default": LIST_PAGE_SIZE}},
+                {"name": "cursor", "in": "query", "schema": {"type": "string"}, "description": "next_cursor of the previous page"},
+                {"name": "fields", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated columns to return (id is always included)"},
+                {"name": "name_prefix", "in": "query", "schema": {"type": "string"}, "description": "Case-insensitive prefix of FAN_NAME_COLUMN (400 when it is not set)"},
+                {"name": "creator_id", "in": "query", "schema": {"type": "string", "format": "uuid"}, "description": "Only fans who have chatted with this creator"}
+            ],
+            "responses": {
+                "200": {
+                    "description": "Success",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "fans": {"type": "array"},
+                                    "has_more": {"type": "boolean"},
+                                    "next_cursor": {"type": "string", "nullable": True}
+                                }
+                            }
+                        }
+                    }
+                },
+                "304": {"description": "Not modified (If-None-Match matched the ETag)"},
+                "400": {"description": "Invalid limit, cursor, fields or filter"}
+            }
+        }
+    },
+    "/get_system_prompts": {
+        "get": {
+            "tags": ["Data"],
+            "summary": "Get system prompts (paginated)",
+            "parameters": [
+                {"name": "limit", "in": "query", "schema": {"type": "integer", "minimum": 1, "maximum": LIST_MAX_PAGE_SIZE, "default": LIST_PAGE_SIZE}},
+                {"name": "cursor", "in": "query", "schema": {"type": "string"}, "description": "next_cursor of the previous page"},
+                {"name": "fields", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated columns to return (id is always included)"}
+            ],
+            "responses": {
+                "200": {
+                    "description": "Success",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "system_prompts": {"type": "array"},
+                                    "has_more": {"type": "boolean"},
+                                    "next_cursor": {"type": "string", "nullable": True}
+                                }
+                            }
+                        }
+                    }
+                },
+                "304": {"description": "Not modified (If-None-Match matched the ETag)"},
+                "400": {"description": "Invalid limit, cursor, fields or filter"}
+            }
+        }
+    },
+    "/get_chat_history": {
+        "get": {
+            "tags": ["Chat"],
+            "summary": "Get chat history (keyset paginated)",
+            "parameters": [
+                {"name": "creator_id", "in": "query", "required": True, "schema": {"type": "string"}},
+                {"name": "fan_id", "in": "query", "required": True, "schema": {"type": "string"}},
+                {"name": "limit", "in": "query", "schema": {"type": "integer", "minimum": 1, "maximum": CHAT_HISTORY_MAX_PAGE_SIZE, "default": CHAT_HISTORY_PAGE_SIZE}},
+                {"name": "before", "in": "query", "schema": {"type": "string"}, "description": "Cursor (next_before); return messages older than it"},
+                {"name": "after", "in": "query", "schema": {"type": "string"}, "description": "Cursor (next_after); return messages newer than it"},
+                {"name": "since", "in": "query", "schema": {"type": "string", "format": "date-time"}, "description": "Return messages created after this timestamp"}
+            ],
+            "responses": {
+                "200": {
+                    "description": "Messages oldest first; without a cursor the newest page",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "messages": {"type": "array"},
+                                    "has_more": {"type": "boolean", "description": "More messages exist in the direction being paged"},
+                                    "next_before": {"type": "string", "nullable": True},
+                                    "next_after": {"type": "string", "nullable": True}
+                                }
+                            }
+                        }
+                    }
+                },
+                "304": {"description": "Not modified (If-None-Match matched the ETag)"},
+                "400": {"description": "Invalid limit, cursor or timestamp"}
+            }
+        }
+    },
+    "/send_fan_message": {
+        "post": {
+            "tags": ["Chat"],
+            "summary": "Send fan message",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["fan_id", "creator_id", "content"],
+                            "properties": {
+                                "fan_id": {"type": "string"},
+                                "creator_id": {"type": "string"},
+                                "content": {"type": "string"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "201": {
+                    "description": "Created",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "message_id": {"type": "string"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/create_creator": {
+        "post": {
+            "tags": ["Data"],
+            "summary": "Create new creator",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "creator_name": {"type": "string"},
+                                "niches": {"type": "array"},
+                                "persona": {"type": "array"},
+                                "nsfw": {"type": "boolean"},
+                                "emojis_enabled": {"type": "boolean"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "201": {
+                    "description": "Created",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "creator": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/create_fan": {
+        "post": {
+            "tags": ["Data"],
+            "summary": "Create new fan",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "fan_name": {"type": "string"},
+                                "lifetime_spend": {"type": "number"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "201": {
+                    "description": "Created",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "fan": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/create_system_prompt": {
+        "post": {
+            "tags": ["Data"],
+            "summary": "Create new system prompt",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "system_prompt": {"type": "string"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "201": {
+                    "description": "Created",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "system_prompt": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/update_creator": {
+        "put": {
+            "tags": ["Data"],
+            "summary": "Update creator",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["id"],
+                            "properties": {
+                                "id": {"type": "string"},
+                                "creator_name": {"type": "string"},
+                                "niches": {"type": "array"},
+                                "persona": {"type": "array"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "200": {
+                    "description": "Success",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "creator": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/update_fan": {
+        "put": {
+            "tags": ["Data"],
+            "summary": "Update fan",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["id"],
+                            "properties": {
+                                "id": {"type": "string"},
+                                "fan_name": {"type": "string"},
+                                "lifetime_spend": {"type": "number"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "200": {
+                    "description": "Success",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "fan": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    },
+    "/update_system_prompt": {
+        "put": {
+            "tags": ["Data"],
+            "summary": "Update system prompt",
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["id"],
+                            "properties": {
+                                "id": {"type": "string"},
+                                "system_prompt": {"type": "string"}
+                            }
+                        }
+                    }
+                }
+            },
+            "responses": {
+                "200": {
+                    "description": "Success",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "type": "object",
+                                "properties": {
+                                    "success": {"type": "boolean"},
+                                    "system_prompt": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+# Accepted by every generation endpoint (see utils.call_policy)
+DEADLINE_PARAMETER = {
+    "name": REQUEST_DEADLINE_HEADER,
+    "in": "header",
+    "required": False,
+    "schema": {"type": "integer", "minimum": 1, "default": REQUEST_DEADLINE_MS},
+    "description": "Milliseconds the client will wait; Mistral calls are not retried or hedged past it"
+}
+for deadline_path in ("/recommended_chats", "/recommended_chats/batch", "/recommended_chats/stream"):
+    PATH_OPERATIONS[deadline_path]["post"].setdefault("parameters", []).append(DEADLINE_PARAMETER)
+PATH_OPERATIONS["/recommended_chats"]["post"]["responses"]["504"] = {
+    "description": "The deadline passed before the recommendations were generated"
+}
+
+GENERATION_PROPERTIES = {
+    "num_candidates": {"type": "integer", "minimum": 1, "maximum": RECOMMENDATION_MAX_CANDIDATES, "default": 3, "description": "Number of replies"},
+    "generation_mode": {
+        "type": "string",
+        "enum": list(GENERATION_MODES),
+        "default": RECOMMENDATION_GENERATION_MODE,
+        "description": "single: one completion listing every reply; parallel: one short completion per reply, run concurrently; multi_candidate: one short completion with n choices"
+    }
+}
+for generation_path in ("/recommended_chats", "/recommended_chats/stream"):
+    PATH_OPERATIONS[generation_path]["post"]["requestBody"]["content"]["application/json"]["schema"]["properties"].update(GENERATION_PROPERTIES)
+# Batch items choose their own
+PATH_OPERATIONS["/recommended_chats/batch"]["post"]["requestBody"]["content"]["application/json"]["schema"]["properties"]["items"]["items"]["properties"].update(GENERATION_PROPERTIES)
+
+HTTP_METHODS = ("get", "post", "put", "patch", "delete")
+
+_ROUTE_PARAMETER = re.compile(r"<(?:[^:<>]+:)?([^<>]+)>")
+
+
+def build_spec(url_map: Any, view_functions: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the OpenAPI document from the app's registered routes.
+
+    Each route and method gets its PATH_OPERATIONS entry, or a stub whose
+    summary is the first line of the view function's docstring. Documented
+    paths with no route are dropped.
+
+    Args:
+        url_map: The Flask app's url_map
+        view_functions: The Flask app's view_functions
+
+    Returns:
+        OpenAPI 3.0 document
+    """
+    paths: Dict[str, Dict[str, Any]] = {}
+    for rule in sorted(url_map.iter_rules(), key=lambda rule: rule.rule):
+        if rule.endpoint in EXCLUDED_ENDPOINTS:
+            continue
+        path = _ROUTE_PARAMETER.sub(r"{\1}", rule.rule)
+        documented = PATH_OPERATIONS.get(path, {})
+        for method in HTTP_METHODS:
+            if method.upper() not in rule.methods:
+                continue
+            operation = documented.get(method)
+            if operation is None:
+                docstring = (view_functions[rule.endpoint].__doc__ or rule.endpoint).strip()
+                operation = {
+                    "summary": docstring.splitlines()[0],
+                    "responses": {"200": {"description": "Success"}}
+                }
+            paths.setdefault(path, {})[method] = operation
+
+    return {
+        "openapi": "3.0.0",
+        "info": SPEC_INFO,
+        # Relative, so the one cached document is right behind any host or proxy
+        "servers": [{"url": "/", "description": "Current server"}],
+        "components": {
+            "securitySchemes": {
+                "ApiKeyAuth": {
+                    "type": "apiKey",
+                    "in": "header",
+                    "name": "X-API-Key"
+                }
+            }
+        },
+        "security": [{"ApiKeyAuth": []}],
+        "paths": paths
+    }
+
+
+class OpenAPIDocument:
+    """
+    The serialized OpenAPI document, built on first use.
+
+    The routes do not change after startup, so the document is built and
+    serialized once, together with its gzip and (if the brotli package is
+    installed) brotli encodings and an ETag per encoding.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._variants: Optional[Dict[str, Tuple[bytes, str]]] = None
+
+    def variants(self, url_map: Any, view_functions: Dict[str, Any]) -> Dict[str, Tuple[bytes, str]]:
+        """(body, ETag) by content coding ("identity", "gzip", "br")."""
+        if self._variants is None:
+            with self._lock:
+                if self._variants is None:
+                    spec = build_spec(url_map, view_functions)
+                    body = json.dumps(spec, separators=(",", ":")).encode("utf-8")
+                    encoded = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+                    if brotli is not None:
+                        encoded["br"] = brotli.compress(body, quality=11)
+                    # Each encoding is a different representation, so each
+                    # gets its own ETag
+                    self._variants = {coding: (data, make_etag(data)) for coding, data in encoded.items()}
+        return self._variants
+
+    def negotiate(self, accept_encoding: Any, url_map: Any, view_functions: Dict[str, Any]) -> Tuple[str, bytes, str]:
+        """
+        Pick the smallest encoding the client accepts.
+
+        Args:
+            accept_encoding: The request's accept_encodings (werkzeug
+                MIMEAccept-style: supports .quality(value))
+            url_map: The Flask app's url_map
+            view_functions: The Flask app's view_functions
+
+        Returns:
+            Tuple of (content coding, body, ETag)
+        """
+        variants = self.variants(url_map, view_functions)
+        for coding in ("br", "gzip"):
+            if coding in variants and accept_encoding.quality(coding) > 0:
+                return (coding, *variants[coding])
+        return ("identity", *variants["identity"])
+
+
+openapi_document = OpenAPIDocument()
@@ -0,0 +1,77 @@
+from typing import Dict, List, Optional, FrozenSet
+from utils.cache import TTLCache, MISSING
+import hashlib
+import os
+import re
+
+# Matches {{variable}} placeholders; the name is used verbatim (e.g. "chat logs")
+PLACEHOLDER_PATTERN = re.compile(r"\{\{([^{}]+)\}\}")
+
+# Compiled templates are keyed by content hash, so entries never go stale
+template_cache = TTLCache(
+    name="prompt_template",
+    ttl=float("inf"),
+    maxsize=int(os.getenv("TEMPLATE_CACHE_SIZE", "256"))
+)
+
+
+class CompiledTemplate:
+    """
+    A system prompt template parsed into literal and placeholder segments.
+
+    Rendering fills the placeholder slots and joins the segments once, instead
+    of running one full-string replace per variable. Placeholders without a
+    value are rendered back verbatim, matching str.replace semantics.
+    """
+
+    __slots__ = ("_segments", "_slots", "placeholders")
+
+    def __init__(self, template: str):
+        segments: List[str] = []
+        slots = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(template):
+            if match.start() > position:
+                segments.append(template[position:match.start()])
+            slots.append((len(segments), match.group(1), match.group(0)))
+            segments.append(match.group(0))
+            position = match.end()
+        if position < len(template):
+            segments.append(template[position:])
+        self._segments = segments
+        self._slots = slots
+        self.placeholders: FrozenSet[str] = frozenset(name for _, name, _ in slots)
+
+    def render(self, values: Dict[str, str]) -> str:
+        """
+        Render the template with the given placeholder values.
+
+        Args:
+            values: Mapping of placeholder name (without braces) to its value
+
+        Returns:
+            Rendered template
+        """
+        parts = list(self._segments)
+        for index, name, raw in self._slots:
+            parts[index] = values.get(name, raw)
+        return "".join(parts)
+
+
+def compile_template(template: str, prompt_id: Optional[str] = None) -> CompiledTemplate:
+    """
+    Compile a system prompt template, reusing the cached result when possible.
+
+    Args:
+        template: System prompt template with {{variables}}
+        prompt_id: ID of the system prompt row the template belongs to
+
+    Returns:
+        CompiledTemplate for the template
+    """
+    key = (prompt_id, hashlib.sha1(template.encode("utf-8")).hexdigest())
+    compiled = template_cache.get(key)
+    if compiled is MISSING:
+        compiled = CompiledTemplate(template)
+        template_cache.set(key, compiled)
+    return compiled
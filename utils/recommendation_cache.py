@@ -0,0 +1,176 @@
+from typing import Dict, List, Any, Optional, Set, Tuple
+from utils.cache import TTLCache, MISSING
+import hashlib
+import json
+import os
+import threading
+
+# Generated recommendation sets, keyed on everything that shapes the prompt
+recommendation_cache = TTLCache(
+    name="recommendation",
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", "300")),
+    maxsize=int(os.getenv("RECOMMENDATION_CACHE_SIZE", "2048"))
+)
+
+# Cache keys per (creator_id, fan_id), so a new message can drop them all
+_conversation_keys: Dict[Tuple[str, str], Set[str]] = {}
+_conversation_keys_lock = threading.Lock()
+_saved_tokens = 0
+_invalidations = 0
+_speculative_stored = 0
+_speculative_used = 0
+
+
+def _state_hash(row: Dict[str, Any]) -> str:
+    """Hash a database row so any change to it changes the cache key."""
+    return hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def last_message_id(chat_history: List[Dict[str, Any]]) -> Optional[str]:
+    """Return the id of the newest message in the history, whatever its order."""
+    if not chat_history:
+        return None
+    newest = max(chat_history, key=lambda chat: (str(chat.get("created_at") or ""), str(chat.get("id") or "")))
+    return newest.get("id")
+
+
+def recommendation_cache_key(
+    system_prompt_id: str,
+    system_prompt_data: Dict[str, Any],
+    creator: Dict[str, Any],
+    fan: Dict[str, Any],
+    chat_history: List[Dict[str, Any]],
+    chat_type: str,
+    conversation_summary: Optional[Dict[str, Any]] = None,
+    num_candidates: int = 3
+) -> str:
+    """
+    Build the cache key for a recommendation request.
+
+    The key covers the system prompt id and content, the creator and fan rows,
+    the last message of the conversation, the chat type, the conversation
+    summary and the number of replies, so any change that would alter the
+    prompt produces a new key. The generation mode is left out: a set of the
+    same size serves a request in any mode.
+
+    Args:
+        system_prompt_id: System prompt ID
+        system_prompt_data: System prompt data dictionary
+        creator: Creator data dictionary
+        fan: Fan data dictionary
+        chat_history: Chat history used for the prompt
+        chat_type: Type of chat (text/image/video)
+        conversation_summary: Summary row of the conversation, if any
+        num_candidates: Number of replies in the set
+
+    Returns:
+        Cache key string
+    """
+    parts = [
+        str(system_prompt_id),
+        _state_hash(system_prompt_data),
+        _state_hash(creator),
+        _state_hash(fan),
+        str(last_message_id(chat_history)),
+        str(chat_type),
+        _state_hash(conversation_summary or {}),
+        str(num_candidates)
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_cached_recommendations(key: str) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Return the cached recommendation set for key, or None.
+
+    Args:
+        key: Key from recommendation_cache_key
+
+    Returns:
+        Tuple of (recommendation dictionaries, generation metadata), or None
+        on a miss
+    """
+    global _saved_tokens, _speculative_used
+    entry = recommendation_cache.get(key)
+    if entry is MISSING:
+        return None
+    with _conversation_keys_lock:
+        _saved_tokens += entry["tokens"]
+        # Count each pre-generated set once, however often it is served
+        if entry["speculative"] and not entry["used"]:
+            entry["used"] = True
+            _speculative_used += 1
+    return entry["recommendations"], entry["metadata"]
+
+
+def cache_recommendations(
+    key: str,
+    creator_id: str,
+    fan_id: str,
+    recommendations: List[Dict[str, Any]],
+    tokens: int = 0,
+    speculative: bool = False,
+    metadata: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Store a generated recommendation set.
+
+    Args:
+        key: Key from recommendation_cache_key
+        creator_id: Creator of the conversation
+        fan_id: Fan of the conversation
+        recommendations: Generated recommendation dictionaries
+        tokens: Total Mistral tokens the generation cost (counted as saved on hits)
+        speculative: Whether the set was pre-generated before anyone asked for it
+        metadata: Details of the generation (e.g. prompt token counts) returned with the set
+    """
+    global _speculative_stored
+    if not recommendation_cache.enabled:
+        return
+    recommendation_cache.set(key, {
+        "recommendations": recommendations,
+        "tokens": tokens or 0,
+        "metadata": metadata or {},
+        "speculative": speculative,
+        "used": False
+    })
+    with _conversation_keys_lock:
+        if speculative:
+            _speculative_stored += 1
+        # Forget keys that have expired or been evicted so the index stays bounded
+        keys = {k for k in _conversation_keys.get((creator_id, fan_id), ()) if k in recommendation_cache}
+        keys.add(key)
+        _conversation_keys[(creator_id, fan_id)] = keys
+        if len(_conversation_keys) > recommendation_cache.maxsize:
+            for pair in [pair for pair, pair_keys in _conversation_keys.items() if not any(k in recommendation_cache for k in pair_keys)]:
+                del _conversation_keys[pair]
+
+
+def invalidate_conversation(creator_id: str, fan_id: str) -> None:
+    """
+    Drop every cached recommendation set for a creator/fan pair.
+
+    Called whenever a new message is written for the pair.
+
+    Args:
+        creator_id: Creator of the conversation
+        fan_id: Fan of the conversation
+    """
+    global _invalidations
+    with _conversation_keys_lock:
+        keys = _conversation_keys.pop((creator_id, fan_id), set())
+        _invalidations += 1
+    for key in keys:
+        recommendation_cache.invalidate(key)
+
+
+def recommendation_cache_stats() -> Dict[str, Any]:
+    """Hit rate, saved tokens, speculative usage and size of the recommendation cache."""
+    stats = recommendation_cache.stats()
+    with _conversation_keys_lock:
+        stats["saved_tokens"] = _saved_tokens
+        stats["invalidations"] = _invalidations
+        stats["conversations"] = len(_conversation_keys)
+        stats["speculative_stored"] = _speculative_stored
+        stats["speculative_used"] = _speculative_used
+    return stats
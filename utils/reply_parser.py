@@ -0,0 +1,146 @@
+from typing import List, NamedTuple, Optional
+import re
+
+# Reply markers: "Reply 2:" / "Reply 2 -" anywhere, or "2." / "2)" at the
+# start of a line (optionally after markdown bullets or bold markers)
+MARKER_PATTERN = re.compile(
+    r"(?P<reply>Reply\s*(?P<reply_number>\d+)\s*[:\-])"
+    r"|(?<![^\n])[ \t]*(?:[*#>-]+[ \t]*)?(?P<number>\d+)[.)]",
+    re.IGNORECASE
+)
+
+# Characters held back between chunks so a marker split across two chunks
+# is still recognised (longer than any realistic marker)
+MARKER_HOLDBACK = 16
+
+
+class ParseResult(NamedTuple):
+    """Outcome of parsing a generated completion."""
+    replies: List[str]
+    expected: int
+
+    @property
+    def complete(self) -> bool:
+        """Whether at least the expected number of replies was found."""
+        return len(self.replies) >= self.expected
+
+
+def _clean_reply(text: str) -> str:
+    """Strip whitespace and markdown emphasis left around a reply."""
+    return text.strip().strip("*").strip()
+
+
+class ReplyParser:
+    """
+    Incremental single-pass parser for numbered reply lists.
+
+    Text is fed chunk by chunk as it streams from the model. A reply is
+    closed, and returned from feed(), as soon as the marker of the next reply
+    arrives; the last reply is closed by close(). Text before the first
+    marker (e.g. "Here are three options:") is dropped. Markers must be
+    numbered consecutively from 1 and use the same style ("Reply N:" or
+    "N." / "N)") as the first one, so numbers inside a reply are not
+    mistaken for markers.
+
+    Every character is scanned a bounded number of times, so parsing is
+    linear in the length of the completion.
+    """
+
+    def __init__(self, expected: int = 3):
+        self.expected = expected
+        self.replies: List[str] = []
+        self._context = "\n"  # Character before the unscanned text (start counts as a line start)
+        self._tail = ""  # Unassigned text held back for the next chunk
+        self._current: Optional[int] = None  # Number of the open reply
+        self._style: Optional[str] = None  # "reply" or "number", fixed by the first marker
+        self._body: List[str] = []
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Feed the next chunk of generated text.
+
+        Args:
+            chunk: Newly generated text
+
+        Returns:
+            Replies closed by this chunk, in order
+        """
+        return self._scan(chunk, final=False)
+
+    def close(self) -> ParseResult:
+        """
+        Signal the end of the text and close the last open reply.
+
+        Returns:
+            ParseResult with every reply found
+        """
+        self._scan("", final=True)
+        if self._current is not None:
+            self._close_reply()
+            self._current = None
+        return ParseResult(list(self.replies), self.expected)
+
+    def _scan(self, chunk: str, final: bool) -> List[str]:
+        window = self._context + self._tail + chunk
+        closed_before = len(self.replies)
+        consumed = 1  # window[0] is context only
+
+        for match in MARKER_PATTERN.finditer(window, 1):
+            style = "reply" if match.group("reply") else "number"
+            number = int(match.group("reply_number") or match.group("number"))
+            if self._style is not None and style != self._style:
+                continue
+            if number != (self._current or 0) + 1:
+                continue
+            if self._current is not None:
+                self._body.append(window[consumed:match.start()])
+                self._close_reply()
+            self._style = style
+            self._current = number
+            consumed = match.end()
+
+        cut = len(window) if final else max(consumed, len(window) - MARKER_HOLDBACK)
+        if self._current is not None:
+            self._body.append(window[consumed:cut])
+        self._context = window[cut - 1]
+        self._tail = window[cut:]
+        return self.replies[closed_before:]
+
+    def _close_reply(self) -> None:
+        reply = _clean_reply("".join(self._body))
+        self._body = []
+        if reply:
+            self.replies.append(reply)
+
+
+def parse_replies(text: str, expected: int = 3) -> ParseResult:
+    """
+    Parse a complete generated text into replies.
+
+    Args:
+        text: Full text generated by the model
+        expected: Number of replies that were requested
+
+    Returns:
+        ParseResult with the replies found
+    """
+    parser = ReplyParser(expected)
+    parser.feed(text)
+    return parser.close()
+
+
+def clean_single_reply(text: str) -> str:
+    """
+    Clean a completion that was asked for exactly one reply.
+
+    Models sometimes still label it ("Reply 1:", "1.") or wrap it in quotes;
+    both are removed.
+    """
+    text = text.strip()
+    match = MARKER_PATTERN.match(text)
+    if match and (match.group("reply_number") or match.group("number")) == "1":
+        text = text[match.end():]
+    text = _clean_reply(text)
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        text = text[1:-1].strip()
+    return text
@@ -0,0 +1,150 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import threading
+
+
+class _Call:
+    """An in-flight call whose outcome is shared by every waiter."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for it and receive the same result or
+    exception. Followers give up after ``timeout`` seconds with a
+    TimeoutError, so a stuck leader cannot block them forever. Works across
+    the threads of one process (sync Flask workers).
+    """
+
+    def __init__(self, name: str, timeout: float = 30.0):
+        self.name = name
+        self.timeout = timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: float = None) -> Any:
+        """
+        Run fn once per key at a time and share its outcome.
+
+        Args:
+            key: Identity of the call (e.g. the request parameters)
+            fn: Zero-argument function to run if no call for key is in flight
+            timeout: Seconds a follower waits for the leader (defaults to the
+                instance timeout)
+
+        Returns:
+            The value returned by fn
+
+        Raises:
+            TimeoutError: If this caller was a follower and the leader did not
+                finish in time
+            Exception: Whatever fn raised
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out waiting for an identical in-flight {self.name} request")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> Dict[str, Any]:
+        """Leader, coalesced and timeout counters, for the metrics endpoint."""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts
+            }
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for the ASGI server.
+
+    The leader's coroutine runs as a task; followers await the same task
+    (shielded, so a follower timing out does not cancel it for the others).
+    """
+
+    def __init__(self, name: str, timeout: float = 30.0):
+        self.name = name
+        self.timeout = timeout
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: float = None) -> Any:
+        """
+        Await fn() once per key at a time and share its outcome.
+
+        Args:
+            key: Identity of the call (e.g. the request parameters)
+            fn: Zero-argument coroutine function to run if no call for key is in flight
+            timeout: Seconds a follower waits for the leader
+
+        Returns:
+            The value returned by fn
+
+        Raises:
+            TimeoutError: If this caller was a follower and the leader did not
+                finish in time
+            Exception: Whatever fn raised
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            return await asyncio.shield(task)
+
+        self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"Timed out waiting for an identical in-flight {self.name} request")
+
+    def stats(self) -> Dict[str, Any]:
+        """Leader, coalesced and timeout counters, for the metrics endpoint."""
+        return {
+            "in_flight": len(self._tasks),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts
+        }
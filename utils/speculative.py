@@ -0,0 +1,76 @@
+from typing import Any, Dict, Optional
+from supabase import Client
+from utils.background import BoundedExecutor
+from utils.chats import generate_chat_recommendations
+from utils.creator import get_creator_by_id
+import os
+
+# Opt-in: start generating recommendations as soon as a fan message is stored
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() in ("1", "true", "yes")
+
+# System prompt used when the creator row has no default_system_prompt_id
+DEFAULT_SYSTEM_PROMPT_ID = os.getenv("DEFAULT_SYSTEM_PROMPT_ID")
+
+speculative_executor = BoundedExecutor(
+    name="speculative",
+    max_workers=int(os.getenv("SPECULATIVE_MAX_WORKERS", "4")),
+    max_in_flight=int(os.getenv("SPECULATIVE_MAX_IN_FLIGHT", "16"))
+)
+
+
+def get_default_system_prompt_id(creator: Dict[str, Any]) -> Optional[str]:
+    """
+    Return the system prompt to pre-generate recommendations with for a creator.
+
+    Args:
+        creator: Creator data dictionary
+
+    Returns:
+        The creator's default_system_prompt_id, falling back to the
+        DEFAULT_SYSTEM_PROMPT_ID environment variable (None if neither is set)
+    """
+    return creator.get("default_system_prompt_id") or DEFAULT_SYSTEM_PROMPT_ID
+
+
+def _pregenerate_recommendations(supabase: Client, creator_id: str, fan_id: str, chat_type: str) -> None:
+    creator = get_creator_by_id(supabase, creator_id)
+    system_prompt_id = get_default_system_prompt_id(creator)
+    if not system_prompt_id:
+        return
+    # Goes through the same coalescing and result cache as /recommended_chats,
+    # so a chatter asking while this runs waits for it instead of duplicating it
+    generate_chat_recommendations(
+        supabase=supabase,
+        creator_id=creator_id,
+        fan_id=fan_id,
+        system_prompt_id=system_prompt_id,
+        chat_type=chat_type,
+        speculative=True
+    )
+
+
+def schedule_speculative_recommendations(
+    supabase: Client,
+    creator_id: str,
+    fan_id: str,
+    chat_type: str = "text"
+) -> bool:
+    """
+    Start generating recommendations for a conversation in the background.
+
+    Does nothing unless SPECULATIVE_GENERATION is enabled. The result lands
+    in the recommendation cache, so the next /recommended_chats call for the
+    pair with the creator's default system prompt returns it immediately.
+
+    Args:
+        supabase: Supabase client instance
+        creator_id: Creator of the conversation
+        fan_id: Fan who just sent a message
+        chat_type: Type of chat to pre-generate for
+
+    Returns:
+        True if a job was queued, False if disabled or the pool is saturated
+    """
+    if not SPECULATIVE_GENERATION:
+        return False
+    return speculative_executor.submit(_pregenerate_recommendations, supabase, creator_id, fan_id, chat_type)
@@ -0,0 +1,65 @@
+from typing import Dict, Optional, Tuple
+from utils.compression import compress
+import hashlib
+import os
+import threading
+
+# Lifetime of fingerprinted asset URLs: their content never changes, a new
+# version gets a new URL
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+STATIC_IMMUTABLE_CACHE_CONTROL = f"public, max-age={STATIC_MAX_AGE}, immutable"
+
+
+class StaticAssets:
+    """
+    Content fingerprints and pre-compressed bodies of the static files.
+
+    A file's fingerprint is a hash of its content, recomputed when its mtime
+    changes, so templates link to a URL that changes with every deploy that
+    touches the file and can be cached indefinitely. Compressed bodies are
+    produced once per file version and encoding.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+        # filename -> (mtime, fingerprint)
+        self._fingerprints: Dict[str, Tuple[float, str]] = {}
+        # (filename, fingerprint, coding) -> compressed body
+        self._compressed: Dict[Tuple[str, str, str], bytes] = {}
+
+    def _path(self, filename: str) -> str:
+        path = os.path.realpath(os.path.join(self.folder, filename))
+        if not path.startswith(os.path.realpath(self.folder) + os.sep):
+            raise ValueError(f"Invalid static filename: {filename}")
+        return path
+
+    def fingerprint(self, filename: str) -> Optional[str]:
+        """Short content hash of a static file, or None if it does not exist."""
+        try:
+            path = self._path(filename)
+            mtime = os.path.getmtime(path)
+        except (OSError, ValueError):
+            return None
+        cached = self._fingerprints.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as asset:
+            digest = hashlib.blake2b(asset.read(), digest_size=6).hexdigest()
+        with self._lock:
+            self._fingerprints[filename] = (mtime, digest)
+        return digest
+
+    def compressed(self, filename: str, fingerprint: str, coding: str) -> bytes:
+        """A static file's body in the given encoding, compressed at the highest level on first use."""
+        key = (filename, fingerprint, coding)
+        body = self._compressed.get(key)
+        if body is None:
+            with open(self._path(filename), "rb") as asset:
+                body = compress(asset.read(), coding, best=True)
+            with self._lock:
+                # Older versions of the file are not served any more
+                for stale in [cached for cached in self._compressed if cached[0] == filename and cached[1] != fingerprint]:
+                    del self._compressed[stale]
+                self._compressed[key] = body
+        return body
@@ -0,0 +1,273 @@
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Set, Tuple
+from supabase import AsyncClient, Client
+from utils.http_clients import mistral_client
+from utils.call_policy import summary_policy
+from utils.background import BoundedExecutor
+from utils.bulk import chunks
+from utils.cache import TTLCache, MISSING
+from utils.context_builder import CONTEXT_HISTORY_LIMIT
+import os
+import threading
+
+# Opt-in: keep a rolling summary of messages older than the recent history window
+CONVERSATION_SUMMARIES = os.getenv("CONVERSATION_SUMMARIES", "false").lower() in ("1", "true", "yes")
+
+# Messages that must fall out of the recent window before the summary is updated
+SUMMARY_MIN_MESSAGES = int(os.getenv("SUMMARY_MIN_MESSAGES", "20"))
+# Messages summarized per Mistral call (a long backlog takes several calls)
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "200"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "mistral-small-latest")
+SUMMARY_MAX_TOKENS = 400
+SUMMARY_TEMPERATURE = 0.2
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a private chat between a content creator and one of their fans.
+Update the current summary with the new messages. Keep what matters for future replies: the fan's name and personal details, interests and preferences, purchases and spending, promises or plans made by either side, and the tone of the relationship. Drop small talk.
+Write at most 200 words of plain prose and reply with the updated summary only."""
+
+# Summary rows per (creator_id, fan_id); None caches "no summary yet"
+summary_cache = TTLCache(
+    name="conversation_summary",
+    ttl=float(os.getenv("SUMMARY_CACHE_TTL", "300")),
+    maxsize=int(os.getenv("SUMMARY_CACHE_SIZE", "10000"))
+)
+
+summary_executor = BoundedExecutor(
+    name="summary",
+    max_workers=int(os.getenv("SUMMARY_MAX_WORKERS", "2")),
+    max_in_flight=int(os.getenv("SUMMARY_MAX_IN_FLIGHT", "64"))
+)
+
+# Conversations with an update queued or running, so bursts of messages
+# don't queue several jobs for the same pair
+_pending: Set[Tuple[str, str]] = set()
+_pending_lock = threading.Lock()
+
+# (created_at, id) of the oldest message the last prompt of a conversation
+# carried, by (creator_id, fan_id): what the token-budgeted packer kept,
+# which can be far fewer than CONTEXT_HISTORY_LIMIT messages
+history_windows = TTLCache(
+    name="history_window",
+    ttl=float(os.getenv("SUMMARY_CACHE_TTL", "300")),
+    maxsize=int(os.getenv("SUMMARY_CACHE_SIZE", "10000"))
+)
+
+
+def get_conversation_summary(supabase: Client, creator_id: str, fan_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Helper function to get the rolling summary of a conversation.
+    
+    Args:
+        supabase: Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        
+    Returns:
+        Summary row (shared with the cache, treat as read-only), or None if
+        the conversation has not been summarized yet
+    """
+    summary = summary_cache.get((creator_id, fan_id))
+    if summary is not MISSING:
+        return summary
+    summary_response = supabase.table("conversation_summary").select("*").eq("creator_id", creator_id).eq("fan_id", fan_id).execute()
+    summary = summary_response.data[0] if summary_response.data else None
+    summary_cache.set((creator_id, fan_id), summary)
+    return summary
+
+
+async def aget_conversation_summary(supabase: AsyncClient, creator_id: str, fan_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Async variant of get_conversation_summary, sharing the same cache.
+    
+    Args:
+        supabase: Async Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        
+    Returns:
+        Summary row, or None if the conversation has not been summarized yet
+    """
+    summary = summary_cache.get((creator_id, fan_id))
+    if summary is not MISSING:
+        return summary
+    summary_response = await supabase.table("conversation_summary").select("*").eq("creator_id", creator_id).eq("fan_id", fan_id).execute()
+    summary = summary_response.data[0] if summary_response.data else None
+    summary_cache.set((creator_id, fan_id), summary)
+    return summary
+
+
+def get_conversation_summaries(
+    supabase: Client,
+    pairs: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], Optional[Dict[str, Any]]]:
+    """
+    Helper function to get the summaries of many conversations at once.
+    
+    Args:
+        supabase: Supabase client instance
+        pairs: (creator_id, fan_id) of each conversation
+        
+    Returns:
+        Dictionary of (creator_id, fan_id) to summary row (None if the
+        conversation has not been summarized yet)
+    """
+    summaries = {}
+    missing = []
+    for pair in dict.fromkeys(pairs):
+        summary = summary_cache.get(pair)
+        if summary is MISSING:
+            missing.append(pair)
+        else:
+            summaries[pair] = summary
+    for group in chunks(missing):
+        summary_response = supabase.table("conversation_summary").select("*").in_("creator_id", sorted({creator_id for creator_id, _ in group})).in_("fan_id", sorted({fan_id for _, fan_id in group})).execute()
+        rows = {(row["creator_id"], row["fan_id"]): row for row in summary_response.data or []}
+        for pair in group:
+            summaries[pair] = rows.get(pair)
+            summary_cache.set(pair, summaries[pair])
+    return summaries
+
+
+def record_history_window(creator_id: str, fan_id: str, oldest_sent: Dict[str, Any]) -> None:
+    """
+    Remember the oldest message a prompt of the conversation carried.
+    
+    Messages before it were dropped by the packer, so the next summary
+    update folds them in even though they are within CONTEXT_HISTORY_LIMIT.
+    """
+    if oldest_sent.get("created_at") and oldest_sent.get("id"):
+        history_windows.set((creator_id, fan_id), (str(oldest_sent["created_at"]), str(oldest_sent["id"])))
+
+
+def _summary_window_start(supabase: Client, creator_id: str, fan_id: str) -> Optional[Tuple[str, str]]:
+    """
+    (created_at, id) of the oldest message that may still be sent verbatim.
+    
+    That is the oldest message the last prompt carried, or, when no prompt
+    was recorded (or new messages have since pushed the window further), the
+    oldest of the last CONTEXT_HISTORY_LIMIT messages. None when the
+    conversation is short enough that nothing is left out.
+    """
+    window_response = supabase.table("of_chat_message").select("created_at,id").eq("fan_id", fan_id).eq("creator_id", creator_id).order("created_at", desc=True).order("id", desc=True).range(CONTEXT_HISTORY_LIMIT - 1, CONTEXT_HISTORY_LIMIT - 1).execute()
+    fetched = (str(window_response.data[0]["created_at"]), str(window_response.data[0]["id"])) if window_response.data else None
+    packed = history_windows.get((creator_id, fan_id))
+    if packed is MISSING:
+        return fetched
+    return max(packed, fetched) if fetched else packed
+
+
+def _position_filter(operator: str, position: Tuple[str, str]) -> str:
+    """PostgREST condition for messages before (lt) or after (gt) a (created_at, id) position."""
+    created_at, message_id = position
+    return f'or(created_at.{operator}."{created_at}",and(created_at.eq."{created_at}",id.{operator}.{message_id}))'
+
+
+def _summarize(summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Ask Mistral to fold new messages into the existing summary."""
+    transcript = "\n".join(f"[{message.get('sender', 'unknown')}]: {message.get('content', '')}" for message in messages)
+    # Background work: retried on rate limits, never hedged
+    response = summary_policy.call(
+        lambda timeout_ms: mistral_client.chat.complete(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": f"Current summary:\n{summary or 'None yet.'}\n\nNew messages:\n{transcript}"}
+            ],
+            temperature=SUMMARY_TEMPERATURE,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            timeout_ms=timeout_ms
+        ),
+        hedge=False
+    )
+    return response.choices[0].message.content.strip()
+
+
+def update_conversation_summary(supabase: Client, creator_id: str, fan_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Fold messages that left the recent history window into the summary.
+    
+    The window starts at the oldest message the last prompt carried (see
+    record_history_window), so messages the packer dropped to fit the token
+    budget are summarized even if they are among the last
+    CONTEXT_HISTORY_LIMIT. Only the delta since the last update is sent to
+    Mistral, in batches of SUMMARY_BATCH_SIZE, and only once at least
+    SUMMARY_MIN_MESSAGES have accumulated. Messages are paged by
+    (created_at, id), so messages sharing a timestamp (e.g. bulk imports)
+    are not skipped.
+    
+    Args:
+        supabase: Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        
+    Returns:
+        The stored summary row (None if the conversation has none yet)
+    """
+    summary_response = supabase.table("conversation_summary").select("*").eq("creator_id", creator_id).eq("fan_id", fan_id).execute()
+    summary = summary_response.data[0] if summary_response.data else None
+    
+    window_start = _summary_window_start(supabase, creator_id, fan_id)
+    while window_start is not None:
+        conditions = [_position_filter("lt", window_start)]
+        if summary and summary.get("summarized_until"):
+            if summary.get("summarized_until_id"):
+                conditions.append(_position_filter("gt", (str(summary["summarized_until"]), str(summary["summarized_until_id"]))))
+            else:
+                conditions.append(f'created_at.gt."{summary["summarized_until"]}"')
+        delta_query = supabase.table("of_chat_message").select("id,sender,content,created_at").eq("fan_id", fan_id).eq("creator_id", creator_id).or_(f"and({','.join(conditions)})")
+        delta = delta_query.order("created_at", desc=False).order("id", desc=False).limit(SUMMARY_BATCH_SIZE).execute().data or []
+        if len(delta) < SUMMARY_MIN_MESSAGES:
+            break
+        
+        summary_row = {
+            "creator_id": creator_id,
+            "fan_id": fan_id,
+            "summary": _summarize(summary.get("summary", "") if summary else "", delta),
+            "summarized_until": delta[-1]["created_at"],
+            "summarized_until_id": delta[-1]["id"],
+            "message_count": (summary.get("message_count", 0) if summary else 0) + len(delta),
+            "updated_at": datetime.utcnow().isoformat()
+        }
+        upsert_response = supabase.table("conversation_summary").upsert(summary_row, on_conflict="creator_id,fan_id").execute()
+        summary = upsert_response.data[0] if upsert_response.data else summary_row
+        if len(delta) < SUMMARY_BATCH_SIZE:
+            break
+    
+    summary_cache.set((creator_id, fan_id), summary)
+    return summary
+
+
+def _run_summary_update(supabase: Client, creator_id: str, fan_id: str) -> None:
+    try:
+        update_conversation_summary(supabase, creator_id, fan_id)
+    finally:
+        with _pending_lock:
+            _pending.discard((creator_id, fan_id))
+
+
+def schedule_summary_update(supabase: Client, creator_id: str, fan_id: str) -> bool:
+    """
+    Queue a background summary update after a message was stored.
+    
+    Does nothing unless CONVERSATION_SUMMARIES is enabled, or if an update
+    for the conversation is already queued.
+    
+    Args:
+        supabase: Supabase client instance
+        creator_id: The creator ID of the conversation
+        fan_id: The fan ID of the conversation
+        
+    Returns:
+        True if a job was queued
+    """
+    if not CONVERSATION_SUMMARIES:
+        return False
+    with _pending_lock:
+        if (creator_id, fan_id) in _pending:
+            return False
+        _pending.add((creator_id, fan_id))
+    if not summary_executor.submit(_run_summary_update, supabase, creator_id, fan_id):
+        with _pending_lock:
+            _pending.discard((creator_id, fan_id))
+        return False
+    return True
@@ -1,6 +1,17 @@
+from typing import Dict, List, Any, Optional
+from supabase import AsyncClient, Client
+from utils.cache import TTLCache, MISSING
+from utils.bulk import get_rows_by_ids
+from utils.listing import ListPage, list_page
+import os
+
+# System prompts almost never change, so they can be cached for a long time
+system_prompt_cache = TTLCache(
+    name="system_prompt",
+    ttl=float(os.getenv("SYSTEM_PROMPT_CACHE_TTL", "600")),
+    maxsize=int(os.getenv("SYSTEM_PROMPT_CACHE_SIZE", "256"))
+)
 
-from typing import Dict, Any
-from supabase import Client
 
 def get_system_prompt_by_id(supabase: Client, system_prompt_id: str) -> Dict[str, Any]:
     """
@@ -10,12 +21,107 @@ def get_system_prompt_by_id(supabase: Client, system_prompt_id: str) -> Dict[str
         system_prompt_id: The system prompt ID to fetch
         
     Returns:
-        System prompt data dictionary
+        System prompt data dictionary (shared with the cache, treat as read-only)
         
     Raises:
         ValueError: If system prompt not found
     """
+    system_prompt = system_prompt_cache.get(system_prompt_id)
+    if system_prompt is not MISSING:
+        return system_prompt
     system_prompt_response = supabase.table("system_prompt").select("*").eq("id", system_prompt_id).execute()
     if not system_prompt_response.data:
         raise ValueError("System prompt not found")
-    return system_prompt_response.data[0]
\ No newline at end of file
+    system_prompt = system_prompt_response.data[0]
+    system_prompt_cache.set(system_prompt_id, system_prompt)
+    return system_prompt
+
+
+async def aget_system_prompt_by_id(supabase: AsyncClient, system_prompt_id: str) -> Dict[str, Any]:
+    """
+    Async variant of get_system_prompt_by_id, sharing the same cache.
+    
+    Args:
+        supabase: Async Supabase client instance
+        system_prompt_id: The system prompt ID to fetch
+        
+    Returns:
+        System prompt data dictionary (shared with the cache, treat as read-only)
+        
+    Raises:
+        ValueError: If system prompt not found
+    """
+    system_prompt = system_prompt_cache.get(system_prompt_id)
+    if system_prompt is not MISSING:
+        return system_prompt
+    system_prompt_response = await supabase.table("system_prompt").select("*").eq("id", system_prompt_id).execute()
+    if not system_prompt_response.data:
+        raise ValueError("System prompt not found")
+    system_prompt = system_prompt_response.data[0]
+    system_prompt_cache.set(system_prompt_id, system_prompt)
+    return system_prompt
+
+
+def get_system_prompts_by_ids(supabase: Client, system_prompt_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Helper function to get many system prompts at once.
+    
+    Cached system prompts are served from the cache; the rest are loaded with
+    in_ queries and cached.
+    
+    Args:
+        supabase: Supabase client instance
+        system_prompt_ids: The system prompt IDs to fetch
+        
+    Returns:
+        Dictionary of system prompt ID to system prompt data (system prompts that don't exist are left out)
+    """
+    return get_rows_by_ids(supabase, "system_prompt", system_prompt_ids, system_prompt_cache)
+
+
+def list_system_prompts(
+    supabase: Client,
+    limit: int,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None
+) -> ListPage:
+    """
+    Helper function to get one page of system prompts.
+    
+    Args:
+        supabase: Supabase client instance
+        limit: Maximum number of system prompts in the page
+        cursor: next_cursor of the previous page
+        fields: Columns to return (all when None); leaving out system_prompt
+            skips the prompt bodies
+        
+    Returns:
+        ListPage of system prompt rows ordered by id
+    """
+    query = supabase.table("system_prompt").select(",".join(fields) if fields else "*")
+    page = list_page(query, limit, cursor)
+    if not fields:
+        for system_prompt in page.rows:
+            cache_system_prompt(system_prompt)
+    return page
+
+
+def cache_system_prompt(system_prompt: Dict[str, Any]) -> None:
+    """
+    Store a freshly written system prompt row in the cache.
+    
+    Args:
+        system_prompt: System prompt row as returned by an insert or update
+    """
+    if system_prompt and system_prompt.get("id"):
+        system_prompt_cache.set(system_prompt["id"], system_prompt)
+
+
+def invalidate_system_prompt(system_prompt_id: str) -> None:
+    """
+    Drop a system prompt from the cache so the next lookup hits the database.
+    
+    Args:
+        system_prompt_id: The system prompt ID to invalidate
+    """
+    system_prompt_cache.invalidate(system_prompt_id)
@@ -0,0 +1,71 @@
+from functools import lru_cache
+from typing import Any, Optional
+import math
+
+try:
+    from mistral_common.tokens.tokenizers.mistral import MistralTokenizer
+except ImportError:  # optional: fall back to the character estimate
+    MistralTokenizer = None
+
+# Characters per token assumed when mistral_common is not installed
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _raw_tokenizer() -> Optional[Any]:
+    """Load the Tekken tokenizer used by current Mistral models, once per process."""
+    if MistralTokenizer is None:
+        return None
+    try:
+        return MistralTokenizer.v3(is_tekken=True).instruct_tokenizer.tokenizer
+    except Exception as e:
+        print(f"Could not load the Mistral tokenizer, estimating tokens instead: {str(e)}")
+        return None
+
+
+def tokenizer_name() -> str:
+    """Name of the token counter in use, reported with the token counts."""
+    return "tekken" if _raw_tokenizer() is not None else f"chars/{CHARS_PER_TOKEN}"
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a piece of text.
+
+    Uses the Mistral tokenizer from mistral_common when it is installed,
+    otherwise estimates one token per CHARS_PER_TOKEN characters (rounded up).
+
+    Args:
+        text: Text to count
+
+    Returns:
+        Number of tokens (0 for empty text)
+    """
+    if not text:
+        return 0
+    tokenizer = _raw_tokenizer()
+    if tokenizer is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, bos=False, eos=False))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text down to at most max_tokens tokens, keeping its beginning.
+
+    Args:
+        text: Text to truncate
+        max_tokens: Token limit
+
+    Returns:
+        The text unchanged if it fits, otherwise its longest prefix that fits
+    """
+    if max_tokens <= 0:
+        return ""
+    tokenizer = _raw_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    token_ids = tokenizer.encode(text, bos=False, eos=False)
+    if len(token_ids) <= max_tokens:
+        return text
+    return tokenizer.decode(token_ids[:max_tokens])
@@ -0,0 +1,291 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+from supabase import Client
+from postgrest import ReturnMethod
+from utils.bulk import insert_isolating_rejects
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+# Opt-in: acknowledge chatter replies once they are in the local journal and
+# insert them into of_chat_message in the background
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+
+# Journal file; each process locks its own (path, path.1, path.2, ...) so
+# several workers can share a directory and a restarted worker replays
+# whatever an earlier one left unflushed
+WRITE_BEHIND_JOURNAL = os.getenv(
+    "WRITE_BEHIND_JOURNAL",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "journal", "chat_replies.jsonl")
+)
+WRITE_BEHIND_MAX_JOURNALS = int(os.getenv("WRITE_BEHIND_MAX_JOURNALS", "16"))
+
+# Rows per insert, seconds between flushes, and the cap on the retry delay
+# while Supabase is failing
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", "30"))
+
+# Fully flushed journals larger than this are truncated
+WRITE_BEHIND_COMPACT_BYTES = int(os.getenv("WRITE_BEHIND_COMPACT_BYTES", str(16 * 1024 * 1024)))
+
+
+class WriteBehindJournal:
+    """
+    Durable append-only journal of chat messages with a background flusher.
+
+    append() writes one JSON line and fsyncs it before returning, so an
+    acknowledged message survives a crash. A flusher thread reads entries
+    after the flushed offset (kept in "<journal>.offset"), upserts them into
+    of_chat_message in batches and then advances the offset. Entries carry
+    their id, so replaying a batch whose insert did reach the database does
+    not duplicate it. On start the flusher resumes from the stored offset,
+    which replays anything left unflushed by the previous run.
+
+    Transient failures (connection errors, 5xx) leave the batch in place to
+    be retried. Rows the database rejects (4xx: a malformed value, a broken
+    foreign key) would fail every retry and hold up every entry behind them,
+    so they are isolated and moved to "<journal>.dead" instead.
+    """
+
+    def __init__(self, path: str, table: str = "of_chat_message"):
+        self.base_path = path
+        self.table = table
+        self.path: Optional[str] = None
+        self._supabase: Optional[Client] = None
+        self._journal: Optional[TextIO] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._offset = 0
+        self._size = 0
+        self._behind_since: Optional[float] = None
+        self.pending = 0
+        self.appended = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    def start(self, supabase: Client) -> None:
+        """Open and lock a journal file and start the flusher (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._supabase = supabase
+            self._open()
+            self._thread = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+            self._thread.start()
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.base_path) or ".", exist_ok=True)
+        for n in range(WRITE_BEHIND_MAX_JOURNALS):
+            path = self.base_path if n == 0 else f"{self.base_path}.{n}"
+            journal = open(path, "a+", encoding="utf-8")
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                journal.close()
+                continue
+            self.path = path
+            self._journal = journal
+            break
+        else:
+            raise RuntimeError(f"All {WRITE_BEHIND_MAX_JOURNALS} write-behind journals are locked by other processes")
+
+        self._journal.seek(0, os.SEEK_END)
+        if self._journal.tell() > 0:
+            self._journal.seek(self._journal.tell() - 1)
+            if self._journal.read(1) != "\n":
+                # A crash cut the last entry short; end it so the next entry
+                # starts on its own line (the torn one is skipped as corrupt)
+                self._journal.write("\n")
+                self._journal.flush()
+        self._size = os.path.getsize(self.path)
+        self._offset = self._read_offset()
+        if self._offset > self._size:
+            # Crashed between truncating the journal and resetting the offset
+            self._offset = 0
+            self._write_offset(0)
+        # Entries a previous run journaled but never flushed
+        self._journal.seek(self._offset)
+        self.pending = self.replayed = sum(1 for line in self._journal if line.strip())
+        if self.pending:
+            self._behind_since = time.time()
+            print(f"Replaying {self.pending} unflushed entries from {self.path}")
+
+    def _read_offset(self) -> int:
+        try:
+            with open(f"{self.path}.offset", encoding="utf-8") as offset_file:
+                return int(offset_file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, offset: int) -> None:
+        # Write-then-rename so a crash leaves either the old or the new offset
+        temporary = f"{self.path}.offset.tmp"
+        with open(temporary, "w", encoding="utf-8") as offset_file:
+            offset_file.write(str(offset))
+            offset_file.flush()
+            os.fsync(offset_file.fileno())
+        os.replace(temporary, f"{self.path}.offset")
+
+    def append(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Durably journal a row for insertion.
+
+        Args:
+            row: of_chat_message row; an id and created_at are assigned when
+                missing, so ordering reflects when the message was accepted
+
+        Returns:
+            The row as it will be inserted (including its id)
+        """
+        row = {"id": str(uuid.uuid4()), "created_at": datetime.utcnow().isoformat(), **row}
+        line = json.dumps(row, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._journal is None:
+                raise RuntimeError("Write-behind journal is not started")
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._size = self._journal.tell()
+            self.pending += 1
+            self.appended += 1
+            if self._behind_since is None:
+                self._behind_since = time.time()
+        if self.pending >= WRITE_BEHIND_BATCH_SIZE:
+            self._wakeup.set()
+        return row
+
+    def _next_batch(self) -> Tuple[List[Dict[str, Any]], int, int]:
+        """Read up to WRITE_BEHIND_BATCH_SIZE entries after the flushed offset: (rows, end offset, entries read)."""
+        rows = []
+        entries = 0
+        with open(self.path, "rb") as reader:
+            reader.seek(self._offset)
+            end = self._offset
+            while entries < WRITE_BEHIND_BATCH_SIZE:
+                line = reader.readline()
+                # A line without its newline is still being written
+                if not line.endswith(b"\n"):
+                    break
+                end = reader.tell()
+                if line.strip():
+                    entries += 1
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        print(f"Skipping corrupt write-behind journal entry at byte {end - len(line)}")
+        return rows, end, entries
+
+    def flush(self) -> int:
+        """
+        Insert the next batch of journaled entries.
+
+        Returns:
+            Number of entries flushed (0 when the journal is caught up)
+
+        Raises:
+            Exception: If the insert fails with a transient error; the
+                entries stay in the journal
+        """
+        rows, end, entries = self._next_batch()
+        if end == self._offset:
+            return 0
+        started = time.perf_counter()
+        rejected = insert_isolating_rejects(
+            lambda batch: self._supabase.table(self.table).upsert(
+                batch,
+                on_conflict="id",
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal
+            ).execute(),
+            rows
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if rejected:
+            self._dead_letter([(rows[index], error) for index, error in rejected])
+        self._write_offset(end)
+        with self._lock:
+            self._offset = end
+            self.pending = max(0, self.pending - entries)
+            self.flushed += len(rows) - len(rejected)
+            self.dead_lettered += len(rejected)
+            self.batches += 1
+            self.last_flush_ms = elapsed_ms
+            self._flush_ms_total += elapsed_ms
+            if self.pending == 0:
+                self._behind_since = None
+                if self._offset == self._size and self._size > WRITE_BEHIND_COMPACT_BYTES:
+                    self._compact()
+        return entries
+
+    def _dead_letter(self, rejected: List[Tuple[Dict[str, Any], Exception]]) -> None:
+        """Append rejected rows and their errors to the dead-letter file, before the offset moves past them."""
+        with open(f"{self.path}.dead", "a", encoding="utf-8") as dead_letters:
+            for row, error in rejected:
+                print(f"Write-behind entry {row.get('id')} rejected, moved to {self.path}.dead: {str(error)}")
+                dead_letters.write(json.dumps({
+                    "row": row,
+                    "error": str(error),
+                    "rejected_at": datetime.utcnow().isoformat()
+                }, separators=(",", ":")) + "\n")
+            dead_letters.flush()
+            os.fsync(dead_letters.fileno())
+
+    def _compact(self) -> None:
+        # Called with the lock held once every entry has been flushed
+        self._journal.truncate(0)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._write_offset(0)
+        self._offset = self._size = 0
+
+    def _flush_loop(self) -> None:
+        backoff = WRITE_BEHIND_FLUSH_INTERVAL
+        while True:
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+            try:
+                while self.flush():
+                    pass
+                backoff = WRITE_BEHIND_FLUSH_INTERVAL
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                backoff = min(max(backoff, WRITE_BEHIND_FLUSH_INTERVAL) * 2, WRITE_BEHIND_MAX_BACKOFF)
+                print(f"Write-behind flush failed, retrying in {backoff:.1f}s: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, flush latency and journal lag, for the metrics endpoint."""
+        with self._lock:
+            return {
+                "enabled": self.started,
+                "journal": self.path,
+                "queue_depth": self.pending,
+                "journal_bytes": self._size,
+                "lag_bytes": self._size - self._offset,
+                "lag_seconds": round(time.time() - self._behind_since, 3) if self._behind_since else 0.0,
+                "appended": self.appended,
+                "flushed": self.flushed,
+                "replayed": self.replayed,
+                "batches": self.batches,
+                "failures": self.failures,
+                "dead_lettered": self.dead_lettered,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+                "avg_flush_ms": round(self._flush_ms_total / self.batches, 2) if self.batches else 0.0
+            }
+
+
+reply_journal = WriteBehindJournal(WRITE_BEHIND_JOURNAL)